@@ -1,5 +1,8 @@
 from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, List, Literal, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Literal, Optional
+
+if TYPE_CHECKING:
+    from core.step_log import StepLog
 
 TaskStatus = Literal['pending', 'doing', 'done']
 
@@ -10,10 +13,10 @@ class TaskStep:
     status: TaskStatus
     note: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class ReActStep:
     type: Literal['thought', 'action', 'observation']
-    content: str
+    content: str = ''
     toolName: Optional[str] = None
     toolInput: Any = None
     toolOutput: Any = None
@@ -30,6 +33,23 @@ class AgentConfig:
     autoPlanOnStart: bool = True
     autoGenerateFinalAnswer: bool = True
     strictActionUntilDone: bool = True
+    codegenMode: Literal['single', 'per_feature'] = 'single'
+    codegenConcurrency: int = 3
+    scenarioMatchRefine: bool = False
+    stageCache: bool = True
+    ragPrefetch: bool = True
+    stepWindow: int = 24
+    reuseRepeatedActions: bool = True
+    maxStalls: int = 3
+    artifactThreshold: int = 8192
+    timeBudget: Optional[float] = None
+    deadlineReserve: float = 15.0
+    hedging: bool = False
+    hedgeFallbackModel: Optional[str] = None
+    hedgePercentile: float = 0.95
+    hedgeMaxRate: float = 0.1
+    modelRoutes: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    tokenBudget: Optional[int] = None
 
 @dataclass
 class ConversationEvent:
@@ -51,6 +71,8 @@ class StreamEvent:
 @dataclass
 class AgentContext:
     input: str
-    steps: List[ReActStep]
+    steps: 'StepLog'
     tools: Dict[str, Any]
     config: AgentConfig
+    waste: Dict[str, int] = field(default_factory=dict)
+    stalls: int = 0
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from core.llm import BaseChatModel
+from core.usage import estimate_tokens
+
+class LatencyModel:
+    """Seeded delay distribution in seconds: ``constant``, ``uniform``, ``normal`` or ``lognormal``.
+
+    ``mean`` is the median for ``lognormal`` (``spread`` is sigma there); for ``uniform`` and
+    ``normal`` ``spread`` is the half-width / standard deviation. Samples are clamped at zero.
+    """
+
+    def __init__(self, kind: str = 'constant', mean: float = 0.0, spread: float = 0.0, seed: int = 0):
+        if kind not in ('constant', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f'unknown latency distribution "{kind}"')
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, None], seed: int = 0) -> 'LatencyModel':
+        """Builds a model from a number (constant seconds) or a ``kind:mean[:spread]`` spec such as ``lognormal:0.05:0.4``."""
+        if spec is None or spec == '':
+            return cls()
+        if isinstance(spec, (int, float)):
+            return cls('constant', float(spec), seed=seed)
+        kind, *params = str(spec).split(':')
+        if not params:
+            return cls('constant', float(kind), seed=seed)
+        return cls(kind, float(params[0]), float(params[1]) if len(params) > 1 else 0.0, seed=seed)
+
+    def sample(self) -> float:
+        if self.kind == 'constant':
+            value = self.mean
+        elif self.kind == 'uniform':
+            value = self._rng.uniform(self.mean - self.spread, self.mean + self.spread)
+        elif self.kind == 'normal':
+            value = self._rng.gauss(self.mean, self.spread)
+        else:
+            value = self.mean * math.exp(self._rng.gauss(0.0, self.spread)) if self.mean > 0 else 0.0
+        return max(0.0, value)
+
+    def describe(self) -> Dict[str, Any]:
+        return { 'kind': self.kind, 'mean': self.mean, 'spread': self.spread }
+
+# Prompt markers of every LLM call site in the repo, checked in order; anything else is a ReAct reasoning call.
+PROMPT_KINDS: Sequence[Tuple[str, str]] = (
+    ('你是编码规划器', 'coding_plan'),
+    ('你是 BDD 拆解器', 'bdd'),
+    ('Architect Agent', 'architect'),
+    ('Identify the UI components', 'keywords'),
+    ('你是代码生成器', 'codegen'),
+    ('Given BDD scenarios and a list of project file paths', 'scenario_match'),
+    ('你是规划器', 'plan'),
+    ('确认语', 'pre_action'),
+)
+
+def classify(messages: List[Dict[str, Any]]) -> str:
+    last = str((messages[-1] or {}).get('content') or '') if messages else ''
+    if last.startswith('Based on the above reasoning'):
+        return 'final_answer'
+    for message in messages[:2]:
+        content = str(message.get('content') or '')
+        for marker, kind in PROMPT_KINDS:
+            if marker in content:
+                return kind
+    return 'reason'
+
+def _question(messages: List[Dict[str, Any]]) -> str:
+    for message in messages:
+        content = str(message.get('content') or '')
+        if content.startswith('User Question: '):
+            return content
+    return ''
+
+Responder = Union[str, Callable[[List[Dict[str, Any]]], str]]
+
+class ScriptedLLM(BaseChatModel):
+    """Deterministic stand-in for a chat model that replays scripted outputs.
+
+    ``responses`` maps a call kind (see :func:`classify`) to a fixed text or a callable of the
+    messages. ``react_steps`` is the Thought/Action/Input transcript returned for successive
+    reasoning calls of one question; the cursor is kept per ``User Question`` so concurrent sessions
+    with distinct inputs replay independently, and it restarts after the last step.
+
+    ``latency`` is the delay before an ``invoke`` answer or the first ``stream`` chunk;
+    ``inter_token`` the delay between chunks of ``chunk_chars`` characters. The CPU time spent inside
+    the fake itself is accumulated in ``cpu_seconds`` so callers can subtract it.
+    """
+
+    def __init__(self, responses: Optional[Dict[str, Responder]] = None, react_steps: Optional[List[str]] = None, latency: Optional[LatencyModel] = None, inter_token: Optional[LatencyModel] = None, chunk_chars: int = 4, model_name: str = 'scripted'):
+        self.responses = dict(responses or {})
+        self.react_steps = list(react_steps or ['Thought: 已完成\nFinal Answer: 已完成'])
+        self.latency = latency or LatencyModel()
+        self.inter_token = inter_token or LatencyModel()
+        self.chunk_chars = max(1, chunk_chars)
+        self.model_name = model_name
+        self.calls: Dict[str, int] = {}
+        self.cpu_seconds = 0.0
+        self.slept_seconds = 0.0
+        self._cursors: Dict[str, int] = {}
+
+    def respond(self, messages: List[Dict[str, Any]]) -> str:
+        kind = classify(messages)
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        if kind == 'reason':
+            key = _question(messages)
+            index = self._cursors.get(key, 0)
+            step = self.react_steps[min(index, len(self.react_steps) - 1)]
+            if index + 1 >= len(self.react_steps):
+                self._cursors.pop(key, None)
+            else:
+                self._cursors[key] = index + 1
+            return step
+        response = self.responses.get(kind, '好的')
+        return response(messages) if callable(response) else response
+
+    async def _sleep(self, model: LatencyModel) -> None:
+        delay = model.sample()
+        self.slept_seconds += delay
+        await asyncio.sleep(delay)
+
+    def _usage(self, messages: List[Dict[str, Any]], text: str) -> Dict[str, int]:
+        prompt = '\n'.join(str(m.get('content') or '') for m in messages)
+        return { 'inputTokens': estimate_tokens(prompt), 'outputTokens': estimate_tokens(text), 'cachedTokens': 0 }
+
+    async def invoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.process_time()
+        text = self.respond(messages)
+        usage = self._usage(messages, text)
+        self.cpu_seconds += time.process_time() - started
+        await self._sleep(self.latency)
+        return { 'content': text, 'usage': usage }
+
+    async def stream(self, messages: List[Dict[str, Any]]):
+        started = time.process_time()
+        text = self.respond(messages)
+        usage = self._usage(messages, text)
+        self.cpu_seconds += time.process_time() - started
+        await self._sleep(self.latency)
+        for i in range(0, len(text), self.chunk_chars):
+            if i:
+                await self._sleep(self.inter_token)
+            yield { 'content': text[i:i + self.chunk_chars] }
+        yield { 'content': '', 'usage': usage }
+
+def react_step(tool: str, tool_input: Dict[str, Any], thought: str = '需要调用工具获取信息') -> str:
+    return f"Thought: {thought}\nAction: {tool}\nInput: {json.dumps(tool_input, ensure_ascii=False)}"
+
+def final_step(answer: str, thought: str = '信息已足够') -> str:
+    return f"Thought: {thought}\nFinal Answer: {answer}"
+
+def react_transcript(tool_calls: List[Tuple[str, Dict[str, Any]]], answer: str = '任务已完成。') -> List[str]:
+    return [react_step(tool, tool_input) for tool, tool_input in tool_calls] + [final_step(answer)]
+
+def react_llm(tool_calls: List[Tuple[str, Dict[str, Any]]], plan_steps: int = 3, answer: str = '任务已完成。', **kwargs: Any) -> ScriptedLLM:
+    """Fake model for a ReActAgent run: a ``plan_steps`` plan, the given tool calls, then ``answer``."""
+    plan = json.dumps([{ 'title': f'步骤 {i + 1}' } for i in range(plan_steps)], ensure_ascii=False)
+    responses = { 'plan': plan, 'pre_action': '好的，我将开始处理这个任务。', 'final_answer': answer }
+    return ScriptedLLM(responses, react_transcript(tool_calls, answer), **kwargs)
+
+def coding_llm(features: int = 2, scenarios: int = 3, files: int = 6, file_bytes: int = 1200, **kwargs: Any) -> ScriptedLLM:
+    """Fake model for a CodingAgent run: plan, BDD, architecture, keywords and a project of ``files`` files."""
+    bdd = [{ 'feature_id': f'feature_{f + 1}', 'feature_title': f'Feature {f + 1}', 'description': 'Synthetic feature', 'scenarios': [{ 'id': f'scenario_{f + 1}_{s + 1}', 'title': f'Scenario {s + 1} of feature {f + 1}', 'given': ['User opens the page'], 'when': [f'User submits form {s + 1}'], 'then': ['The table shows the result'] } for s in range(scenarios)] } for f in range(features)]
+    architecture = [{ 'path': f'src/components/Feature{i + 1}.tsx', 'type': 'component', 'description': f'Component {i + 1}', 'bdd_references': [f'scenario_1_{(i % scenarios) + 1}'], 'dependencies': [] } for i in range(files)]
+    body = ('export const value = 1;\n' * (file_bytes // 24 + 1))[:file_bytes]
+    project = { 'files': [{ 'path': item['path'], 'content': body } for item in architecture], 'summary': 'Synthetic project' }
+    responses = {
+        'coding_plan': json.dumps({ 'summary': 'plan', 'steps': [{ 'id': 'step_1', 'title': '明确目标与BDD拆解' }, { 'id': 'step_2', 'title': '项目搭建' }, { 'id': 'step_3', 'title': '代码生成' }] }, ensure_ascii=False),
+        'bdd': json.dumps(bdd, ensure_ascii=False),
+        'architect': json.dumps(architecture, ensure_ascii=False),
+        'keywords': 'Button, Table, Form',
+        'codegen': json.dumps(project, ensure_ascii=False),
+        'scenario_match': '[]',
+        'pre_action': '好的，开始生成代码。',
+        'final_answer': '代码已生成。',
+    }
+    steps = [
+        react_step('create_coding_plan', { 'input': 'synthetic requirement' }),
+        react_step('decompose_bdd', { 'requirement': 'synthetic requirement' }),
+        react_step('generate_code_project', { 'bdd': json.dumps(bdd, ensure_ascii=False) }),
+        final_step('代码已生成。'),
+    ]
+    return ScriptedLLM(responses, steps, **kwargs)
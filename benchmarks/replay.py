@@ -0,0 +1,84 @@
+"""Replays recorded sessions (``*.tape.jsonl``, see :mod:`core.recording`) offline.
+
+    python -m benchmarks.replay .recordings/sess_x.tape.jsonl [--speed 0] [--repeat 5] [--profile replay.prof]
+
+Record production sessions with ``RECORD_SESSIONS=true`` (or ``record=true`` on the stream endpoints),
+then profile or benchmark them here without model or RAG access. ``--speed 0`` drops the recorded
+latencies so only framework CPU time remains; ``--speed 1`` reproduces the original timing.
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from core.recording import replay_session
+from benchmarks.run import EventCounter, quiet
+
+async def replay_once(path: str, args: argparse.Namespace) -> Dict[str, Any]:
+    events = EventCounter()
+    live = [s.strip() for s in args.live.split(',') if s.strip()] if args.live is not None else None
+    started = time.perf_counter()
+    cpu = time.process_time()
+    with quiet():
+        results = await replay_session(path, args.speed, live, events)
+    return {
+        'wallMs': (time.perf_counter() - started) * 1000,
+        'cpuMs': (time.process_time() - cpu) * 1000,
+        'runs': len(results),
+        'events': events.count,
+        'used': sum(r['replay']['used'] for r in results),
+        'misses': sum(r['replay']['misses'] for r in results),
+    }
+
+async def replay_all(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for path in args.tapes:
+        samples = [await replay_once(path, args) for _ in range(args.repeat)]
+        last = samples[-1]
+        report[os.path.basename(path)] = {
+            'runs': last['runs'],
+            'events': last['events'],
+            'callsReplayed': last['used'],
+            'misses': last['misses'],
+            'wallMsMedian': round(statistics.median(s['wallMs'] for s in samples), 2),
+            'cpuMsMedian': round(statistics.median(s['cpuMs'] for s in samples), 2),
+        }
+    return report
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tapes', nargs='+', help='recorded session tapes')
+    parser.add_argument('--speed', type=float, default=0.0, help='replay speed factor (1 = original timing, 0 = no waiting)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--live', help="comma-separated kinds or kind:name pairs to execute for real (default: 'tool' for coding runs)")
+    parser.add_argument('--profile', help='write cProfile stats of the replays to this path')
+    parser.add_argument('--output', help='write the report JSON to this path')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    report = asyncio.run(replay_all(args))
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return 1 if any(r['misses'] for r in report.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
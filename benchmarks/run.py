@@ -0,0 +1,337 @@
+"""Deterministic benchmarks of the agent framework overhead, driven by a scripted fake LLM.
+
+    python -m benchmarks.run [--quick] [--only react_iterations,emit] [--output out.json] [--baseline old.json]
+
+Each benchmark returns a flat dict of numbers; the whole run is written as JSON together with the
+git commit so results of different versions can be compared with ``--baseline``.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from core.artifact_store import ArtifactStore
+from core.metrics import metrics_enabled, set_metrics_enabled
+from core.react_agent import ReActAgent
+from benchmarks.fake_llm import LatencyModel, ScriptedLLM, coding_llm, react_llm
+from benchmarks.tools import synthetic_tools, tool_mix
+
+@contextlib.contextmanager
+def quiet():
+    """Agents print their config on construction; keep that out of the benchmark output."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))]
+
+def react_agent(llm: ScriptedLLM, iterations: int, artifacts: ArtifactStore, io_latency: Optional[LatencyModel] = None) -> ReActAgent:
+    with quiet():
+        agent = ReActAgent({ 'streamOutput': True, 'maxIterations': iterations + 2, 'language': 'chinese' }, llm=llm, artifact_store=artifacts)
+    agent.get_tool_registry().register_tools(synthetic_tools(io_latency))
+    return agent
+
+def plan_steps(iterations: int) -> int:
+    # strictActionUntilDone blocks the final answer until every plan step is done; one tool call completes one step.
+    return max(1, min(3, iterations))
+
+class EventCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, event: Any) -> None:
+        self.count += 1
+
+async def bench_react_iterations(args: argparse.Namespace, artifacts: ArtifactStore) -> Dict[str, Any]:
+    """Sequential sessions with an instant LLM: pure framework cost per ReAct iteration."""
+    llm = react_llm(tool_mix(args.iterations), plan_steps(args.iterations))
+    await react_agent(llm, args.iterations, artifacts).run_with_session('warmup', { 'onStream': EventCounter() })
+    llm.calls.clear()
+    llm.cpu_seconds = 0.0
+    events = EventCounter()
+    construct = 0.0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(args.sessions):
+        started = time.perf_counter()
+        agent = react_agent(llm, args.iterations, artifacts)
+        construct += time.perf_counter() - started
+        await agent.run_with_session(f'benchmark task {i}', { 'onStream': events })
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start - llm.cpu_seconds
+    iterations = llm.calls.get('reason', 0)
+    return {
+        'sessions': args.sessions,
+        'iterations': iterations,
+        'iterationsPerSec': iterations / wall,
+        'wallPerIterationMs': wall * 1000 / iterations,
+        'cpuPerIterationMs': cpu * 1000 / iterations,
+        'agentConstructMs': construct * 1000 / args.sessions,
+        'eventsPerIteration': events.count / iterations,
+        'llmCallsPerSession': sum(llm.calls.values()) / args.sessions,
+    }
+
+async def bench_react_concurrent(args: argparse.Namespace, artifacts: ArtifactStore) -> Dict[str, Any]:
+    """Concurrent sessions against a slow LLM: throughput and overhead on top of the LLM's own latency."""
+    llm = react_llm(tool_mix(args.iterations, ['echo', 'hash', 'echo']), plan_steps(args.iterations), latency=LatencyModel.parse(args.latency, seed=1), inter_token=LatencyModel.parse(args.inter_token, seed=2), chunk_chars=args.chunk_chars)
+    events = EventCounter()
+    durations: List[float] = []
+
+    async def session(i: int) -> None:
+        agent = react_agent(llm, args.iterations, artifacts)
+        started = time.perf_counter()
+        await agent.run_with_session(f'concurrent task {i}', { 'onStream': events })
+        durations.append(time.perf_counter() - started)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(args.concurrency)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start - llm.cpu_seconds
+    iterations = llm.calls.get('reason', 0)
+    llm_per_session = llm.slept_seconds / args.concurrency
+    return {
+        'concurrency': args.concurrency,
+        'latency': LatencyModel.parse(args.latency).describe(),
+        'interToken': LatencyModel.parse(args.inter_token).describe(),
+        'iterations': iterations,
+        'iterationsPerSec': iterations / wall,
+        'sessionP50Ms': percentile(durations, 0.5) * 1000,
+        'sessionP95Ms': percentile(durations, 0.95) * 1000,
+        'llmWaitPerSessionMs': llm_per_session * 1000,
+        'overheadPerIterationMs': (statistics.mean(durations) - llm_per_session) * 1000 / (iterations / args.concurrency),
+        'cpuPerIterationMs': cpu * 1000 / iterations,
+        'eventsPerSec': events.count / wall,
+    }
+
+async def long_session_kb(args: argparse.Namespace, artifacts: ArtifactStore) -> float:
+    """Traced memory held by one paused session after ``8 * iterations`` tool calls (its context and step log)."""
+    # Distinct inputs per call, so repeated-action reuse does not cut the session short.
+    calls = [(name, { **tool_input, 'n': i }) for i, (name, tool_input) in enumerate(tool_mix(args.iterations * 8))]
+    calls.append(('wait_for_user_input', { 'reason': 'benchmark', 'message': '继续？' }))
+    agent = react_agent(react_llm(calls, plan_steps(args.iterations)), len(calls), artifacts)
+    await agent.run_with_session('long session', { 'sessionId': f'bench_long_{os.getpid()}', 'onStream': EventCounter() })
+    gc.collect()
+    with_session, _ = tracemalloc.get_traced_memory()
+    agent.session_states.clear()
+    gc.collect()
+    without, _ = tracemalloc.get_traced_memory()
+    return (with_session - without) / 1024
+
+async def bench_session_memory(args: argparse.Namespace, artifacts: ArtifactStore) -> Dict[str, Any]:
+    """Traced memory per in-flight session (peak), per finished session (retained) and held by a long paused session."""
+    llm = react_llm(tool_mix(args.iterations), plan_steps(args.iterations), latency=LatencyModel('constant', 0.005))
+    events = EventCounter()
+    gc.collect()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        agents = [react_agent(llm, args.iterations, artifacts) for _ in range(args.concurrency)]
+        await asyncio.gather(*(agent.run_with_session(f'memory task {i}', { 'onStream': events }) for i, agent in enumerate(agents)))
+        with_agents, peak = tracemalloc.get_traced_memory()
+        del agents
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+        long_session = await long_session_kb(args, artifacts)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return {
+        'sessions': args.concurrency,
+        'peakPerSessionKb': (peak - base) / 1024 / args.concurrency,
+        'agentPerSessionKb': (with_agents - base) / 1024 / args.concurrency,
+        'retainedPerSessionKb': (retained - base) / 1024 / args.concurrency,
+        'longSessionKb': long_session,
+    }
+
+async def bench_emit(args: argparse.Namespace, artifacts: ArtifactStore) -> Dict[str, Any]:
+    """Cost of ``ReActAgent.emit`` per event, alone and with the SSE endpoints' JSON serialization."""
+    agent = react_agent(ScriptedLLM(), 1, artifacts)
+    sink = EventCounter()
+    def serialize(e: Any) -> None:
+        json.dumps({ 'sessionId': e.sessionId, 'conversationId': e.conversationId, 'event': e.event, 'timestamp': e.timestamp })
+    tool_payload = { 'id': 'tool_1', 'status': 'end', 'tool_name': 'echo', 'args': { 'text': 'hello' }, 'result': { 'success': True, 'result': { 'rows': list(range(50)) } }, 'success': True, 'durationMs': 3, 'iteration': 1 }
+    cases: Dict[str, Callable[[Callable[[Any], None]], None]] = {
+        'token': lambda on_stream: agent.emit('normal', { 'content': '字', 'stream': True }, 'sess', 'conv', 'final_answer_conv', on_stream),
+        'toolCall': lambda on_stream: agent.emit('tool_call', tool_payload, 'sess', 'conv', 'tool_1_conv', on_stream),
+    }
+    out: Dict[str, Any] = { 'events': args.events }
+    for name, emit in cases.items():
+        for suffix, on_stream in (('', sink), ('Serialized', serialize)):
+            emit(on_stream)
+            started = time.perf_counter()
+            for _ in range(args.events):
+                emit(on_stream)
+            out[f'{name}{suffix}Us'] = (time.perf_counter() - started) * 1e6 / args.events
+    return out
+
+async def bench_coding(args: argparse.Namespace, artifacts: ArtifactStore) -> Dict[str, Any]:
+    """Full CodingAgent pipeline with an instant LLM and an unreachable RAG service, per generation mode."""
+    from coder_agent.core.checkpoint import CheckpointStore
+    from coder_agent.core.coding_agent import CodingAgent
+    from coder_agent.core.stage_cache import StageCache
+    out: Dict[str, Any] = { 'runs': args.coding_runs }
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        for mode in ('single', 'per_feature'):
+            llm = coding_llm(features=args.features, files=args.files)
+            async def run(session_id: str, on_stream: EventCounter) -> Dict[str, Any]:
+                with quiet():
+                    agent = CodingAgent({ 'streamOutput': True, 'language': 'chinese', 'maxIterations': 10, 'autoPlanOnStart': False, 'codegenMode': mode, 'stageCache': False }, cache=StageCache(max_entries=0), checkpoints=CheckpointStore(checkpoint_dir), llm=llm)
+                    return await agent.run('synthetic requirement', { 'sessionId': session_id, 'onStream': on_stream })
+            await run(f'bench_coding_{mode}_warmup', EventCounter())
+            llm.calls.clear()
+            llm.cpu_seconds = 0.0
+            events = EventCounter()
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            for i in range(args.coding_runs):
+                result = await run(f'bench_coding_{mode}_{i}', events)
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start - llm.cpu_seconds
+            files = result['finalAnswer'].get('files') or []
+            out[mode] = {
+                'wallPerRunMs': wall * 1000 / args.coding_runs,
+                'cpuPerRunMs': cpu * 1000 / args.coding_runs,
+                'llmCallsPerRun': sum(llm.calls.values()) / args.coding_runs,
+                'eventsPerRun': events.count / args.coding_runs,
+                'files': len(files),
+            }
+    return out
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace, ArtifactStore], Any]] = {
+    'react_iterations': bench_react_iterations,
+    'react_concurrent': bench_react_concurrent,
+    'session_memory': bench_session_memory,
+    'emit': bench_emit,
+    'coding': bench_coding,
+}
+
+# Metrics where a larger value is an improvement; everything else is a cost.
+HIGHER_IS_BETTER = ('PerSec',)
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Prints relative changes against ``baseline`` and returns the metrics that regressed by more than ``threshold``."""
+    now, before = flatten(current['results']), flatten(baseline['results'])
+    regressions: List[str] = []
+    print(f"\nvs baseline {baseline.get('git', {}).get('commit', '?')} ({baseline.get('createdAt', '?')}):")
+    for name in sorted(set(now) & set(before)):
+        if not before[name]:
+            continue
+        change = (now[name] - before[name]) / abs(before[name])
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = ''
+        if worse > threshold and (name.endswith(('Ms', 'Us', 'Kb')) or name.endswith(HIGHER_IS_BETTER)):
+            flag = '  <-- regression'
+            regressions.append(name)
+        print(f'  {name:55s} {before[name]:12.3f} -> {now[name]:12.3f}  {change:+7.1%}{flag}')
+    return regressions
+
+def git_info() -> Dict[str, Any]:
+    def git(*cmd: str) -> str:
+        try:
+            return subprocess.run(['git', *cmd], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ''
+    return { 'commit': git('rev-parse', '--short', 'HEAD') or None, 'dirty': bool(git('status', '--porcelain', '--untracked-files=no')) }
+
+async def run_all(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ['RAG_BASE_URL'] = args.rag_url
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(BENCHMARKS)
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        artifacts = ArtifactStore(directory=artifact_dir)
+        for name in names:
+            if name not in BENCHMARKS:
+                raise SystemExit(f'unknown benchmark "{name}"; available: {", ".join(BENCHMARKS)}')
+            started = time.perf_counter()
+            results[name] = await BENCHMARKS[name](args, artifacts)
+            print(f'{name}: {json.dumps(results[name], ensure_ascii=False)} ({time.perf_counter() - started:.1f}s)')
+    return results
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--quick', action='store_true', help='small sizes for a smoke run')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=8, help='tool calls per ReAct session')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', default='lognormal:0.05:0.5', help='LLM latency (seconds): number or kind:mean[:spread]')
+    parser.add_argument('--inter-token', default='constant:0.002', help='delay between streamed chunks (seconds)')
+    parser.add_argument('--chunk-chars', type=int, default=4)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--coding-runs', type=int, default=5)
+    parser.add_argument('--features', type=int, default=3)
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--rag-url', default='http://127.0.0.1:9', help='RAG service used by the coding benchmark (default: unreachable)')
+    parser.add_argument('--no-metrics', action='store_true', help='disable Prometheus instrumentation while benchmarking')
+    parser.add_argument('--output', help='result JSON path (default: benchmarks/results/<commit>_<time>.json)')
+    parser.add_argument('--baseline', help='earlier result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sessions, args.iterations, args.concurrency, args.events, args.coding_runs = 5, 4, 10, 2000, 1
+    return args
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.no_metrics:
+        set_metrics_enabled(False)
+    results = asyncio.run(run_all(args))
+    git = git_info()
+    report = {
+        'schema': 1,
+        'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git': git,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpuCount': os.cpu_count(),
+        'metricsEnabled': metrics_enabled(),
+        'args': { k: v for k, v in vars(args).items() if k not in ('output', 'baseline') },
+        'results': results,
+    }
+    output = args.output or os.path.join(REPO_ROOT, 'benchmarks', 'results', f"{git['commit'] or 'nogit'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'\nwrote {output}')
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
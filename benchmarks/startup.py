@@ -0,0 +1,67 @@
+"""Cold-start check: import time of the serving modules and heavy packages pulled in at import.
+
+    python -m benchmarks.startup [--budget-ms 800] [--modules server,core.react_agent] [--runs 3]
+
+Each module is imported in a fresh interpreter (``python -X importtime``); the median cumulative time is
+compared with the budget and the slowest imports are listed. Provider SDKs (``langchain_*``) must not be
+imported until a model of that provider is used, so their presence after import fails the check too.
+Exits non-zero when a module is over budget or imports a provider eagerly.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EAGER_FORBIDDEN = ('langchain_openai', 'langchain_community', 'langchain_core', 'openai', 'dashscope')
+
+def import_profile(module: str) -> Tuple[float, List[Tuple[float, str]], List[str]]:
+    """Returns (total ms, [(self ms, name)], forbidden packages loaded) for importing ``module`` cold."""
+    code = f"import sys, json; import {module}; print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}})))"
+    env = { **os.environ, 'PYTHONPATH': REPO_ROOT, 'PREWARM_AGENT': 'false' }
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    rows: List[Tuple[float, str]] = []
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append((int(self_us) / 1000, name.strip()))
+        if name == module:
+            total = int(cumulative_us) / 1000
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return total, sorted(rows, reverse=True), [m for m in EAGER_FORBIDDEN if m in loaded]
+
+def check(modules: List[str], budget_ms: float, runs: int, top: int) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for module in modules:
+        samples = [import_profile(module) for _ in range(runs)]
+        median = statistics.median(s[0] for s in samples)
+        report[module] = {
+            'importMs': round(median, 1),
+            'budgetMs': budget_ms,
+            'overBudget': median > budget_ms,
+            'eagerProviders': samples[-1][2],
+            'slowest': [{ 'module': name, 'selfMs': round(ms, 1) } for ms, name in samples[-1][1][:top]],
+        }
+    return report
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modules', default='server,core.react_agent,coder_agent.core.coding_agent')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_BUDGET_MS') or '800'))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8, help='slowest imports to list per module')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = check([m.strip() for m in args.modules.split(',') if m.strip()], args.budget_ms, args.runs, args.top)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if any(r['overBudget'] or r['eagerProviders'] for r in report.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
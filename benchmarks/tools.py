@@ -0,0 +1,53 @@
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_llm import LatencyModel
+
+def synthetic_tools(io_latency: Optional[LatencyModel] = None, cpu_rounds: int = 200, large_bytes: int = 32 * 1024) -> List[Dict[str, Any]]:
+    """Tool definitions in ``ToolRegistry`` format that stand in for real tools.
+
+    - ``echo``: synchronous, returns its input.
+    - ``fetch``: async, sleeps ``io_latency`` like a network call.
+    - ``hash``: CPU-bound, ``cpu_rounds`` rounds of SHA-256.
+    - ``large``: returns a ``large_bytes`` result, which takes the artifact path of the agent.
+
+    All but ``fetch`` are pure and registered ``'idempotent'``, so repeated calls may be answered locally.
+    """
+    io_latency = io_latency or LatencyModel()
+
+    def echo(tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        return { 'echo': tool_input.get('text', '') }
+
+    async def fetch(tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(io_latency.sample())
+        return { 'url': tool_input.get('url'), 'status': 200, 'body': 'ok' }
+
+    def hash_tool(tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        digest = str(tool_input.get('text', '')).encode('utf-8')
+        for _ in range(cpu_rounds):
+            digest = hashlib.sha256(digest).digest()
+        return { 'digest': digest.hex() }
+
+    def large(tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        rows = max(1, large_bytes // 64)
+        return { 'rows': [{ 'id': i, 'name': f'row-{i:06d}', 'value': i * 7 } for i in range(rows)], 'planUpdate': None }
+
+    return [
+        { 'name': 'echo', 'description': 'Returns its input.', 'parameters': [ { 'name': 'text', 'type': 'string', 'description': 'Text to echo', 'required': True } ], 'execute': echo, 'idempotent': True },
+        { 'name': 'fetch', 'description': 'Fetches a URL.', 'parameters': [ { 'name': 'url', 'type': 'string', 'description': 'URL', 'required': True } ], 'execute': fetch },
+        { 'name': 'hash', 'description': 'Hashes text repeatedly.', 'parameters': [ { 'name': 'text', 'type': 'string', 'description': 'Text to hash', 'required': True } ], 'execute': hash_tool, 'idempotent': True },
+        { 'name': 'large', 'description': 'Returns a large table.', 'parameters': [], 'execute': large, 'idempotent': True },
+    ]
+
+TOOL_INPUTS: Dict[str, Dict[str, Any]] = {
+    'echo': { 'text': 'hello' },
+    'fetch': { 'url': 'https://example.invalid/data' },
+    'hash': { 'text': 'benchmark' },
+    'large': {},
+}
+
+def tool_mix(iterations: int, mix: Optional[List[str]] = None) -> List[Any]:
+    """``iterations`` tool calls cycling through ``mix`` (default: echo, fetch, hash, echo, large)."""
+    mix = mix or ['echo', 'fetch', 'hash', 'echo', 'large']
+    return [(mix[i % len(mix)], TOOL_INPUTS[mix[i % len(mix)]]) for i in range(iterations)]
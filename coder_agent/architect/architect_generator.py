@@ -1,82 +1,135 @@
 import json
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 from core.llm import BaseChatModel
+from core.stream_manager import StreamEvent
+from core.json_repair import parse_llm_json, validate_schema, JsonRepairError
+from core.cancellation import budget_below
 from aitypes import AgentConfig
-from core.react_agent import ReActAgent
 from coder_agent.config.prompt import CODING_AGENT_PROMPTS
 
+RETRY_MIN_BUDGET = 90.0
+ARCHITECTURE_FILE_TYPES = ('component', 'service', 'config', 'util', 'test', 'route')
+ARCHITECTURE_TYPE_ALIASES = {
+    'page': 'component', 'pages': 'component', 'view': 'component', 'layout': 'component', 'components': 'component',
+    'services': 'service', 'api': 'service', 'store': 'service',
+    'hook': 'util', 'hooks': 'util', 'utils': 'util', 'type': 'util', 'types': 'util', 'model': 'util',
+    'style': 'config', 'styles': 'config', 'configs': 'config',
+    'tests': 'test', 'spec': 'test',
+    'routes': 'route', 'router': 'route', 'routing': 'route',
+}
+ARCHITECTURE_SCHEMA = {
+    'type': 'array',
+    'minItems': 1,
+    'items': {
+        'type': 'object',
+        'required': ['path', 'type'],
+        'properties': {
+            'path': { 'type': 'string' },
+            'type': { 'enum': list(ARCHITECTURE_FILE_TYPES) },
+            'description': { 'type': 'string' },
+            'bdd_references': { 'type': 'array', 'items': { 'type': 'string' } },
+            'dependencies': { 'type': 'array', 'items': { 'type': 'object', 'required': ['path'] } },
+        },
+    },
+}
+
 class ArchitectGenerator:
-    def __init__(self, llm: BaseChatModel, config: AgentConfig):
+    def __init__(self, llm: BaseChatModel, config: AgentConfig, max_attempts: int = 3):
         self.llm = llm
         self.config = config
+        self.max_attempts = max(1, max_attempts)
+        self.last_valid = False
+
+    def _gen_id(self, prefix: str) -> str:
+        import random
+        return f"{prefix}_{int(time.time()*1000)}_{format(random.randint(0, 36**6-1), 'x')}"
+
+    def _emit_tool_call(self, options: Dict[str, Any], payload: Dict[str, Any]) -> None:
+        on_stream = options.get('onStream')
+        if not on_stream:
+            return
+        on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': payload['id'], 'role': 'assistant', 'type': 'tool_call_event', 'data': payload }, timestamp=int(time.time()*1000)))
+
+    def _repair_architecture(self, data: Any) -> Any:
+        if isinstance(data, dict):
+            for key in ('files', 'architecture', 'structure', 'project'):
+                if isinstance(data.get(key), list):
+                    data = data[key]
+                    break
+        if not isinstance(data, list):
+            return data
+        repaired: List[Any] = []
+        seen = set()
+        for item in data:
+            if not isinstance(item, dict):
+                repaired.append(item)
+                continue
+            entry = dict(item)
+            path = entry.get('path')
+            if isinstance(path, str):
+                path = path.strip()
+                entry['path'] = path[2:] if path.startswith('./') else path
+                if entry['path'] in seen:
+                    continue
+                seen.add(entry['path'])
+            t = str(entry.get('type') or '').strip().lower()
+            entry['type'] = ARCHITECTURE_TYPE_ALIASES.get(t, t)
+            entry['description'] = entry.get('description') if isinstance(entry.get('description'), str) else ''
+            refs = entry.get('bdd_references')
+            entry['bdd_references'] = [str(r) for r in refs] if isinstance(refs, list) else ([refs] if isinstance(refs, str) and refs else [])
+            entry['status'] = 'pending_generation'
+            deps = entry.get('dependencies')
+            fixed_deps = []
+            for d in (deps if isinstance(deps, list) else []):
+                if isinstance(d, str):
+                    fixed_deps.append({ 'path': d, 'import': [] })
+                elif isinstance(d, dict) and d.get('path'):
+                    imports = d.get('import')
+                    fixed_deps.append({ 'path': str(d.get('path')), 'import': [str(x) for x in imports] if isinstance(imports, list) else ([str(imports)] if imports else []) })
+            entry['dependencies'] = fixed_deps
+            entry.setdefault('rag_context_used', None)
+            entry.setdefault('content', None)
+            repaired.append(entry)
+        return repaired
+
+    def _parse_and_validate(self, raw: str) -> Tuple[Any, Optional[str]]:
+        try:
+            data = parse_llm_json(raw, site='architect')
+        except JsonRepairError as e:
+            return None, f"未找到可解析的 JSON：{str(e)}"
+        data = self._repair_architecture(data)
+        return data, validate_schema(data, ARCHITECTURE_SCHEMA)
 
     async def generate(self, bdd: str, options: Optional[Dict[str, Any]] = None) -> str:
         options = options or {}
-        async def create_architecture(tool_input: str) -> str:
-            sys_prompt = CODING_AGENT_PROMPTS['ARCHITECT_GENERATOR_PROMPT']
-            user_prompt = f"\n**User Prompt (用户输入)**\n任务：项目架构设计\n请分析以下 BDD 规范，并输出项目架构 JSON 结构。\n**BDD 规范：**\n{tool_input}\n"
-            messages = [ { 'role': 'system', 'content': sys_prompt }, { 'role': 'user', 'content': user_prompt } ]
+        sys_prompt = CODING_AGENT_PROMPTS['ARCHITECT_GENERATOR_PROMPT']
+        user_prompt = f"\n**User Prompt (用户输入)**\n任务：项目架构设计\n请分析以下 BDD 规范，并输出项目架构 JSON 结构。\n**BDD 规范：**\n{bdd}\n"
+        messages = [ { 'role': 'system', 'content': sys_prompt }, { 'role': 'user', 'content': user_prompt } ]
+        options.get('onLog') and options['onLog']('ArchitectAgent: 开始生成项目架构')
+        last_text = ''
+        for attempt in range(1, self.max_attempts + 1):
+            tool_id = self._gen_id('tool_architecture')
+            started_at = int(time.time()*1000)
+            self._emit_tool_call(options, { 'id': tool_id, 'status': 'start', 'tool_name': 'create_project_architecture', 'args': { 'attempt': attempt }, 'iteration': attempt - 1, 'startedAt': started_at })
             resp = await self.llm.invoke(messages)
             raw = resp.get('content') or ''
-            import re
-            m = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", raw)
-            s = m.group(1) if m else raw
-            t = (s or '').strip()
-            try:
-                parsed = json.loads(t)
-                return json.dumps(parsed, ensure_ascii=False)
-            except Exception:
-                return t if t else '[]'
-
-        agent = ReActAgent({ 'model': self.config.model, 'temperature': self.config.temperature, 'streamOutput': True, 'language': self.config.language, 'maxTokens': self.config.maxTokens, 'maxIterations': self.config.maxIterations, 'pauseAfterEachStep': False, 'autoPlanOnStart': False })
-        async def is_valid_json_exec(inp: Dict[str, Any]) -> Dict[str, Any]:
-            try:
-                json.loads(inp.get('input') or '')
-                return { 'content': 'true' }
-            except Exception:
-                return { 'content': 'false' }
-        async def create_project_architecture_exec(inp: Dict[str, Any]) -> Dict[str, Any]:
-            content = await create_architecture(inp.get('input') or bdd)
-            return content
-        agent.getToolRegistry().registerTools([
-            { 'name': 'is_valid_json', 'description': '检查输入是否为有效 JSON 格式', 'parameters': [ { 'name': 'input', 'type': 'string', 'description': '要检查的 JSON 字符串', 'required': True } ], 'execute': is_valid_json_exec },
-            { 'name': 'create_project_architecture', 'description': '创建项目的代码架构设计', 'parameters': [ { 'name': 'input', 'type': 'string', 'description': '用户需求BDD内容', 'required': True } ], 'execute': create_project_architecture_exec },
-        ])
-        prompt = (
-            f"\n** 任务描述 **\n"
-            f"根据BDD需求，创建前端项目架构，并在生成后验证该架构 JSON 的有效性。\n"
-            f"请严格按以下步骤执行：\n"
-            f"1) 使用工具 create_project_architecture 先生成项目架构 JSON 字符串；\n"
-            f"2) 立刻使用工具 is_valid_json 验证第1步生成的架构 JSON（参数 input 传入第1步的完整 JSON 字符串）；\n"
-            f"3) 若校验为 false，请重新生成架构并再次验证，直到返回 true；\n"
-            f"4) 最终仅输出有效的项目架构 JSON（不包含任何描述或 Markdown）。\n\n"
-            f"** BDD需求 **\n{bdd}\n\n"
-        )
-        options.get('onLog') and options['onLog']('ArchitectAgent: 开始生成项目架构')
-        result = await agent.run_with_session(prompt, { 'onStream': options.get('onStream') })
-        options.get('onLog') and options['onLog']('ArchitectAgent: 完成生成')
-        fa = (result.get('finalAnswer') or '').strip()
-        if fa:
-            try:
-                parsed = json.loads(fa)
+            architecture, error = self._parse_and_validate(raw)
+            last_text = (json.dumps(architecture, ensure_ascii=False) if architecture is not None else raw.strip()) or last_text
+            finished_at = int(time.time()*1000)
+            self._emit_tool_call(options, { 'id': tool_id, 'status': 'end', 'tool_name': 'create_project_architecture', 'args': { 'attempt': attempt }, 'result': { 'valid': error is None, 'error': error, 'files': len(architecture) if isinstance(architecture, list) else 0 }, 'success': error is None, 'iteration': attempt - 1, 'startedAt': started_at, 'finishedAt': finished_at, 'durationMs': finished_at - started_at })
+            self.last_valid = error is None
+            if error is None:
+                options.get('onLog') and options['onLog']('ArchitectAgent: 完成生成')
                 options.get('onLog') and options['onLog']('ArchitectAgent: 架构JSON有效')
-                return json.dumps(parsed, ensure_ascii=False)
-            except Exception:
-                options.get('onLog') and options['onLog']('ArchitectAgent: 架构JSON无效，尝试兜底')
-                alt = await create_architecture(bdd)
-                try:
-                    parsed = json.loads(alt)
-                    options.get('onLog') and options['onLog']('ArchitectAgent: 兜底架构JSON有效')
-                    return json.dumps(parsed, ensure_ascii=False)
-                except Exception:
-                    options.get('onLog') and options['onLog']('ArchitectAgent: 兜底架构仍非有效JSON，原样返回')
-                    return alt
-        options.get('onLog') and options['onLog']('ArchitectAgent: LLM最终答案为空，切换直接聊天兜底')
-        alt = await create_architecture(bdd)
-        try:
-            parsed = json.loads(alt)
-            options.get('onLog') and options['onLog']('ArchitectAgent: 兜底架构JSON有效')
-            return json.dumps(parsed, ensure_ascii=False)
-        except Exception:
-            options.get('onLog') and options['onLog']('ArchitectAgent: 兜底架构仍非有效JSON，原样返回')
-            return alt
+                return json.dumps(architecture, ensure_ascii=False)
+            options.get('onLog') and options['onLog'](f"ArchitectAgent: 第{attempt}次生成的架构未通过校验：{error}")
+            if budget_below(RETRY_MIN_BUDGET):
+                options.get('onLog') and options['onLog']('ArchitectAgent: 剩余时间不足，不再重试')
+                break
+            messages = messages[:2] + [
+                { 'role': 'assistant', 'content': raw },
+                { 'role': 'user', 'content': f"上一次输出未通过校验：{error}\n请修正该问题，并仅输出完整的项目架构 JSON 数组（不包含任何描述或 Markdown）。" },
+            ]
+        options.get('onLog') and options['onLog']('ArchitectAgent: 多次生成仍非有效架构JSON，原样返回')
+        return last_text or '[]'
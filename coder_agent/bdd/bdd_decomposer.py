@@ -1,30 +1,64 @@
-import json
+from typing import Any, AsyncIterator, Dict, List
 from core.llm import BaseChatModel
+from core.json_repair import parse_llm_json, JsonRepairError
+from core.json_stream import JsonItemStream
+from core.event_channel import flow_control
+from coder_agent.core.stage_cache import Fallback, is_fallback
 from coder_agent.config.prompt import CODING_AGENT_PROMPTS
 
+def looks_like_feature(item: Any) -> bool:
+    return isinstance(item, dict) and ('scenarios' in item or 'feature_id' in item or 'feature_title' in item)
+
 class BDDDecomposer:
     def __init__(self, llm: BaseChatModel):
         self.llm = llm
 
-    async def decompose(self, requirement: str):
+    def _messages(self, requirement: str) -> List[Dict[str, Any]]:
         prompt = CODING_AGENT_PROMPTS['BDD_DECOMPOSER_PROMPT'].replace('{requirement}', requirement)
-        messages = [
+        return [
             { 'role': 'system', 'content': CODING_AGENT_PROMPTS['SYSTEM_PERSONA'] },
             { 'role': 'user', 'content': prompt }
         ]
-        resp = await self.llm.invoke(messages)
-        content = resp.get('content') or ''
+
+    async def decompose(self, requirement: str):
+        resp = await self.llm.invoke(self._messages(requirement))
+        return self._to_features(resp.get('content') or '')
+
+    async def decompose_stream(self, requirement: str) -> AsyncIterator[Dict[str, Any]]:
+        """Streams the decomposition and yields each feature as soon as its closing brace arrives.
+
+        A reply that is a bare scenario array (or that streams no complete feature) is parsed as a whole
+        at the end, exactly like :meth:`decompose`; features the incremental parse missed (e.g. a
+        truncated last one recovered by JSON repair) are yielded then as well.
+        """
+        parser = JsonItemStream(())
+        parts: List[str] = []
+        yielded = 0
+        async for chunk in self.llm.stream(self._messages(requirement)):
+            await flow_control()
+            piece = chunk.get('content') or ''
+            if not piece:
+                continue
+            parts.append(piece)
+            for item in parser.feed(piece):
+                if not looks_like_feature(item):
+                    continue
+                yielded += 1
+                yield item
+        features = self._to_features(''.join(parts))
+        if yielded and is_fallback(features):
+            return
+        for feature in features[yielded:]:
+            yield feature
+
+    def _to_features(self, content: str) -> List[Dict[str, Any]]:
         try:
-            import re
-            m = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", content)
-            s = m.group(1) if m else content
-            arr = json.loads(s)
+            arr = parse_llm_json(content, expect='array', site='bdd')
             if isinstance(arr, list):
-                looks_like_feature = (len(arr) == 0) or (isinstance(arr[0], dict) and ('scenarios' in arr[0] or 'feature_id' in arr[0] or 'feature_title' in arr[0]))
-                if looks_like_feature:
+                if len(arr) == 0 or looks_like_feature(arr[0]):
                     return arr
                 scenarios = arr
                 return [ { 'feature_id': 'feature_1', 'feature_title': 'General', 'description': '', 'scenarios': scenarios } ]
             return []
-        except Exception:
-            return [ { 'feature_id': 'feature_1', 'feature_title': 'General', 'description': '', 'scenarios': [ { 'id': 'scenario_1', 'title': 'Fallback scenario', 'given': ['User opens the page'], 'when': ['User enters valid input'], 'then': ['Expected UI updates occur'] } ] } ]
+        except JsonRepairError:
+            return [ Fallback({ 'feature_id': 'feature_1', 'feature_title': 'General', 'description': '', 'scenarios': [ { 'id': 'scenario_1', 'title': 'Fallback scenario', 'given': ['User opens the page'], 'when': ['User enters valid input'], 'then': ['Expected UI updates occur'] } ] }) ]
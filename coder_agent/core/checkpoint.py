@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+CODING_STAGES = ['create_coding_plan', 'decompose_bdd', 'generate_code_project']
+
+def input_hash(text: str) -> str:
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def bdd_hash(bdd: Any) -> str:
+    """Hash of a BDD tool input that ignores whitespace, key order and escaping of the JSON text."""
+    try:
+        value = json.loads(bdd) if isinstance(bdd, str) else bdd
+        return input_hash(json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return input_hash(str(bdd or ''))
+
+class CheckpointStore:
+    """Persists per-session coding run progress as one JSON file per ``sessionId``.
+
+    A checkpoint holds the completed tool results (``stages``) and the generation sub-stages
+    (architecture, RAG context, per-feature results) so an interrupted run can resume from the last
+    completed step. The agent deletes it once the run has generated its project; checkpoints of runs
+    that were abandoned are removed once untouched for ``ttl`` seconds (swept on start and then at
+    most once per ``SWEEP_INTERVAL``).
+    """
+
+    SWEEP_INTERVAL = 3600
+
+    def __init__(self, directory: Optional[str] = None, ttl: Optional[float] = None):
+        self.directory = directory or os.environ.get('CODER_CHECKPOINT_DIR') or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.checkpoints')
+        self.ttl = ttl if ttl is not None else float(os.environ.get('CODER_CHECKPOINT_TTL') or 7 * 86400)
+        self._swept_at = 0.0
+        self._remove_stale_files()
+
+    def _remove_stale_files(self) -> None:
+        self._swept_at = time.time()
+        cutoff = self._swept_at - self.ttl
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if e.name.endswith('.json') and e.stat().st_mtime < cutoff:
+                        os.remove(e.path)
+        except OSError:
+            pass
+
+    def _path(self, session_id: str) -> str:
+        safe = re.sub(r'[^A-Za-z0-9_.-]', '_', session_id)[:128]
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def load(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not session_id:
+            return None
+        try:
+            with open(self._path(session_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def dumps(self, checkpoint: Dict[str, Any]) -> str:
+        checkpoint['updatedAt'] = int(time.time()*1000)
+        return json.dumps(checkpoint, ensure_ascii=False)
+
+    def write(self, session_id: str, text: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(session_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def save(self, session_id: Optional[str], checkpoint: Dict[str, Any]) -> None:
+        if not session_id:
+            return
+        self.write(session_id, self.dumps(checkpoint))
+
+    def delete(self, session_id: Optional[str]) -> bool:
+        if not session_id:
+            return False
+        try:
+            os.remove(self._path(session_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def start(self, session_id: str, input_text: str) -> Dict[str, Any]:
+        if time.time() - self._swept_at > self.SWEEP_INTERVAL:
+            self._remove_stale_files()
+        existing = self.load(session_id)
+        if existing and not existing.get('completed') and existing.get('inputHash') == input_hash(input_text):
+            existing['resumed'] = True
+            return existing
+        return { 'sessionId': session_id, 'inputHash': input_hash(input_text), 'completed': False, 'resumed': False, 'stages': {}, 'generation': {} }
+
+class CheckpointWriter:
+    """Saves one run's checkpoint off the event loop.
+
+    :meth:`save` may be called from synchronous callbacks: the checkpoint is serialised on the loop
+    (so the file matches the state at that point) and written in a worker thread. Saves requested while
+    a write is running are coalesced into one more write, so the latest state always lands last.
+    """
+
+    def __init__(self, store: CheckpointStore, session_id: Optional[str], checkpoint: Dict[str, Any]):
+        self.store = store
+        self.session_id = session_id
+        self.checkpoint = checkpoint
+        self._dirty = False
+        self._task: Optional[asyncio.Future] = None
+
+    def save(self) -> None:
+        if not self.session_id:
+            return
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self) -> None:
+        while self._dirty:
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self.store.write, self.session_id, self.store.dumps(self.checkpoint))
+            except Exception:
+                pass
+
+    async def flush(self) -> None:
+        """Waits until every requested save has been written."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+default_checkpoint_store = CheckpointStore()
@@ -1,48 +1,160 @@
 import json
-from typing import Any, Dict
-from core.llm import BaseChatModel, LangChainLLM
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from core.llm import BaseChatModel
 from aitypes import AgentConfig, TaskStep, TaskStatus
 from core.stream_manager import StreamEvent
 from coder_agent.planner.coding_planner import CodingPlanner
 from coder_agent.bdd.bdd_decomposer import BDDDecomposer
 from coder_agent.generator.code_generator import CodeGenerator
 from core.react_agent import ReActAgent
+from core.model_router import ModelRouter, pooled_llm
+from core.cancellation import CancelToken, OperationCancelled, scoped_token, use_token
+from core.event_channel import EventChannel, stream_events
+from core.recording import record_run
+from core.metrics import ACTIVE_RUNS, RUNS, trace_run
+from core.usage import UsageLedger, current_ledger, session_ledger, use_ledger
+from coder_agent.core.stage_cache import StageCache, default_stage_cache, is_fallback
+from coder_agent.core.checkpoint import CheckpointStore, CheckpointWriter, CODING_STAGES, bdd_hash, default_checkpoint_store
 
 class CodingAgent:
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], cache: Optional[StageCache] = None, checkpoints: Optional[CheckpointStore] = None, llm: Optional[BaseChatModel] = None):
         self.config = AgentConfig(**config)
-        try:
-            self.llm: BaseChatModel = LangChainLLM(model=self.config.model, temperature=self.config.temperature, max_tokens=self.config.maxTokens, streaming=self.config.streamOutput)
-        except Exception:
-            from core.react_agent import SimpleLLM
-            self.llm = SimpleLLM()
-        self.planner = CodingPlanner(self.llm)
-        self.bdd = BDDDecomposer(self.llm)
-        self.generator = CodeGenerator(self.llm)
+        self.checkpoints = checkpoints or default_checkpoint_store
+        self.cache = cache or (default_stage_cache if self.config.stageCache else StageCache(max_entries=0))
+        if llm is not None:
+            self.llm: BaseChatModel = llm
+        else:
+            try:
+                self.llm = pooled_llm(self.config.model, self.config)
+            except Exception:
+                from core.react_agent import SimpleLLM
+                self.llm = SimpleLLM()
+        self.router = ModelRouter(self.config, self.llm)
+        self.planner = CodingPlanner(self.router.resolve('plan'))
+        self.bdd = BDDDecomposer(self.router.resolve('bdd'))
+        self.generator = CodeGenerator(self.llm, self.cache, self.router)
 
     def gen_id(self, prefix: str) -> str:
         import time, random
         return f"{prefix}_{int(time.time()*1000)}_{format(random.randint(0, 36**6-1), 'x')}"
 
     async def run(self, input_text: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
-        options = options or {}
+        options = dict(options or {})
+        options['sessionId'] = options.get('sessionId') or self.gen_id('sess')
+        token = scoped_token(options.get('cancelToken'), self.config.timeBudget)
+        trace = None
+        outcome = 'error'
+        ACTIVE_RUNS.inc('coding')
+        try:
+            with use_token(token), record_run('coding', options['sessionId'], input_text, options, self.config) as recorder, self._usage_ledger(options) as ledger, use_ledger(ledger, options.get('conversationId') or 'default'):
+                if options.get('trace'):
+                    with trace_run('coding') as trace:
+                        result = await self._run(input_text, options)
+                else:
+                    result = await self._run(input_text, options)
+            outcome = 'completed'
+        except OperationCancelled as e:
+            outcome = e.reason
+            raise
+        finally:
+            self.generator.discard_prefetch()
+            ACTIVE_RUNS.dec('coding')
+            RUNS.inc('coding', outcome)
+        result = { **result, 'usage': ledger.summary() }
+        if trace is not None:
+            result['tracePath'] = trace.dump()
+        if recorder is not None:
+            result['recordingPath'] = recorder.path
+        return result
+
+    async def stream_run(self, input_text: str, options: Dict[str, Any] = None, channel: Optional[EventChannel] = None) -> AsyncIterator[StreamEvent]:
+        """Async-iterator form of :meth:`run`; see :meth:`ReActAgent.stream_run`."""
+        options = dict(options or {})
+        token = options.get('cancelToken') or CancelToken()
+        options['cancelToken'] = token
+        async def run(on_stream):
+            return await self.run(input_text, { **options, 'onStream': on_stream })
+        async for event in stream_events(run, channel if channel is not None else EventChannel(), lambda: token.cancel('client_disconnected')):
+            yield event
+
+    @contextmanager
+    def _usage_ledger(self, options: Dict[str, Any]) -> Iterator[UsageLedger]:
+        ledger = current_ledger()
+        if ledger is not None:
+            yield ledger
+            return
+        ledger = session_ledger(options['sessionId'], self.config.tokenBudget)
         on_stream = options.get('onStream')
-        react = ReActAgent({ 'model': self.config.model, 'temperature': self.config.temperature, 'streamOutput': True, 'language': self.config.language, 'maxTokens': self.config.maxTokens, 'maxIterations': self.config.maxIterations, 'pauseAfterEachStep': False, 'autoPlanOnStart': False })
+        def on_record(record: Dict[str, Any], conversation_id: str) -> None:
+            on_stream and on_stream(StreamEvent(sessionId=options['sessionId'], conversationId=conversation_id, event={ 'id': self.gen_id('usage'), 'role': 'assistant', 'type': 'usage_event', 'data': { **record, 'session': dict(ledger.total), 'tokenBudget': ledger.token_budget } }, timestamp=self._now()))
+        with ledger.listen(on_record):
+            yield ledger
+
+    async def _run(self, input_text: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        options = dict(options or {})
+        options['sessionId'] = options.get('sessionId') or self.gen_id('sess')
+        session_id = options['sessionId']
+        on_stream = options.get('onStream')
+        checkpoint = self.checkpoints.start(session_id, input_text)
+        resumed = bool(checkpoint.get('resumed'))
+        writer = CheckpointWriter(self.checkpoints, session_id, checkpoint)
+        def on_checkpoint(stage, data):
+            generation = checkpoint['generation']
+            if stage == 'architecture':
+                generation['architecture'] = data
+            elif stage == 'rag':
+                generation.update({ 'selected': data.get('selected'), 'ragContext': data.get('ragContext'), 'componentDocs': data.get('componentDocs'), 'ragSources': data.get('ragSources') })
+            elif stage == 'feature':
+                generation.setdefault('features', {})[data['featureId']] = data
+            writer.save()
+        react = ReActAgent({ 'model': self.config.model, 'temperature': self.config.temperature, 'streamOutput': True, 'language': self.config.language, 'maxTokens': self.config.maxTokens, 'maxIterations': self.config.maxIterations, 'pauseAfterEachStep': False, 'autoPlanOnStart': False, 'deadlineReserve': self.config.deadlineReserve, 'hedging': self.config.hedging, 'hedgeFallbackModel': self.config.hedgeFallbackModel, 'modelRoutes': self.config.modelRoutes }, llm=self.llm)
         final_project = None
+        def on_stage_cache(payload):
+            on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('stage_cache'), 'role': 'assistant', 'type': 'stage_cache_event', 'data': payload }, timestamp=self._now()))
         async def create_plan_tool_exec(tool_input):
-            plan = await self.planner.create_plan(tool_input.get('input') or input_text)
+            plan_input = tool_input.get('input') or input_text
+            plan = await self.cache.memoize('create_coding_plan', [*self.router.signature('plan'), plan_input], lambda: self.planner.create_plan(plan_input), on_stage_cache)
             steps = [TaskStep(id=s['id'], title=s['title'], status='pending', note=s.get('description')) for s in plan['steps']]
             if on_stream:
                 on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('task_plan'), 'role': 'assistant', 'type': 'task_plan_event', 'data': { 'step': [p.__dict__ for p in steps] } }, timestamp=self._now()))
+            checkpoint['stages']['create_coding_plan'] = { 'plan': plan }
+            writer.save()
             return { 'plan': plan }
         async def bdd_tool_exec(tool_input):
-            features = await self.bdd.decompose(tool_input.get('requirement') or input_text)
+            requirement = tool_input.get('requirement') or input_text
+            emitted: List[Dict[str, Any]] = []
+            def on_feature(feature):
+                emitted.append(feature)
+                if self.config.ragPrefetch and not is_fallback(feature):
+                    self.generator.prepare_feature(feature)
+                on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('bdd_event'), 'role': 'assistant', 'type': 'bdd_event', 'data': { 'feature': feature, 'index': len(emitted) - 1, 'features': list(emitted), 'done': False } }, timestamp=self._now()))
+            async def decompose():
+                features = []
+                async for feature in self.bdd.decompose_stream(requirement):
+                    features.append(feature)
+                    on_feature(feature)
+                return features
+            features = await self.cache.memoize('decompose_bdd', [*self.router.signature('bdd'), requirement], decompose, on_stage_cache)
+            if not emitted:
+                for feature in features:
+                    on_feature(feature)
             if on_stream:
-                on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('bdd_event'), 'role': 'assistant', 'type': 'bdd_event', 'data': { 'features': features } }, timestamp=self._now()))
+                on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('bdd_event'), 'role': 'assistant', 'type': 'bdd_event', 'data': { 'features': features, 'done': True } }, timestamp=self._now()))
+            checkpoint['stages']['decompose_bdd'] = { 'features': features }
+            writer.save()
             return { 'features': features }
+        def on_file(payload):
+            on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('code_file'), 'role': 'assistant', 'type': 'code_file_event', 'data': payload }, timestamp=self._now()))
         async def generate_tool_exec(tool_input):
             nonlocal final_project
-            project = await self.generator.generate(self.config, tool_input.get('bdd'), {
+            bdd = tool_input.get('bdd')
+            if checkpoint['generation'].get('bddHash') != bdd_hash(bdd):
+                checkpoint['generation'] = { 'bddHash': bdd_hash(bdd), 'bdd': bdd }
+            resume = dict(checkpoint['generation'])
+            project = await self.generator.generate(self.config, bdd, {
+                'resume': resume,
+                'onCheckpoint': on_checkpoint,
                 'onThought': lambda content: on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('react_piece'), 'role': 'assistant', 'type': 'normal_event', 'content': content }, timestamp=self._now())),
                 'onToolCall': lambda payload: on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': payload.get('id') or self.gen_id('tool_call'), 'role': 'assistant', 'type': 'tool_call_event', 'data': payload }, timestamp=self._now())),
                 'onRagUsed': lambda data: on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('rag_used'), 'role': 'assistant', 'type': 'rag_used_event', 'data': data }, timestamp=self._now())),
@@ -52,35 +164,63 @@ class CodingAgent:
                 'onArchitectLog': lambda message: on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('architect_log'), 'role': 'assistant', 'type': 'architect_event', 'data': { 'message': message } }, timestamp=self._now())),
                 'onArchitecture': lambda architecture: on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('architecture'), 'role': 'assistant', 'type': 'architecture_event', 'data': { 'architecture': architecture } }, timestamp=self._now())),
                 'onArchitectStream': lambda evt: on_stream and on_stream(evt),
+                'onFeatureProgress': lambda payload: on_stream and on_stream(StreamEvent(sessionId=options.get('sessionId') or 'default', conversationId=options.get('conversationId') or 'default', event={ 'id': self.gen_id('feature_progress'), 'role': 'assistant', 'type': 'feature_progress_event', 'data': payload }, timestamp=self._now())),
+                'onStageCache': on_stage_cache,
+                'onFile': on_file,
             })
             final_project = project
-            return { 'project': project, 'planUpdate': { 'completeIds': ['step_3'], 'completeTitles': ['代码生成','code gen'] } }
+            result = { 'project': project, 'planUpdate': { 'completeIds': ['step_3'], 'completeTitles': ['代码生成','code gen'] } }
+            if not is_fallback(project):
+                checkpoint['stages']['generate_code_project'] = result
+                checkpoint['completed'] = True
+                writer.save()
+            return result
         react.getToolRegistry().registerTools([
             { 'name': 'create_coding_plan', 'description': '高优先级：在开始任何实现之前，首先调用此工具以创建简洁的步骤计划（3-5步）。当用户需求是页面/组件/交互开发时，务必先执行本工具。关键词: planner, 计划, planning。', 'parameters': [ { 'name': 'input', 'type': 'string', 'description': '用户需求', 'required': True } ], 'execute': create_plan_tool_exec },
             { 'name': 'decompose_bdd', 'description': '将需求拆解为BDD场景（JSON数组）', 'parameters': [ { 'name': 'requirement', 'type': 'string', 'description': '需求文本', 'required': True } ], 'execute': bdd_tool_exec },
             { 'name': 'generate_code_project', 'description': '根据BDD与内部组件生成完整前端项目结构', 'parameters': [ { 'name': 'bdd', 'type': 'string', 'description': 'BDD场景JSON字符串', 'required': True } ], 'execute': generate_tool_exec }
         ])
-        def forward_on_stream(evt: StreamEvent):
-            e = evt.event
-            if e and e.get('type') == 'tool_call_event' and e.get('data', {}).get('status') == 'end':
-                tool_name = e.get('data', {}).get('tool_name')
-                result = e.get('data', {}).get('result')
-                if tool_name == 'create_coding_plan' and result and result.get('plan'):
-                    steps = result['plan']['steps']
-                    mapped = [TaskStep(id=s['id'], title=s['title'], status='pending', note=s.get('description')) for s in steps]
-                    on_stream and on_stream(StreamEvent(sessionId=evt.sessionId, conversationId=evt.conversationId, event={ 'id': self.gen_id('task_plan'), 'role': 'assistant', 'type': 'task_plan_event', 'data': { 'step': [p.__dict__ for p in mapped] } }, timestamp=self._now()))
-                if tool_name == 'decompose_bdd' and result and (result.get('features') or result.get('scenarios')):
-                    feats = result.get('features') or [ { 'feature_id': 'feature_1', 'feature_title': 'General', 'description': '', 'scenarios': result.get('scenarios') or [] } ]
-                    on_stream and on_stream(StreamEvent(sessionId=evt.sessionId, conversationId=evt.conversationId, event={ 'id': self.gen_id('bdd_event'), 'role': 'assistant', 'type': 'bdd_event', 'data': { 'features': feats } }, timestamp=self._now()))
-                if tool_name == 'generate_code_project' and result and result.get('project'):
-                    rag_sources = self.generator.get_rag_sources()
-                    if rag_sources:
-                        on_stream and on_stream(StreamEvent(sessionId=evt.sessionId, conversationId=evt.conversationId, event={ 'id': self.gen_id('rag_event'), 'role': 'assistant', 'type': 'rag_event', 'data': { 'sources': rag_sources } }, timestamp=self._now()))
-            on_stream and on_stream(evt)
-        await react.run_with_session(input_text, { 'sessionId': options.get('sessionId'), 'conversationId': options.get('conversationId'), 'onStream': forward_on_stream })
+        if resumed:
+            await self._resume_stages(react, checkpoint, input_text, options, on_stream)
+        else:
+            writer.save()
+            await react.run_with_session(input_text, { 'sessionId': options.get('sessionId'), 'conversationId': options.get('conversationId'), 'onStream': on_stream })
+        await writer.flush()
+        if checkpoint.get('completed'):
+            self.checkpoints.delete(session_id)
         if not final_project:
             final_project = { 'files': [], 'summary': 'No project generated' }
-        return { 'finalAnswer': final_project }
+        return { 'finalAnswer': final_project, 'sessionId': session_id, 'resumed': resumed }
+
+    async def _resume_stages(self, react: ReActAgent, checkpoint: Dict[str, Any], input_text: str, options: Dict[str, Any], on_stream) -> None:
+        session_id = options.get('sessionId') or 'default'
+        conversation_id = options.get('conversationId') or self.gen_id('conv')
+        completed = [s for s in CODING_STAGES if s in checkpoint['stages']]
+        react.emit('normal', { 'content': f"♻️ 从检查点恢复，已完成阶段：{'、'.join(completed) or '无'}" }, session_id, conversation_id, self.gen_id('resume'), on_stream)
+        for iteration, name in enumerate(CODING_STAGES):
+            stage_result = checkpoint['stages'].get(name)
+            if stage_result is not None:
+                if name == 'create_coding_plan':
+                    steps = [TaskStep(id=s['id'], title=s['title'], status='done', note=s.get('description')) for s in stage_result['plan']['steps']]
+                    react.emit('task_plan', { 'step': [p.__dict__ for p in steps] }, session_id, conversation_id, self.gen_id('task_plan'), on_stream)
+                elif name == 'decompose_bdd':
+                    react.emit('bdd_event', { 'features': stage_result['features'] }, session_id, conversation_id, self.gen_id('bdd_event'), on_stream)
+                continue
+            if name == 'create_coding_plan':
+                tool_input = { 'input': input_text }
+            elif name == 'decompose_bdd':
+                tool_input = { 'requirement': input_text }
+            else:
+                features = (checkpoint['stages'].get('decompose_bdd') or {}).get('features') or []
+                tool_input = { 'bdd': checkpoint['generation'].get('bdd') or json.dumps(features, ensure_ascii=False) }
+            tool_event_id = f"tool_{iteration}_{conversation_id}"
+            started_at = self._now()
+            react.emit('tool_call', { 'id': tool_event_id, 'status': 'start', 'tool_name': name, 'args': tool_input, 'iteration': iteration, 'startedAt': started_at }, session_id, conversation_id, tool_event_id, on_stream)
+            tool_result = await react.getToolRegistry().execute_tool(name, tool_input)
+            finished_at = self._now()
+            react.emit('tool_call', { 'id': tool_event_id, 'status': 'end', 'tool_name': name, 'args': tool_input, 'result': react.compact_tool_result(tool_result, session_id), 'success': tool_result.get('success'), 'startedAt': started_at, 'finishedAt': finished_at, 'durationMs': finished_at - started_at, 'iteration': iteration }, session_id, conversation_id, tool_event_id, on_stream)
+            if not tool_result.get('success'):
+                raise RuntimeError(tool_result.get('error') or f"{name} failed")
 
     def _now(self) -> int:
         import time
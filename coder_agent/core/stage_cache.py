@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+_MISSING = object()
+DISK_SWEEP_EVERY = 64
+
+class Fallback(dict):
+    """A stage result produced by a fallback path. It is a plain dict to callers and to JSON, but is never cached."""
+
+def is_fallback(value: Any) -> bool:
+    if isinstance(value, list):
+        return any(isinstance(v, Fallback) for v in value)
+    return isinstance(value, Fallback)
+
+class StageCache:
+    """Content-addressed store for coding pipeline stage outputs.
+
+    Keys are SHA-256 hashes of the stage name plus its JSON-serialised inputs, so a re-run only
+    recomputes stages whose inputs changed. Entries live in an LRU map and, when ``cache_dir``
+    is set, are also written to disk so they survive restarts. Disk entries unused for ``max_disk_age``
+    seconds are removed, then the least recently used ones until the directory fits ``max_disk_bytes``;
+    the directory is swept on start and every ``DISK_SWEEP_EVERY`` writes.
+    """
+
+    def __init__(self, max_entries: int = 512, cache_dir: Optional[str] = None, max_disk_bytes: int = 256 * 2**20, max_disk_age: float = 7 * 86400):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_disk_age = max_disk_age
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.sweep_disk()
+
+    @staticmethod
+    def key(stage: str, inputs: Any) -> str:
+        raw = json.dumps([stage, inputs], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None and self.cache_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                os.utime(self._disk_path(key))
+                self._entries[key] = entry
+            except Exception:
+                entry = None
+        if entry is None:
+            return _MISSING
+        if entry.get('expiresAt') and entry['expiresAt'] < time.time():
+            self._entries.pop(key, None)
+            self._remove_disk(key)
+            return _MISSING
+        self._entries.move_to_end(key)
+        return json.loads(entry['value'])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        entry = { 'value': json.dumps(value, ensure_ascii=False), 'expiresAt': (time.time() + ttl) if ttl else None }
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+            except Exception:
+                pass
+            self._writes += 1
+            if self._writes % DISK_SWEEP_EVERY == 0:
+                self.sweep_disk()
+
+    def _remove_disk(self, key: str) -> None:
+        if self.cache_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def sweep_disk(self) -> None:
+        """Applies the age and size limits to the on-disk entries (modification time is refreshed on every read)."""
+        if not self.cache_dir:
+            return
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for e in it:
+                    if e.name.endswith('.json') and e.is_file():
+                        st = e.stat()
+                        files.append((st.st_mtime, st.st_size, e.path))
+        except OSError:
+            return
+        files.sort()
+        cutoff = time.time() - self.max_disk_age
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    async def memoize(self, stage: str, inputs: Any, compute: Callable[[], Awaitable[Any]], on_event: Optional[Callable[[Dict[str, Any]], Any]] = None, ttl: Optional[float] = None, extra: Optional[Dict[str, Any]] = None) -> Any:
+        key = self.key(stage, inputs)
+        value = self.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            on_event and on_event({ **(extra or {}), 'stage': stage, 'key': key[:16], 'reused': True })
+            return value
+        self.misses += 1
+        value = await compute()
+        if not is_fallback(value):
+            self.set(key, value, ttl)
+        on_event and on_event({ **(extra or {}), 'stage': stage, 'key': key[:16], 'reused': False })
+        return value
+
+    def clear(self) -> None:
+        keys = list(self._entries)
+        self._entries.clear()
+        if self.cache_dir:
+            try:
+                keys = [name[:-5] for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+            except OSError:
+                pass
+            for key in keys:
+                self._remove_disk(key)
+
+default_stage_cache = StageCache(cache_dir=os.environ.get('CODER_STAGE_CACHE_DIR') or None, max_disk_bytes=int(float(os.environ.get('CODER_STAGE_CACHE_MAX_MB', '256')) * 2**20))
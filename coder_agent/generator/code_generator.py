@@ -1,73 +1,292 @@
+import asyncio
 import json
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Optional
 from core.llm import BaseChatModel
+from core.cancellation import budget_below, guard, remaining_budget
+from core.event_channel import flow_control
+from core.recording import taped_call
+from core.model_router import ModelRouter
+from core.json_stream import JsonItemStream
+from core.json_repair import parse_llm_json
+from core.metrics import span
+from coder_agent.matcher.scenario_matcher import ScenarioMatcher
 from coder_agent.config.prompt import CODING_AGENT_PROMPTS
 from aitypes import AgentConfig
 from coder_agent.architect.architect_generator import ArchitectGenerator
+from coder_agent.core.stage_cache import Fallback, StageCache, default_stage_cache, is_fallback
+from coder_agent.generator.rag_prefetch import ComponentDocPrefetch
+
+PROJECT_SCHEMA = { 'type': 'object', 'required': ['files'], 'properties': { 'files': { 'type': 'array', 'items': { 'type': 'object', 'required': ['path'] } } } }
+COMPONENT_DOC_TTL = 3600
+OPTIONAL_STAGE_MIN_BUDGET = 60.0
+DOC_SECTIONS = ('API / Props', 'Usage Example')
+RAG_PREFETCH_CONCURRENCY = int(os.environ.get('RAG_PREFETCH_CONCURRENCY') or '4')
 
 class CodeGenerator:
-    def __init__(self, llm: BaseChatModel):
+    def __init__(self, llm: BaseChatModel, cache: Optional[StageCache] = None, router: Optional[ModelRouter] = None):
         self.llm = llm
+        self.cache = cache or default_stage_cache
+        self.router = router
         self._rag_sources: List[Dict[str, Any]] = []
         self._rag_keys = set()
+        self._component_docs: Dict[str, str] = {}
+        self._early_prefetch: Optional[ComponentDocPrefetch] = None
 
     async def generate(self, config: AgentConfig, bdd_scenarios: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
         options = options or {}
+        resume = options.get('resume') or {}
+        prefetch, self._early_prefetch = self._early_prefetch, None
+        bdd_keywords = None
+        if config.ragPrefetch and (resume.get('ragContext') is None or resume.get('selected') is None) and not budget_below(OPTIONAL_STAGE_MIN_BUDGET):
+            # BDD keywords, the component list and the docs they point to are fetched while the architecture is generated.
+            prefetch = prefetch or self._new_prefetch(options)
+            bdd_keywords = asyncio.ensure_future(self.cache.memoize('keywords', [*self._signature('keywords', config), bdd_scenarios], lambda: self._extract_keywords(bdd_scenarios), options.get('onStageCache'), extra={ 'source': 'bdd' }))
+            prefetch.speculate(bdd_keywords)
+        try:
+            return await self._generate(config, bdd_scenarios, options, prefetch, bdd_keywords)
+        finally:
+            if prefetch:
+                prefetch.finish()
+            if bdd_keywords is not None and not bdd_keywords.done():
+                bdd_keywords.cancel()
+            elif bdd_keywords is not None and not bdd_keywords.cancelled():
+                bdd_keywords.exception()
+
+    def prepare_feature(self, feature: Dict[str, Any]) -> None:
+        """Starts fetching docs for the components a freshly decomposed BDD feature mentions; the next :meth:`generate` takes them over."""
+        if self._early_prefetch is None:
+            self._early_prefetch = self._new_prefetch({})
+        self._early_prefetch.speculate_text(json.dumps(feature, ensure_ascii=False))
+
+    def discard_prefetch(self) -> None:
+        if self._early_prefetch is not None:
+            self._early_prefetch.finish()
+            self._early_prefetch = None
+
+    def _new_prefetch(self, options: Dict[str, Any]) -> ComponentDocPrefetch:
+        return ComponentDocPrefetch(self._fetch_available_components(), lambda comp, sec: self._query_component_doc(comp, sec, options), DOC_SECTIONS, RAG_PREFETCH_CONCURRENCY)
+
+    async def _generate(self, config: AgentConfig, bdd_scenarios: str, options: Dict[str, Any], prefetch: Optional[ComponentDocPrefetch] = None, bdd_keywords: Optional[asyncio.Future] = None) -> Dict[str, Any]:
         if options.get('onThought'): options['onThought']('Thought: 启动代码生成流程')
         if options.get('onThought'): options['onThought']('Action: 生成基础项目架构')
-        options.get('onArchitectLog') and options['onArchitectLog']('开始调用 ArchitectGenerator 生成基础架构')
-        arch = ArchitectGenerator(self.llm, config)
-        base_arch = await arch.generate(bdd_scenarios, { 'onStream': options.get('onArchitectStream'), 'onLog': options.get('onArchitectLog') })
-        base_arch = base_arch.strip() if base_arch else '[]'
+        resume = options.get('resume') or {}
+        on_checkpoint = options.get('onCheckpoint')
+        if resume.get('architecture'):
+            base_arch = resume['architecture']
+            options.get('onArchitectLog') and options['onArchitectLog']('从检查点恢复基础架构')
+        else:
+            options.get('onArchitectLog') and options['onArchitectLog']('开始调用 ArchitectGenerator 生成基础架构')
+            arch = ArchitectGenerator(self._llm('architect'), config)
+            async def compute_architecture():
+                text = await arch.generate(bdd_scenarios, { 'onStream': options.get('onArchitectStream'), 'onLog': options.get('onArchitectLog') })
+                return { 'architecture': text } if arch.last_valid else Fallback({ 'architecture': text })
+            with span('codegen.architecture'):
+                arch_result = await self.cache.memoize('architecture', [*self._signature('architect', config), bdd_scenarios], compute_architecture, options.get('onStageCache'))
+            base_arch = arch_result['architecture'].strip() if arch_result.get('architecture') else '[]'
+            on_checkpoint and on_checkpoint('architecture', base_arch)
         options.get('onArchitectLog') and options['onArchitectLog']('基础架构生成完成，长度: ' + str(len(base_arch)))
         options.get('onArchitecture') and options['onArchitecture'](base_arch)
-        if options.get('onThought'): options['onThought']('Thought: 从BDD输入（支持 Feature 分组）中提取潜在组件关键词用于检索')
-        kw_start = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_extract_keywords_{kw_start}', 'status': 'start', 'tool_name': 'extract_keywords', 'args': { 'input': 'bdd_scenarios' }, 'startedAt': kw_start })
-        kw_bdd = await self._extract_keywords(bdd_scenarios)
-        kw_arch = await self._extract_keywords(base_arch)
-        keywords = list(dict.fromkeys([*(kw_bdd or []), *(kw_arch or [])]))
-        kw_end = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_extract_keywords_{kw_start}', 'status': 'end', 'tool_name': 'extract_keywords', 'args': { 'input': 'bdd_scenarios' }, 'result': { 'keywords': keywords }, 'success': True, 'startedAt': kw_start, 'finishedAt': kw_end, 'durationMs': kw_end - kw_start })
-        if options.get('onThought'): options['onThought']('Action: 获取可用内部组件列表')
-        list_start = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_list_components_{list_start}', 'status': 'start', 'tool_name': 'list_internal_components', 'args': {}, 'startedAt': list_start })
-        available = await self._fetch_available_components()
-        list_end = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_list_components_{list_start}', 'status': 'end', 'tool_name': 'list_internal_components', 'args': {}, 'result': { 'available': available[:20] }, 'success': True, 'startedAt': list_start, 'finishedAt': list_end, 'durationMs': list_end - list_start })
-        if options.get('onThought'): options['onThought']('Observation: 可用组件列表: ' + json.dumps(available[:8], ensure_ascii=False))
-        sel_start = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_select_components_{sel_start}', 'status': 'start', 'tool_name': 'select_components', 'args': { 'keywords': keywords, 'available': available }, 'startedAt': sel_start })
-        selected = self._select_components_from_bdd(keywords, available)
-        sel_end = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_select_components_{sel_start}', 'status': 'end', 'tool_name': 'select_components', 'args': { 'keywords': keywords, 'available': available }, 'result': { 'selected': selected }, 'success': True, 'startedAt': sel_start, 'finishedAt': sel_end, 'durationMs': sel_end - sel_start })
-        if options.get('onThought'): options['onThought']('Action: fetch_component_docs\nInput: { "components": ' + json.dumps(selected, ensure_ascii=False) + ' }')
-        rag_context = await self._fetch_component_docs(selected, options)
+        if resume.get('ragContext') is not None and resume.get('selected') is not None:
+            selected = resume['selected']
+            rag_context = resume['ragContext']
+            self._component_docs.update(resume.get('componentDocs') or {})
+            self._rag_sources.extend(resume.get('ragSources') or [])
+            if options.get('onThought'): options['onThought']('Observation: 从检查点恢复组件文档: ' + json.dumps(selected, ensure_ascii=False))
+        elif budget_below(OPTIONAL_STAGE_MIN_BUDGET):
+            selected = []
+            rag_context = 'No internal component documentation found.'
+            if options.get('onThought'): options['onThought']('Observation: 剩余时间不足，跳过组件文档检索')
+        else:
+            if options.get('onThought'): options['onThought']('Thought: 从BDD输入（支持 Feature 分组）中提取潜在组件关键词用于检索')
+            kw_start = self._now()
+            if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_extract_keywords_{kw_start}', 'status': 'start', 'tool_name': 'extract_keywords', 'args': { 'input': 'bdd_scenarios' }, 'startedAt': kw_start })
+            with span('codegen.keywords'):
+                kw_bdd = await bdd_keywords if bdd_keywords is not None else await self.cache.memoize('keywords', [*self._signature('keywords', config), bdd_scenarios], lambda: self._extract_keywords(bdd_scenarios), options.get('onStageCache'), extra={ 'source': 'bdd' })
+                kw_arch = await self.cache.memoize('keywords', [*self._signature('keywords', config), base_arch], lambda: self._extract_keywords(base_arch), options.get('onStageCache'), extra={ 'source': 'architecture' })
+            keywords = list(dict.fromkeys([*(kw_bdd or []), *(kw_arch or [])]))
+            kw_end = self._now()
+            if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_extract_keywords_{kw_start}', 'status': 'end', 'tool_name': 'extract_keywords', 'args': { 'input': 'bdd_scenarios' }, 'result': { 'keywords': keywords }, 'success': True, 'startedAt': kw_start, 'finishedAt': kw_end, 'durationMs': kw_end - kw_start })
+            if options.get('onThought'): options['onThought']('Action: 获取可用内部组件列表')
+            list_start = self._now()
+            if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_list_components_{list_start}', 'status': 'start', 'tool_name': 'list_internal_components', 'args': {}, 'startedAt': list_start })
+            available = await prefetch.available if prefetch else await self._fetch_available_components()
+            list_end = self._now()
+            if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_list_components_{list_start}', 'status': 'end', 'tool_name': 'list_internal_components', 'args': {}, 'result': { 'available': available[:20] }, 'success': True, 'startedAt': list_start, 'finishedAt': list_end, 'durationMs': list_end - list_start })
+            if options.get('onThought'): options['onThought']('Observation: 可用组件列表: ' + json.dumps(available[:8], ensure_ascii=False))
+            sel_start = self._now()
+            if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_select_components_{sel_start}', 'status': 'start', 'tool_name': 'select_components', 'args': { 'keywords': keywords, 'available': available }, 'startedAt': sel_start })
+            selected = self._select_components_from_bdd(keywords, available)
+            sel_end = self._now()
+            if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_select_components_{sel_start}', 'status': 'end', 'tool_name': 'select_components', 'args': { 'keywords': keywords, 'available': available }, 'result': { 'selected': selected }, 'success': True, 'startedAt': sel_start, 'finishedAt': sel_end, 'durationMs': sel_end - sel_start })
+            if options.get('onThought'): options['onThought']('Action: fetch_component_docs\nInput: { "components": ' + json.dumps(selected, ensure_ascii=False) + ' }')
+            with span('codegen.rag', components=len(selected)):
+                if prefetch:
+                    await prefetch.ready()
+                rag_context = await self._fetch_component_docs(selected, options, prefetch)
+            if prefetch:
+                stats = prefetch.finish()
+                if options.get('onThought'): options['onThought'](f"Observation: 组件文档预取命中 {stats['hits']}/{stats['hits'] + stats['misses']}，丢弃 {stats['wasted']}")
+            on_checkpoint and on_checkpoint('rag', { 'selected': selected, 'ragContext': rag_context, 'componentDocs': self._component_docs, 'ragSources': self._rag_sources })
         if options.get('onRagSources'): options['onRagSources'](self.get_rag_sources())
         if options.get('onThought'): options['onThought']('Observation: 已获取组件API与示例文档，开始代码生成')
+        features = self._parse_features(bdd_scenarios) if config.codegenMode == 'per_feature' else []
+        if len(features) > 1:
+            with span('codegen.generate', features=len(features)):
+                project = await self._generate_per_feature(config, features, base_arch, selected, rag_context, options)
+            await self._emit_scenario_matches(config, bdd_scenarios, project, options)
+            return project
+        computed = []
+        async def compute_project():
+            computed.append(True)
+            return await self._generate_single(config, bdd_scenarios, base_arch, rag_context, options)
+        with span('codegen.generate', features=1):
+            project = await self.cache.memoize('codegen', [*self._signature('codegen', config), bdd_scenarios, base_arch, rag_context], compute_project, options.get('onStageCache'))
+        if not computed:
+            self._replay_files(project, options)
+        if not is_fallback(project):
+            await self._emit_scenario_matches(config, bdd_scenarios, project, options)
+        return project
+
+    def _replay_files(self, project: Dict[str, Any], options: Dict[str, Any], extra: Dict[str, Any] = None) -> None:
+        if not options.get('onFile'):
+            return
+        for i, f in enumerate(project.get('files') or []):
+            if isinstance(f, dict):
+                options['onFile']({ **(extra or {}), 'index': i, 'path': f.get('path'), 'content': f.get('content'), 'reused': True })
+
+    async def _generate_single(self, config: AgentConfig, bdd_scenarios: str, base_arch: str, rag_context: str, options: Dict[str, Any]) -> Dict[str, Any]:
         prompt = CODING_AGENT_PROMPTS['CODE_GENERATOR_PROMPT'].replace('{bdd_scenarios}', bdd_scenarios).replace('{base_architecture}', base_arch).replace('{rag_context}', rag_context)
         messages = [ { 'role': 'system', 'content': CODING_AGENT_PROMPTS['SYSTEM_PERSONA'] }, { 'role': 'user', 'content': prompt } ]
         gen_start = self._now()
         if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_llm_generate_{gen_start}', 'status': 'start', 'tool_name': 'llm_generate_project', 'args': { 'model': 'chat', 'inputs': ['persona', 'prompt'] }, 'startedAt': gen_start })
-        resp = await self.llm.invoke(messages)
+        if config.streamOutput:
+            content, streamed_files = await self._stream_project(messages, options)
+        else:
+            resp = await self._llm('codegen').invoke(messages)
+            content, streamed_files = resp.get('content') or '', []
         gen_end = self._now()
-        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_llm_generate_{gen_start}', 'status': 'end', 'tool_name': 'llm_generate_project', 'args': { 'model': 'chat' }, 'result': { 'length': len(resp.get('content') or '') }, 'success': True, 'startedAt': gen_start, 'finishedAt': gen_end, 'durationMs': gen_end - gen_start })
-        content = resp.get('content') or ''
-        try:
-            import re
-            m = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", content)
-            s = m.group(1) if m else content
-            project = json.loads(s)
-            try:
-                flattened = self._flatten_features_to_scenarios(bdd_scenarios)
-                matches = await self._compute_scenario_matches(flattened, [f.get('path') for f in project.get('files', [])])
-                if options.get('onScenarioMatches') and matches:
-                    options['onScenarioMatches'](matches)
-            except Exception:
-                pass
+        if options.get('onToolCall'): options['onToolCall']({ 'id': f'tool_llm_generate_{gen_start}', 'status': 'end', 'tool_name': 'llm_generate_project', 'args': { 'model': 'chat' }, 'result': { 'length': len(content), 'streamedFiles': len(streamed_files) }, 'success': True, 'startedAt': gen_start, 'finishedAt': gen_end, 'durationMs': gen_end - gen_start })
+        project = parse_llm_json(content, expect='object', schema=PROJECT_SCHEMA, site='codegen', default=None)
+        if project is None and streamed_files:
+            project = { 'files': streamed_files, 'summary': 'Assembled from streamed files; final JSON was incomplete.' }
+        if project is not None:
             return project
+        return Fallback({ 'files': [ { 'path': 'src/components/GeneratedComponent.tsx', 'content': content } ], 'summary': 'Failed to parse structured output, returning raw content.' })
+
+    async def _emit_scenario_matches(self, config: AgentConfig, bdd_scenarios: str, project: Dict[str, Any], options: Dict[str, Any]) -> None:
+        try:
+            flattened = self._flatten_features_to_scenarios(bdd_scenarios)
+            with span('codegen.scenario_match'):
+                matches = await self._compute_scenario_matches(flattened, project.get('files', []), config.scenarioMatchRefine and not budget_below(OPTIONAL_STAGE_MIN_BUDGET))
+            if options.get('onScenarioMatches') and matches:
+                options['onScenarioMatches'](matches)
         except Exception:
-            return { 'files': [ { 'path': 'src/components/GeneratedComponent.tsx', 'content': content } ], 'summary': 'Failed to parse structured output, returning raw content.' }
+            pass
+
+    def _parse_features(self, bdd_scenarios: str) -> List[Dict[str, Any]]:
+        data = parse_llm_json(bdd_scenarios, expect='array', site='bdd_input', default=None)
+        if not isinstance(data, list):
+            return []
+        return [f for f in data if isinstance(f, dict) and isinstance(f.get('scenarios'), list)]
+
+    def _docs_for_feature(self, feature: Dict[str, Any], selected: List[str]) -> str:
+        text = json.dumps(feature, ensure_ascii=False).lower()
+        relevant = [c for c in selected if c.lower() in text and self._component_docs.get(c)]
+        if not relevant:
+            relevant = [c for c in selected if self._component_docs.get(c)]
+        return ''.join(self._component_docs[c] for c in relevant)
+
+    async def _generate_per_feature(self, config: AgentConfig, features: List[Dict[str, Any]], base_arch: str, selected: List[str], rag_context: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        sem = asyncio.Semaphore(max(1, config.codegenConcurrency))
+        total = len(features)
+        async def run_feature(index: int, feature: Dict[str, Any]) -> Dict[str, Any]:
+            feature_id = str(feature.get('feature_id') or f"feature_{index+1}")
+            docs = self._docs_for_feature(feature, selected) or rag_context
+            resumed = ((options.get('resume') or {}).get('features') or {}).get(feature_id)
+            if resumed:
+                self._replay_files(resumed, options, { 'featureId': feature_id })
+                options.get('onFeatureProgress') and options['onFeatureProgress']({ 'featureId': feature_id, 'title': feature.get('feature_title'), 'status': 'end', 'success': True, 'resumed': True, 'files': len(resumed.get('files') or []), 'index': index, 'total': total })
+                return resumed
+            computed = []
+            async def compute_feature() -> Dict[str, Any]:
+                computed.append(True)
+                async with sem:
+                    started_at = self._now()
+                    options.get('onFeatureProgress') and options['onFeatureProgress']({ 'featureId': feature_id, 'title': feature.get('feature_title'), 'status': 'start', 'index': index, 'total': total, 'startedAt': started_at })
+                    prompt = CODING_AGENT_PROMPTS['FEATURE_CODE_GENERATOR_PROMPT'].replace('{feature_id}', feature_id).replace('{feature}', json.dumps(feature, ensure_ascii=False)).replace('{base_architecture}', base_arch).replace('{rag_context}', docs)
+                    messages = [ { 'role': 'system', 'content': CODING_AGENT_PROMPTS['SYSTEM_PERSONA'] }, { 'role': 'user', 'content': prompt } ]
+                    try:
+                        if config.streamOutput:
+                            content, streamed_files = await self._stream_project(messages, options, { 'featureId': feature_id })
+                        else:
+                            resp = await self._llm('codegen').invoke(messages)
+                            content, streamed_files = resp.get('content') or '', []
+                        result = parse_llm_json(content, expect='object', schema=PROJECT_SCHEMA, site='codegen_feature', default=None) or { 'files': streamed_files, 'summary': '' }
+                        files = [f for f in (result.get('files') or []) if isinstance(f, dict) and f.get('path')]
+                        finished = self._now()
+                        options.get('onFeatureProgress') and options['onFeatureProgress']({ 'featureId': feature_id, 'title': feature.get('feature_title'), 'status': 'end', 'success': True, 'files': len(files), 'index': index, 'total': total, 'startedAt': started_at, 'finishedAt': finished, 'durationMs': finished - started_at })
+                        return (dict if files else Fallback)({ 'featureId': feature_id, 'files': files, 'summary': result.get('summary') or '' })
+                    except Exception as err:
+                        finished = self._now()
+                        options.get('onFeatureProgress') and options['onFeatureProgress']({ 'featureId': feature_id, 'title': feature.get('feature_title'), 'status': 'end', 'success': False, 'error': str(err), 'index': index, 'total': total, 'startedAt': started_at, 'finishedAt': finished, 'durationMs': finished - started_at })
+                        return Fallback({ 'featureId': feature_id, 'files': [], 'summary': '', 'error': str(err) })
+            result = await self.cache.memoize('codegen_feature', [*self._signature('codegen', config), feature, docs], compute_feature, options.get('onStageCache'), extra={ 'featureId': feature_id })
+            if not computed:
+                self._replay_files(result, options, { 'featureId': feature_id })
+                options.get('onFeatureProgress') and options['onFeatureProgress']({ 'featureId': feature_id, 'title': feature.get('feature_title'), 'status': 'end', 'success': True, 'reused': True, 'files': len(result.get('files') or []), 'index': index, 'total': total })
+            if not is_fallback(result) and options.get('onCheckpoint'):
+                options['onCheckpoint']('feature', result)
+            return result
+        results = await asyncio.gather(*[run_feature(i, f) for i, f in enumerate(features)])
+        return self._merge_feature_projects(results)
+
+    def _merge_feature_projects(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        merged: Dict[str, Dict[str, Any]] = {}
+        shared: List[str] = []
+        for r in results:
+            for f in r.get('files') or []:
+                path = str(f.get('path')).strip()
+                if path.startswith('./'):
+                    path = path[2:]
+                existing = merged.get(path)
+                if existing is None:
+                    merged[path] = { **f, 'path': path }
+                    continue
+                if path not in shared:
+                    shared.append(path)
+                if len(str(f.get('content') or '')) > len(str(existing.get('content') or '')):
+                    merged[path] = { **f, 'path': path }
+        summaries = [f"[{r['featureId']}] {r['summary']}" for r in results if r.get('summary')]
+        failed = [r['featureId'] for r in results if r.get('error')]
+        summary = '\n'.join(summaries) or 'Generated per feature.'
+        if failed:
+            summary += f"\nFailed features: {', '.join(failed)}"
+        return { 'files': list(merged.values()), 'summary': summary, 'sharedFiles': shared }
+
+    async def _stream_project(self, messages: List[Dict[str, Any]], options: Dict[str, Any], extra: Dict[str, Any] = None):
+        parser = JsonItemStream(('files',))
+        parts: List[str] = []
+        files: List[Dict[str, Any]] = []
+        async for chunk in self._llm('codegen').stream(messages):
+            await flow_control()
+            piece = chunk.get('content') or ''
+            if not piece:
+                continue
+            parts.append(piece)
+            for f in parser.feed(piece):
+                if not isinstance(f, dict):
+                    continue
+                files.append(f)
+                if options.get('onFile'):
+                    options['onFile']({ **(extra or {}), 'index': len(files) - 1, 'path': f.get('path'), 'content': f.get('content') })
+        return ''.join(parts), files
+
+    def _llm(self, purpose: str) -> BaseChatModel:
+        return self.router.resolve(purpose) if self.router else self.llm
+
+    def _signature(self, purpose: str, config: AgentConfig) -> List[Any]:
+        return self.router.signature(purpose) if self.router else [config.model, config.temperature]
 
     def _now(self) -> int:
         import time
@@ -75,13 +294,13 @@ class CodeGenerator:
 
     async def _extract_keywords(self, text: str) -> List[str]:
         prompt = f"Identify the UI components mentioned or implied in the following text. Return a comma-separated list of component names (e.g., \"Button, Table, DatePicker\").\n\nText:\n{text}"
-        resp = await self.llm.invoke([ { 'role': 'user', 'content': prompt } ])
+        resp = await self._llm('keywords').invoke([ { 'role': 'user', 'content': prompt } ])
         content = resp.get('content') or ''
         return [s.strip() for s in content.split(',') if s.strip()]
 
     def _flatten_features_to_scenarios(self, input_str: str) -> str:
         try:
-            data = json.loads(input_str)
+            data = parse_llm_json(input_str, expect='array', site='bdd_input')
             if isinstance(data, list) and data and isinstance(data[0], dict) and ('scenarios' in data[0]):
                 scenarios = []
                 for f in data:
@@ -99,23 +318,29 @@ class CodeGenerator:
         import httpx
         base = os.environ.get('RAG_BASE_URL', 'http://192.168.21.101:3000')
         url = f"{base}/getComponentList"
+        async def get_list():
+            async with httpx.AsyncClient(timeout=self._http_timeout(10)) as client:
+                resp = await guard(client.get(url, headers={ 'Content-Type': 'application/json' }))
+            return resp.json() if resp.status_code == 200 else None
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.get(url, headers={ 'Content-Type': 'application/json' })
-                if resp.status_code != 200:
-                    return []
-                data = resp.json()
-                text = data.get('answer') or ''
-                try:
-                    parsed = json.loads(text)
-                    if isinstance(parsed, list):
-                        return [str(v).strip() for v in parsed if str(v).strip()]
-                except Exception:
-                    pass
-                return [s.strip() for s in str(text).split('\n') if s.strip()]
+            data = await taped_call('rag', 'getComponentList', {}, get_list)
+            if data is None:
+                return []
+            text = data.get('answer') or ''
+            try:
+                parsed = json.loads(text)
+                if isinstance(parsed, list):
+                    return [str(v).strip() for v in parsed if str(v).strip()]
+            except Exception:
+                pass
+            return [s.strip() for s in str(text).split('\n') if s.strip()]
         except Exception:
             return []
 
+    def _http_timeout(self, default: float) -> float:
+        remaining = remaining_budget()
+        return default if remaining is None else max(0.1, min(default, remaining))
+
     def _select_components_from_bdd(self, keywords: List[str], available: List[str]) -> List[str]:
         s = set(a.lower() for a in available)
         selected = []
@@ -126,28 +351,35 @@ class CodeGenerator:
             return available[:3]
         return list(dict.fromkeys(selected))
 
-    async def _fetch_component_docs(self, components: List[str], options: Dict[str, Any]) -> str:
-        import os
+    async def _query_component_doc(self, comp: str, sec: str, options: Dict[str, Any]) -> Dict[str, Any]:
         import httpx
         base = os.environ.get('RAG_BASE_URL', 'http://192.168.21.101:3000')
         url = f"{base}/query"
+        body = { 'query': '总结下这个组件的使用文档', 'metadataFilters': { 'component_name': comp, 'section': sec }, 'limit': 3 }
+        async def query_doc():
+            async with httpx.AsyncClient(timeout=self._http_timeout(15)) as client:
+                resp = await guard(client.post(url, headers={ 'Content-Type': 'application/json' }, json=body))
+            return resp.json() if resp.status_code == 200 else Fallback({ 'answer': '', 'sources': [] })
+        return await self.cache.memoize('component_doc', [base, comp, sec], lambda: taped_call('rag', 'query', body, query_doc), options.get('onStageCache'), ttl=COMPONENT_DOC_TTL, extra={ 'component': comp, 'section': sec })
+
+    async def _fetch_component_docs(self, components: List[str], options: Dict[str, Any], prefetch: Optional[ComponentDocPrefetch] = None) -> str:
         context = ''
         for comp in components:
-            for sec in ['API / Props','Usage Example']:
+            for sec in DOC_SECTIONS:
                 started_at = self._now()
                 tool_id = f"tool_rag_{comp}_{sec}_{started_at}"
                 if options.get('onToolCall'):
                     options['onToolCall']({ 'id': tool_id, 'status': 'start', 'tool_name': 'search_component_docs', 'args': { 'query': '总结下这个组件的使用文档', 'metadataFilters': { 'component_name': comp, 'section': sec }, 'limit': 3 }, 'startedAt': started_at })
                 try:
-                    body = { 'query': '总结下这个组件的使用文档', 'metadataFilters': { 'component_name': comp, 'section': sec }, 'limit': 3 }
-                    async with httpx.AsyncClient(timeout=15) as client:
-                        resp = await client.post(url, headers={ 'Content-Type': 'application/json' }, json=body)
-                    result = resp.json() if resp.status_code == 200 else { 'answer': '', 'sources': [] }
+                    prefetched = prefetch.take(comp, sec) if prefetch else None
+                    result = await prefetched if prefetched is not None else await self._query_component_doc(comp, sec, options)
                     raw = result.get('answer') or ''
                     payload_str = raw if isinstance(raw, str) else json.dumps(raw, ensure_ascii=False)
                     safe_payload = payload_str.replace('```','\`\`\`')
                     code_fence = 'tsx' if sec == 'Usage Example' else 'md'
-                    context += f"\n--- {comp} ({sec}) ---\n\n```{code_fence}\n{safe_payload}\n```\n\n"
+                    section_context = f"\n--- {comp} ({sec}) ---\n\n```{code_fence}\n{safe_payload}\n```\n\n"
+                    context += section_context
+                    self._component_docs[comp] = self._component_docs.get(comp, '') + section_context
                     if options.get('onRagDoc'):
                         options['onRagDoc']({ 'component': comp, 'section': sec, 'content': payload_str })
                     src_list = result.get('sources') or []
@@ -171,17 +403,17 @@ class CodeGenerator:
     def get_rag_sources(self) -> List[Dict[str, Any]]:
         return self._rag_sources
 
-    async def _compute_scenario_matches(self, bdd_scenarios: str, file_paths: List[str]) -> List[Dict[str, Any]]:
-        prompt = "Given BDD scenarios and a list of project file paths, select up to 3 most relevant file paths for each scenario and return JSON array [{\"scenarioId\":\"...\",\"paths\":[\"...\"]}].\nScenarios JSON:\n" + bdd_scenarios + "\n\nFile paths:\n" + "\n".join(file_paths)
-        resp = await self.llm.invoke([ { 'role': 'user', 'content': prompt } ])
+    async def _compute_scenario_matches(self, bdd_scenarios: str, files: List[Dict[str, Any]], refine: bool = False) -> List[Dict[str, Any]]:
+        scenarios = parse_llm_json(bdd_scenarios, expect='array', site='bdd_input', default=[])
+        matches = ScenarioMatcher(top_k=3).match(scenarios, files)
+        if not refine:
+            return matches
+        refined = await self._refine_scenario_matches(bdd_scenarios, [str(f.get('path')) for f in files if isinstance(f, dict) and f.get('path')], matches)
+        return refined or matches
+
+    async def _refine_scenario_matches(self, bdd_scenarios: str, file_paths: List[str], candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        prompt = "Given BDD scenarios and a list of project file paths, select up to 3 most relevant file paths for each scenario and return JSON array [{\"scenarioId\":\"...\",\"paths\":[\"...\"]}].\nScenarios JSON:\n" + bdd_scenarios + "\n\nFile paths:\n" + "\n".join(file_paths) + "\n\nCandidate matches from lexical similarity (refine them):\n" + json.dumps(candidates, ensure_ascii=False)
+        resp = await self._llm('scenario_match').invoke([ { 'role': 'user', 'content': prompt } ])
         content = resp.get('content') or ''
-        try:
-            import re
-            m = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", content)
-            s = m.group(1) if m else content
-            arr = json.loads(s)
-            if isinstance(arr, list):
-                return [ { 'scenarioId': str(x.get('scenarioId') or x.get('id') or ''), 'paths': [str(p) for p in (x.get('paths') or [])] } for x in arr ]
-        except Exception:
-            pass
-        return []
+        arr = parse_llm_json(content, expect='array', schema={ 'type': 'array', 'items': { 'type': 'object' } }, site='scenario_match', default=[])
+        return [ { 'scenarioId': str(x.get('scenarioId') or x.get('id') or ''), 'paths': [str(p) for p in (x.get('paths') or [])] } for x in arr ]
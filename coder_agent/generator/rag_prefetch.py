@@ -0,0 +1,106 @@
+import asyncio
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.metrics import RAG_PREFETCH
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = { 'speculated': 0, 'hits': 0, 'misses': 0, 'wasted': 0 }
+
+def get_rag_prefetch_stats() -> Dict[str, Any]:
+    """Process-wide prefetch counters; ``hitRate`` is the share of needed doc sections that were already prefetched."""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    needed = stats['hits'] + stats['misses']
+    stats['hitRate'] = round(stats['hits'] / needed, 4) if needed else None
+    return stats
+
+class ComponentDocPrefetch:
+    """Speculative component-doc fetches started before the generator knows which components it will use.
+
+    The component list (``available``) is requested right away. :meth:`speculate` queries the docs of
+    every keyword that names an available component exactly, :meth:`speculate_text` those of the
+    available components a text (e.g. a BDD feature) mentions; each (component, section) is queried once
+    with ``query``, at most ``concurrency`` at a time. The generator takes the docs it needs with
+    :meth:`take` and calls :meth:`finish` to drop the rest.
+    """
+
+    def __init__(self, available: Awaitable[List[str]], query: Callable[[str, str], Awaitable[Dict[str, Any]]], sections: Tuple[str, ...], concurrency: int = 4):
+        self.available = asyncio.ensure_future(available)
+        self.sections = sections
+        self._query = query
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._launchers: List[asyncio.Future] = []
+        self._docs: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._speculated = 0
+        self._hits = 0
+        self._misses = 0
+        self._finished = False
+
+    def speculate(self, keywords: Awaitable[List[str]]) -> None:
+        self._launchers.append(asyncio.ensure_future(self._launch(keywords)))
+
+    def speculate_text(self, text: str) -> None:
+        self._launchers.append(asyncio.ensure_future(self._launch(None, text)))
+
+    async def _launch(self, keywords: Optional[Awaitable[List[str]]], text: Optional[str] = None) -> None:
+        if keywords is not None:
+            keywords, available = await asyncio.gather(keywords, self.available)
+            names = { a.lower() for a in available }
+            components = [k for k in keywords or [] if k.lower() in names]
+        else:
+            available = await self.available
+            components = [a for a in available if re.search(rf"(?<![\w-]){re.escape(a)}(?![\w-])", text or '', re.I)]
+        for comp in dict.fromkeys(components):
+            for sec in self.sections:
+                key = (comp.lower(), sec)
+                if key not in self._docs and not self._finished:
+                    self._docs[key] = asyncio.ensure_future(self._fetch(comp, sec))
+                    self._speculated += 1
+
+    async def _fetch(self, comp: str, sec: str) -> Dict[str, Any]:
+        async with self._semaphore:
+            return await self._query(comp, sec)
+
+    async def ready(self) -> None:
+        """Waits until the speculative queries have been started (not until they have finished)."""
+        await asyncio.gather(*self._launchers, return_exceptions=True)
+
+    def take(self, comp: str, sec: str) -> Optional[asyncio.Future]:
+        """The prefetched query for ``(comp, sec)``, or ``None`` (a miss) when it was not speculated."""
+        future = self._docs.pop((comp.lower(), sec), None)
+        if future is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return future
+
+    def finish(self) -> Dict[str, Any]:
+        """Cancels whatever is still running, discards unused docs and records the counts (once)."""
+        for task in (self.available, *self._launchers, *self._docs.values()):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+        summary = self.summary()
+        if not self._finished:
+            self._finished = True
+            with _stats_lock:
+                for key in ('speculated', 'hits', 'misses', 'wasted'):
+                    _stats[key] += summary[key]
+            for outcome, key in (('hit', 'hits'), ('miss', 'misses'), ('wasted', 'wasted')):
+                if summary[key]:
+                    RAG_PREFETCH.inc(outcome, amount=summary[key])
+        self._docs.clear()
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        needed = self._hits + self._misses
+        return {
+            'speculated': self._speculated,
+            'hits': self._hits,
+            'misses': self._misses,
+            'wasted': len(self._docs),
+            'hitRate': round(self._hits / needed, 4) if needed else None,
+        }
@@ -0,0 +1,99 @@
+import re
+from typing import Any, Dict, List
+
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_EXPORT_RE = re.compile(r"export\s+(?:default\s+)?(?:async\s+)?(?:function|const|let|class|interface|type|enum)\s+([A-Za-z_$][\w$]*)")
+_STOPWORDS = {
+    'src', 'tsx', 'ts', 'jsx', 'js', 'index', 'the', 'a', 'an', 'and', 'or', 'to', 'of', 'in', 'on', 'is', 'be', 'with',
+    'should', 'user', 'i', 'it', 'as', 'for', 'then', 'when', 'given', 'page', 'shows', 'see', 'sees',
+}
+CJK_GLOSSARY = {
+    '登录': 'login', '登陆': 'login', '注册': 'register', '退出': 'logout', '密码': 'password',
+    '列表': 'list', '表格': 'table', '表单': 'form', '搜索': 'search', '查询': 'search', '筛选': 'filter',
+    '详情': 'detail', '编辑': 'edit', '新增': 'create', '创建': 'create', '删除': 'delete', '修改': 'update',
+    '提交': 'submit', '按钮': 'button', '弹窗': 'modal', '对话框': 'dialog', '菜单': 'menu', '导航': 'nav',
+    '首页': 'home', '设置': 'settings', '分页': 'pagination', '上传': 'upload', '下载': 'download', '日期': 'date',
+    '购物车': 'cart', '订单': 'order', '商品': 'product', '支付': 'payment', '评论': 'comment', '消息': 'message',
+    '通知': 'notification', '个人': 'profile', '资料': 'profile', '仪表盘': 'dashboard', '图表': 'chart', '校验': 'validation',
+    '验证': 'validation', '错误': 'error', '提示': 'toast', '路由': 'route', '布局': 'layout', '待办': 'todo', '任务': 'task',
+}
+
+def _is_cjk(token: str) -> bool:
+    return '\u3400' <= token[0] <= '\ufaff'
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for word in _WORD_RE.findall(text or ''):
+        if _is_cjk(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i+2] for i in range(len(word) - 1))
+            for term, english in CJK_GLOSSARY.items():
+                if term in word:
+                    tokens.append(english)
+            continue
+        for part in _CAMEL_RE.findall(word):
+            p = part.lower()
+            if p not in _STOPWORDS and (len(p) > 1 or p.isdigit()):
+                tokens.append(p)
+    return tokens
+
+def _scenario_text(scenario: Dict[str, Any]) -> str:
+    parts = [str(scenario.get('title') or '')]
+    for key in ('given', 'when', 'then'):
+        value = scenario.get(key)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        else:
+            parts.append(str(value or ''))
+    return ' '.join(parts)
+
+def _file_text(file: Dict[str, Any]) -> str:
+    path = str(file.get('path') or '')
+    content = file.get('content')
+    identifiers = _EXPORT_RE.findall(content) if isinstance(content, str) else []
+    stem = path.rsplit('/', 1)[-1].split('.', 1)[0]
+    return ' '.join([path, stem, stem, *identifiers])
+
+class ScenarioMatcher:
+    def __init__(self, top_k: int = 3, min_score: float = 0.0):
+        self.top_k = top_k
+        self.min_score = min_score
+
+    def match(self, scenarios: List[Dict[str, Any]], files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        import numpy as np
+        scenarios = [s for s in scenarios if isinstance(s, dict)]
+        files = [f for f in files if isinstance(f, dict) and f.get('path')]
+        if not scenarios or not files:
+            return []
+        scenario_tokens = [tokenize(_scenario_text(s)) for s in scenarios]
+        file_tokens = [tokenize(_file_text(f)) for f in files]
+        vocab: Dict[str, int] = {}
+        for toks in scenario_tokens + file_tokens:
+            for t in toks:
+                vocab.setdefault(t, len(vocab))
+        if not vocab:
+            return []
+        def counts(docs: List[List[str]]):
+            m = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+            for row, toks in enumerate(docs):
+                for t in toks:
+                    m[row, vocab[t]] += 1.0
+            return m
+        s_tf = counts(scenario_tokens)
+        f_tf = counts(file_tokens)
+        df = (s_tf > 0).sum(axis=0) + (f_tf > 0).sum(axis=0)
+        idf = np.log((1.0 + len(scenarios) + len(files)) / (1.0 + df)) + 1.0
+        def weigh(tf):
+            w = np.log1p(tf) * idf
+            norms = np.linalg.norm(w, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return w / norms
+        sim = weigh(s_tf) @ weigh(f_tf).T
+        k = min(self.top_k, len(files))
+        top = np.argsort(-sim, axis=1, kind='stable')[:, :k]
+        results = []
+        for row, s in enumerate(scenarios):
+            paths = [str(files[col]['path']) for col in top[row] if sim[row, col] > self.min_score]
+            results.append({ 'scenarioId': str(s.get('id') or s.get('scenarioId') or ''), 'paths': paths })
+        return results
@@ -1,7 +1,10 @@
-import json
 from core.llm import BaseChatModel
+from core.json_repair import parse_llm_json
+from coder_agent.core.stage_cache import Fallback
 from coder_agent.config.prompt import CODING_AGENT_PROMPTS
 
+PLAN_SCHEMA = { 'type': 'object', 'required': ['steps'], 'properties': { 'steps': { 'type': 'array', 'minItems': 1, 'items': { 'type': 'object', 'required': ['title'] } } } }
+
 class CodingPlanner:
     def __init__(self, llm: BaseChatModel):
         self.llm = llm
@@ -14,11 +17,10 @@ class CodingPlanner:
         ]
         resp = await self.llm.invoke(messages)
         content = resp.get('content') or ''
-        try:
-            import re
-            m = re.search(r"```json\s*([\s\S]*?)\s*```", content)
-            json_str = m.group(1) if m else content
-            return json.loads(json_str)
-        except Exception:
-            return { 'summary': 'Plan generation failed to parse, proceeding with default plan.', 'steps': [{ 'id': 'step_1', 'title': 'Implement Feature', 'description': input_text }] }
+        plan = parse_llm_json(content, expect='object', schema=PLAN_SCHEMA, site='coding_planner', default=None)
+        if plan is not None:
+            for i, s in enumerate(plan['steps']):
+                s.setdefault('id', f"step_{i+1}")
+            return plan
+        return Fallback({ 'summary': 'Plan generation failed to parse, proceeding with default plan.', 'steps': [{ 'id': 'step_1', 'title': 'Implement Feature', 'description': input_text }] })
 
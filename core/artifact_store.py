@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+def summarize_result(result: Any, max_length: int = 500) -> str:
+    if isinstance(result, dict):
+        project = result.get('project')
+        if isinstance(project, dict) and isinstance(project.get('files'), list):
+            paths = [str(f.get('path')) for f in project['files'] if isinstance(f, dict)]
+            shown = ', '.join(paths[:12]) + (' ...' if len(paths) > 12 else '')
+            return f"project: {len(paths)} files [{shown}]; summary: {project.get('summary') or '(none)'}"[:max_length]
+        features = result.get('features')
+        if isinstance(features, list):
+            titles = [str(f.get('feature_title') or f.get('feature_id')) for f in features if isinstance(f, dict)]
+            scenarios = sum(len(f.get('scenarios') or []) for f in features if isinstance(f, dict))
+            return f"features: {len(features)} ({', '.join(titles)}); scenarios: {scenarios}"[:max_length]
+        plan = result.get('plan')
+        if isinstance(plan, dict) and isinstance(plan.get('steps'), list):
+            return f"plan: {' -> '.join(str(s.get('title')) for s in plan['steps'] if isinstance(s, dict))}"[:max_length]
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+    return text if len(text) <= max_length else text[:max_length] + '...'
+
+class ArtifactStore:
+    """Holds large tool outputs out of band so steps and events can carry a compact reference.
+
+    Artifacts are kept as serialised JSON bytes in memory; once ``max_memory_bytes`` is exceeded the
+    oldest ones are spilled to ``directory`` and read back from disk on demand. Artifacts expire ``ttl``
+    seconds after creation, and the oldest spilled ones are deleted early to keep the directory within
+    ``max_disk_bytes``. Spill files older than ``ttl`` left by earlier processes are removed on start.
+    """
+
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024, directory: Optional[str] = None, ttl: float = 3600.0, max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory or os.environ.get('ARTIFACT_DIR') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.artifacts')
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._remove_stale_files()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def _disk_path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, f"{artifact_id}.json")
+
+    def _remove_stale_files(self) -> None:
+        cutoff = time.time() - self.ttl
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if e.name.endswith('.json') and e.stat().st_mtime < cutoff:
+                        os.remove(e.path)
+        except OSError:
+            pass
+
+    def _drop_locked(self, artifact_id: str, removed: List[str]) -> Optional[Dict[str, Any]]:
+        data = self._memory.pop(artifact_id, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+        meta = self._meta.pop(artifact_id, None)
+        if meta and meta.get('spilled'):
+            self._disk_bytes -= meta['size']
+            removed.append(self._disk_path(artifact_id))
+        return meta
+
+    def _evict_locked(self, removed: List[str]) -> None:
+        """Drops expired artifacts, then the oldest spilled ones while the spill directory is over budget (``_meta`` is in creation order)."""
+        cutoff = int((time.time() - self.ttl) * 1000)
+        while self._meta:
+            artifact_id, meta = next(iter(self._meta.items()))
+            if meta['createdAt'] >= cutoff and (self._disk_bytes <= self.max_disk_bytes or not meta.get('spilled')):
+                break
+            self._drop_locked(artifact_id, removed)
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def put_serialized(self, data: bytes, summary: str = '', kind: str = 'tool_result', session_id: Optional[str] = None) -> Dict[str, Any]:
+        artifact_id = uuid.uuid4().hex
+        ref = { 'artifactId': artifact_id, 'kind': kind, 'size': len(data), 'summary': summary, 'url': f"/api/artifacts/{artifact_id}" }
+        removed: List[str] = []
+        with self._lock:
+            self._memory[artifact_id] = data
+            self._memory_bytes += len(data)
+            self._meta[artifact_id] = { **ref, 'sessionId': session_id, 'createdAt': int(time.time()*1000) }
+            self._spill_locked()
+            self._evict_locked(removed)
+        self._remove_files(removed)
+        return ref
+
+    def put(self, value: Any, summary: Optional[str] = None, kind: str = 'tool_result', session_id: Optional[str] = None) -> Dict[str, Any]:
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        return self.put_serialized(data, summary if summary is not None else summarize_result(value), kind, session_id)
+
+    def _spill_locked(self) -> None:
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            artifact_id, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._disk_path(artifact_id), 'wb') as f:
+                    f.write(data)
+                self._meta[artifact_id]['spilled'] = True
+                self._disk_bytes += len(data)
+            except Exception:
+                self._meta.pop(artifact_id, None)
+
+    def meta(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        removed: List[str] = []
+        with self._lock:
+            self._evict_locked(removed)
+            meta = self._meta.get(artifact_id)
+        self._remove_files(removed)
+        return meta
+
+    def get_bytes(self, artifact_id: str) -> Optional[bytes]:
+        if self.meta(artifact_id) is None:
+            return None
+        with self._lock:
+            data = self._memory.get(artifact_id)
+        if data is not None:
+            return data
+        try:
+            with open(self._disk_path(artifact_id), 'rb') as f:
+                return f.read()
+        except Exception:
+            return None
+
+    def get(self, artifact_id: str) -> Any:
+        data = self.get_bytes(artifact_id)
+        return None if data is None else json.loads(data.decode('utf-8'))
+
+    def iter_chunks(self, artifact_id: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        with self._lock:
+            data = self._memory.get(artifact_id)
+        if data is not None:
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i+chunk_size]
+            return
+        with open(self._disk_path(artifact_id), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete(self, artifact_id: str) -> bool:
+        removed: List[str] = []
+        with self._lock:
+            meta = self._drop_locked(artifact_id, removed)
+        self._remove_files(removed)
+        return meta is not None
+
+default_artifact_store = ArtifactStore(ttl=float(os.environ.get('ARTIFACT_TTL', '3600')))
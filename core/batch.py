@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from core.cancellation import CancelToken, OperationCancelled
+from core.llm import BaseChatModel
+from core.metrics import BATCH_ITEMS
+from core.priority import batch_priority
+from core.react_agent import AgentTemplate, ReActAgent
+from core.stream_manager import StreamEvent
+
+class EventSummary:
+    """``onStream`` collector keeping per-type event counts and one entry per finished tool call."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.tools: List[Dict[str, Any]] = []
+
+    def __call__(self, e: StreamEvent) -> None:
+        event = e.event
+        kind = event.get('type') or 'unknown'
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        data = event.get('data') if isinstance(event.get('data'), dict) else {}
+        if kind == 'tool_call_event' and data.get('status') == 'end':
+            self.tools.append({ 'tool': data.get('tool_name'), 'success': data.get('success'), 'durationMs': data.get('durationMs') })
+
+    def to_dict(self) -> Dict[str, Any]:
+        return { 'counts': self.counts, 'tools': self.tools }
+
+async def run_batch(items: List[Dict[str, Any]], config: Dict[str, Any], concurrency: int = 4, time_budget: Optional[float] = None, cancel_token: Optional[CancelToken] = None, events: bool = True, llm: Optional[BaseChatModel] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Runs ``items`` (``{ 'id', 'prompt' }``) through ReAct agents and yields one record per item as it completes.
+
+    ``concurrency`` workers each own one agent cloned from an :class:`AgentTemplate` of ``config`` (so they
+    share its LLM client) and take items in order. Every LLM call runs at batch priority (see :mod:`core.priority`). A failing
+    or timed-out item yields ``ok: False`` with its error and the batch continues; ``time_budget``
+    applies per item. Closing the iterator cancels the remaining work through ``cancel_token``.
+    """
+    token = cancel_token or CancelToken()
+    template = AgentTemplate(config, llm=llm)
+    pending: asyncio.Queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        pending.put_nowait((index, item))
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def run_item(agent: ReActAgent, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        summary = EventSummary()
+        started = time.perf_counter()
+        record: Dict[str, Any] = { 'type': 'item', 'index': index, 'id': item.get('id') or str(index) }
+        try:
+            result = await agent.run_with_session(item['prompt'], { 'sessionId': f"batch_{record['id']}_{int(time.time()*1000)}", 'onStream': summary, 'cancelToken': token.child(time_budget) })
+            record.update({ 'ok': True, 'finalAnswer': result['finalAnswer'], 'isPaused': result['isPaused'], 'usage': result.get('usage'), 'iterationWaste': result.get('iterationWaste') })
+            agent.session_states.pop(result['sessionId'], None)
+        except OperationCancelled as e:
+            if token.cancelled:
+                raise
+            record.update({ 'ok': False, 'error': f"cancelled: {e.reason}" })
+        except Exception as e:
+            record.update({ 'ok': False, 'error': str(e) or type(e).__name__ })
+        record['durationMs'] = int((time.perf_counter() - started) * 1000)
+        if events:
+            record['events'] = summary.to_dict()
+        BATCH_ITEMS.inc('ok' if record['ok'] else 'failed')
+        return record
+
+    async def worker() -> None:
+        agent = template.clone()
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await done.put(await run_item(agent, index, item))
+
+    with batch_priority():
+        workers = [asyncio.ensure_future(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    finished = asyncio.ensure_future(asyncio.gather(*workers))
+    finished.add_done_callback(lambda _: done.put_nowait(None))
+    try:
+        while True:
+            record = await done.get()
+            if record is None:
+                break
+            yield record
+        await finished
+    finally:
+        if not finished.done():
+            token.cancel('client_disconnected')
+            for w in workers:
+                w.cancel()
+        await asyncio.gather(finished, return_exceptions=True)
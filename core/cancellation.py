@@ -0,0 +1,217 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+class OperationCancelled(asyncio.CancelledError):
+    """Raised inside a run whose :class:`CancelToken` was cancelled.
+
+    Subclasses :class:`asyncio.CancelledError` so the ``except Exception`` fallbacks of the
+    individual stages do not swallow it and keep the run going.
+    """
+
+    def __init__(self, reason: str = 'cancelled'):
+        super().__init__(reason)
+        self.reason = reason
+
+class DeadlineExceeded(OperationCancelled):
+    def __init__(self, reason: str = 'deadline'):
+        super().__init__(reason)
+
+class CancelToken:
+    """Cancellation flag plus optional wall-clock deadline for one run.
+
+    The active token is carried in a context variable (see :func:`use_token`), so nested agents and
+    tasks created from a run inherit it. :meth:`run` awaits an awaitable in the calling task and
+    cancels it (and so the upstream request) as soon as the token is cancelled or its deadline passes.
+    """
+
+    def __init__(self, time_budget: Optional[float] = None, parent: Optional['CancelToken'] = None):
+        deadline = time.monotonic() + time_budget if time_budget else None
+        if parent is not None and parent.deadline is not None:
+            deadline = parent.deadline if deadline is None else min(deadline, parent.deadline)
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[str], Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._scopes = 0
+        if parent is not None:
+            if parent.reason is not None:
+                self.reason = parent.reason
+            else:
+                parent.add_callback(self.cancel)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def child(self, time_budget: Optional[float] = None) -> 'CancelToken':
+        return CancelToken(time_budget, parent=self)
+
+    def add_callback(self, callback: Callable[[str], Any]) -> Callable[[], None]:
+        self._callbacks.append(callback)
+        def remove():
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+        return remove
+
+    def cancel(self, reason: str = 'cancelled') -> None:
+        if self.reason is not None:
+            return
+        self.reason = reason
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for callback in list(self._callbacks):
+            try:
+                callback(reason)
+            except Exception:
+                pass
+        self._callbacks.clear()
+
+    def check(self) -> None:
+        if self.reason is None and self.expired():
+            self.cancel('deadline')
+        if self.reason == 'deadline':
+            raise DeadlineExceeded()
+        if self.reason is not None:
+            raise OperationCancelled(self.reason)
+
+    def _arm_deadline(self, loop: asyncio.AbstractEventLoop) -> None:
+        # One timer, held while any scope is open, turns the deadline into a cancel() that the scopes observe.
+        self._scopes += 1
+        if self._timer is None and self.deadline is not None and self.reason is None:
+            self._timer = loop.call_later(max(0.0, self.deadline - time.monotonic()), self.cancel, 'deadline')
+
+    def _disarm_deadline(self) -> None:
+        # Cancelled with the last open scope, so a finished run's token is not kept alive until its deadline.
+        self._scopes -= 1
+        if self._scopes == 0 and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def scope(self) -> '_CancelScope':
+        """Context manager cancelling the current task if the token fires inside it; the resulting
+        :class:`asyncio.CancelledError` leaves the block as :class:`OperationCancelled`."""
+        return _CancelScope(self)
+
+    async def run(self, aw: Awaitable[Any]) -> Any:
+        if self.reason is not None or self.expired():
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            self.check()
+        with _CancelScope(self):
+            return await aw
+
+class _CancelScope:
+    __slots__ = ('token', 'task', 'loop', 'active', 'fired', 'remove')
+
+    def __init__(self, token: CancelToken):
+        self.token = token
+        self.active = False
+        self.fired = False
+
+    def __enter__(self) -> '_CancelScope':
+        self.token.check()
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.token._arm_deadline(self.loop)
+        self.active = True
+        self.remove = self.token.add_callback(self._fire)
+        return self
+
+    def _fire(self, reason: str) -> None:
+        # Deferred so the task is suspended (at an await inside the block) when it is cancelled.
+        self.loop.call_soon_threadsafe(self._cancel)
+
+    def _cancel(self) -> None:
+        if self.active and not self.task.done():
+            self.fired = True
+            self.task.cancel()
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.active = False
+        self.remove()
+        self.token._disarm_deadline()
+        if self.fired:
+            uncancel = getattr(self.task, 'uncancel', None)
+            uncancel and uncancel()
+            if exc_type is None or (issubclass(exc_type, asyncio.CancelledError) and not isinstance(exc, OperationCancelled)):
+                self.token.check()
+        return False
+
+_current_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar('cancel_token', default=None)
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+@contextmanager
+def use_token(token: Optional[CancelToken]):
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+def scoped_token(token: Optional[CancelToken] = None, time_budget: Optional[float] = None) -> Optional[CancelToken]:
+    """Returns the token a run should execute under: ``token`` (or the current one), narrowed by ``time_budget``."""
+    base = token or current_token()
+    if not time_budget:
+        return base
+    return base.child(time_budget) if base is not None else CancelToken(time_budget)
+
+def check_cancelled() -> None:
+    token = current_token()
+    if token is not None:
+        token.check()
+
+def remaining_budget() -> Optional[float]:
+    token = current_token()
+    return token.remaining() if token is not None else None
+
+def budget_below(seconds: float) -> bool:
+    remaining = remaining_budget()
+    return remaining is not None and remaining < seconds
+
+async def guard(aw: Awaitable[Any]) -> Any:
+    token = current_token()
+    if token is None:
+        return await aw
+    return await token.run(aw)
+
+async def guard_iter(agen: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Iterates ``agen`` under the current token, closing it (and its upstream stream) on cancellation."""
+    token = current_token()
+    if token is None:
+        async for item in agen:
+            yield item
+        return
+    finished = False
+    token._arm_deadline(asyncio.get_running_loop())
+    try:
+        while True:
+            try:
+                with _CancelScope(token):
+                    item = await agen.__anext__()
+            except StopAsyncIteration:
+                finished = True
+                break
+            yield item
+    finally:
+        token._disarm_deadline()
+        if not finished and hasattr(agen, 'aclose'):
+            try:
+                await agen.aclose()
+            except Exception:
+                pass
@@ -0,0 +1,284 @@
+"""Multi-process serving: agent workers on unix sockets behind a session-affine front router.
+
+    WORKERS=4 python server.py
+
+Every worker is a full ``server:app`` uvicorn process listening on its own unix socket. The router
+process owns the public port and forwards each request, streaming the response back (SSE and NDJSON
+included). Requests carrying a session (``sessionId`` query parameter or ``/run`` body field,
+``/api/usage/{sessionId}``) go to the worker that owns it on a consistent-hash ring, so paused sessions
+stay resumable. Stream and ``/run`` requests without a ``sessionId`` get one assigned by the router;
+other requests are spread round-robin. ``/health``, ``/api/stats`` and ``/metrics`` aggregate all workers.
+"""
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOP_HEADERS = frozenset(('connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade', 'proxy-authenticate', 'proxy-authorization'))
+SESSION_PATH = re.compile(r'^/api/usage/([^/]+)$')
+ASSIGN_SESSION_PATHS = ('/api/agent/stream', '/api/coding-agent/stream')
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?(\s+.*)$')
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+def new_session_id() -> str:
+    return f"sess_{int(time.time()*1000)}_{uuid.uuid4().hex[:6]}"
+
+class HashRing:
+    """Consistent-hash ring over worker indexes; ``replicas`` virtual points per worker even out the spread."""
+
+    def __init__(self, nodes: int, replicas: int = 64):
+        points = sorted((_hash(f"worker-{node}#{i}"), node) for node in range(nodes) for i in range(replicas))
+        self._points = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node_for(self, key: str) -> int:
+        return self._nodes[bisect.bisect(self._points, _hash(key)) % len(self._points)]
+
+def merge_metrics(texts: List[Tuple[int, str]]) -> str:
+    """Merges Prometheus text from several workers into one exposition, adding a ``worker`` label to every sample."""
+    families: 'OrderedDict[str, Dict[str, List[str]]]' = OrderedDict()
+    for worker, text in texts:
+        family: Optional[Dict[str, List[str]]] = None
+        for line in text.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                name = line.split()[2]
+                family = families.setdefault(name, { 'meta': [], 'samples': [] })
+                if line not in family['meta']:
+                    family['meta'].append(line)
+                continue
+            match = _SAMPLE.match(line)
+            if not match:
+                continue
+            name, labels, rest = match.groups()
+            if family is None:
+                family = families.setdefault(name, { 'meta': [], 'samples': [] })
+            label = f'worker="{worker}"'
+            family['samples'].append(f"{name}{{{label}{',' + labels if labels else ''}}}{rest}")
+    lines: List[str] = []
+    for family in families.values():
+        lines.extend(family['meta'])
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + '\n'
+
+class ClusterRouter:
+    """ASGI front router forwarding requests to the worker that owns their session."""
+
+    def __init__(self, sockets: List[str], replicas: int = 64):
+        self.sockets = sockets
+        self.ring = HashRing(len(sockets), replicas)
+        self.clients = [httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path), base_url='http://worker', timeout=httpx.Timeout(None, connect=10.0)) for path in sockets]
+        self._round_robin = itertools.count()
+        self.app = Starlette(routes=[
+            Route('/health', self.health),
+            Route('/api/stats', self.stats),
+            Route('/metrics', self.metrics),
+            Route('/{path:path}', self.route, methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'HEAD']),
+        ], lifespan=self.lifespan)
+        self.on_startup: List[Any] = []
+        self.on_shutdown: List[Any] = []
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app: Starlette) -> AsyncIterator[None]:
+        for hook in self.on_startup:
+            await hook()
+        try:
+            yield
+        finally:
+            await asyncio.gather(*(client.aclose() for client in self.clients))
+            for hook in self.on_shutdown:
+                await hook()
+
+    def worker_for(self, session_id: Optional[str]) -> int:
+        return self.ring.node_for(session_id) if session_id else next(self._round_robin) % len(self.clients)
+
+    async def route(self, request: Request) -> Response:
+        path = request.url.path
+        params = request.query_params.multi_items()
+        body = await request.body()
+        if path.startswith('/api/artifacts/'):
+            return await self._first_found(request, params, body)
+        session_id = request.query_params.get('sessionId')
+        match = SESSION_PATH.match(path)
+        if match:
+            session_id = match.group(1)
+        elif not session_id and path in ASSIGN_SESSION_PATHS:
+            session_id = new_session_id()
+            params.append(('sessionId', session_id))
+        elif path == '/run' and request.method == 'POST':
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                if not data.get('sessionId'):
+                    data['sessionId'] = new_session_id()
+                    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                session_id = str(data['sessionId'])
+        worker = self.worker_for(session_id)
+        response = await self._send(worker, request, params, body)
+        if response is None:
+            return JSONResponse({ 'detail': f'worker {worker} unavailable' }, status_code=502)
+        return self._relay(worker, response)
+
+    async def _send(self, worker: int, request: Request, params: List[Tuple[str, str]], body: bytes) -> Optional[httpx.Response]:
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS and k.lower() not in ('host', 'content-length')]
+        if request.client:
+            headers.append(('x-forwarded-for', request.client.host))
+        client = self.clients[worker]
+        upstream = client.build_request(request.method, request.url.path, params=params, headers=headers, content=body)
+        try:
+            return await client.send(upstream, stream=True)
+        except httpx.TransportError:
+            return None
+
+    def _relay(self, worker: int, response: httpx.Response) -> Response:
+        async def body() -> AsyncIterator[bytes]:
+            # Closing the upstream response on client disconnect lets the worker cancel the run.
+            try:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+            finally:
+                await response.aclose()
+        headers = { k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS and k.lower() not in ('date', 'server') }
+        headers['x-agent-worker'] = str(worker)
+        return StreamingResponse(body(), status_code=response.status_code, headers=headers)
+
+    async def _first_found(self, request: Request, params: List[Tuple[str, str]], body: bytes) -> Response:
+        """Artifacts live in the memory of the worker that produced them; asks each worker in turn."""
+        for worker in range(len(self.clients)):
+            response = await self._send(worker, request, params, body)
+            if response is None:
+                continue
+            if response.status_code != 404 or worker == len(self.clients) - 1:
+                return self._relay(worker, response)
+            await response.aclose()
+        return JSONResponse({ 'detail': 'artifact not found' }, status_code=404)
+
+    async def _get_all(self, path: str) -> List[Optional[httpx.Response]]:
+        async def get(client: httpx.AsyncClient) -> Optional[httpx.Response]:
+            try:
+                return await client.get(path, timeout=10.0)
+            except httpx.TransportError:
+                return None
+        return await asyncio.gather(*(get(client) for client in self.clients))
+
+    async def health(self, request: Request) -> Response:
+        workers = [r is not None and r.status_code == 200 for r in await self._get_all('/health')]
+        return JSONResponse({ 'ok': all(workers), 'workers': workers }, status_code=200 if all(workers) else 503)
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse({ 'workers': [r.json() if r is not None and r.status_code == 200 else None for r in await self._get_all('/api/stats')] })
+
+    async def metrics(self, request: Request) -> Response:
+        responses = await self._get_all('/metrics')
+        text = merge_metrics([(i, r.text) for i, r in enumerate(responses) if r is not None and r.status_code == 200])
+        return PlainTextResponse(text, media_type='text/plain; version=0.0.4')
+
+class WorkerPool:
+    """``count`` uvicorn worker processes serving ``app`` on unix sockets in ``directory``; exited workers are restarted."""
+
+    def __init__(self, app: str, count: int, directory: str):
+        self.app = app
+        self.directory = directory
+        self.sockets = [os.path.join(directory, f'worker-{i}.sock') for i in range(count)]
+        self.procs: List[Optional[subprocess.Popen]] = [None] * count
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for index in range(len(self.sockets)):
+            self._spawn(index)
+
+    def _spawn(self, index: int) -> None:
+        path = self.sockets[index]
+        if os.path.exists(path):
+            os.unlink(path)
+        env = { **os.environ, 'WORKER_INDEX': str(index) }
+        command = [sys.executable, '-m', 'uvicorn', self.app, '--uds', path, '--log-level', os.environ.get('WORKER_LOG_LEVEL') or 'warning']
+        self.procs[index] = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+    async def wait_ready(self, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        for index, path in enumerate(self.sockets):
+            async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path), base_url='http://worker') as client:
+                while True:
+                    proc = self.procs[index]
+                    if proc is not None and proc.poll() is not None:
+                        raise RuntimeError(f'worker {index} exited with code {proc.returncode}')
+                    try:
+                        if (await client.get('/health', timeout=2.0)).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f'worker {index} not ready after {timeout:.0f}s')
+                    await asyncio.sleep(0.1)
+
+    async def supervise(self, interval: float = 1.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for index, proc in enumerate(self.procs):
+                if proc is not None and proc.poll() is not None:
+                    print(f'worker {index} exited with code {proc.returncode}; restarting (its sessions are lost)', file=sys.stderr)
+                    self._spawn(index)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        for proc in self.procs:
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+        for proc in self.procs:
+            if proc is None:
+                continue
+            try:
+                proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for path in self.sockets:
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+        with contextlib.suppress(OSError):
+            os.rmdir(self.directory)
+
+def serve_cluster(app: str, workers: int, host: str, port: int) -> None:
+    """Runs ``workers`` processes of ``app`` plus the front router on ``host:port`` until interrupted."""
+    import uvicorn
+    pool = WorkerPool(app, workers, os.environ.get('WORKER_SOCKET_DIR') or tempfile.mkdtemp(prefix='agent-workers-'))
+    router = ClusterRouter(pool.sockets)
+    supervisor: List[asyncio.Task] = []
+
+    async def start_workers() -> None:
+        await pool.wait_ready()
+        supervisor.append(asyncio.create_task(pool.supervise()))
+
+    async def stop_workers() -> None:
+        # uvicorn re-raises the signal that stopped it after shutdown, so the workers go down here.
+        for task in supervisor:
+            task.cancel()
+        await asyncio.to_thread(pool.stop)
+
+    router.on_startup.append(start_workers)
+    router.on_shutdown.append(stop_workers)
+    pool.start()
+    try:
+        uvicorn.run(router.app, host=host, port=port, log_level=os.environ.get('ROUTER_LOG_LEVEL') or 'info')
+    finally:
+        pool.stop()
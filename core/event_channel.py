@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from core.cancellation import guard
+from core.metrics import Counter, SSE_QUEUE_DEPTH, SSE_QUEUE_WAIT_SECONDS
+from core.stream_manager import StreamEvent
+
+SSE_COALESCED = Counter('agent_sse_coalesced_total', 'Delta events merged into a pending delta because the consumer lagged.', ('endpoint',))
+
+def is_delta(event: StreamEvent) -> bool:
+    """Streamed text chunks (``normal_event`` with ``stream`` and no ``done``) may be merged; everything else is control."""
+    e = event.event
+    return e.get('type') == 'normal_event' and bool(e.get('stream')) and not e.get('done') and isinstance(e.get('content'), str)
+
+def _utf8_len(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+class _Entry:
+    __slots__ = ('event', 'enqueued_at', 'size')
+
+    def __init__(self, event: StreamEvent, size: int):
+        self.event = event
+        self.enqueued_at = time.perf_counter()
+        self.size = size
+
+class EventChannel:
+    """Bounded single-consumer channel between a running agent and its reader.
+
+    :meth:`put` is synchronous so it can serve as an agent's ``onStream`` callback. While the reader
+    lags, a delta is merged into the pending delta with the same event id at the tail of the buffer;
+    control events (plans, tool calls, waiting, done) are always kept. Once more than ``max_events``
+    entries or ``max_bytes`` of delta text (UTF-8 encoded) are pending, producers pause in :func:`flow_control`
+    until the reader has drained the buffer to half of that.
+    """
+
+    def __init__(self, max_events: int = 256, max_bytes: int = 256 * 1024, label: Optional[str] = None):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.label = label
+        self._buffer: Deque[_Entry] = deque()
+        self._bytes = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def over_limit(self) -> bool:
+        return len(self._buffer) > self.max_events or self._bytes > self.max_bytes
+
+    def put(self, event: StreamEvent) -> None:
+        if self._closed:
+            return
+        if is_delta(event):
+            tail = self._buffer[-1] if self._buffer else None
+            content = event.event['content']
+            if tail is not None and is_delta(tail.event) and tail.event.event.get('id') == event.event.get('id'):
+                merged = { **tail.event.event, 'content': tail.event.event['content'] + content }
+                tail.event = StreamEvent(sessionId=tail.event.sessionId, conversationId=tail.event.conversationId, event=merged, timestamp=event.timestamp)
+                size = _utf8_len(content)
+                tail.size += size
+                self._bytes += size
+                self.coalesced += 1
+                if self.label:
+                    SSE_COALESCED.inc(self.label)
+                if self._bytes > self.max_bytes:
+                    self._writable.clear()
+                return
+            entry = _Entry(event, _utf8_len(content))
+        else:
+            entry = _Entry(event, 0)
+        self._buffer.append(entry)
+        self._bytes += entry.size
+        if self.over_limit():
+            self._writable.clear()
+        self._readable.set()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Ends the stream after the buffered events; ``error`` is raised to the reader once drained."""
+        if self._closed:
+            return
+        self._closed = True
+        self._error = error
+        self._readable.set()
+        self._writable.set()
+
+    async def get(self) -> StreamEvent:
+        while not self._buffer:
+            if self._closed:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+            self._readable.clear()
+            await self._readable.wait()
+        entry = self._buffer.popleft()
+        self._bytes -= entry.size
+        if not self._buffer and not self._closed:
+            self._readable.clear()
+        if not self._writable.is_set() and len(self._buffer) <= self.max_events // 2 and self._bytes <= self.max_bytes // 2:
+            self._writable.set()
+        if self.label:
+            SSE_QUEUE_DEPTH.set(len(self._buffer), self.label)
+            SSE_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - entry.enqueued_at, self.label)
+        return entry.event
+
+    def __aiter__(self) -> AsyncIterator[StreamEvent]:
+        return self
+
+    async def __anext__(self) -> StreamEvent:
+        return await self.get()
+
+    async def wait_writable(self) -> None:
+        if not self._writable.is_set():
+            await self._writable.wait()
+
+_current_channel: contextvars.ContextVar[Optional[EventChannel]] = contextvars.ContextVar('event_channel', default=None)
+
+@contextmanager
+def use_channel(channel: Optional[EventChannel]):
+    reset = _current_channel.set(channel)
+    try:
+        yield channel
+    finally:
+        _current_channel.reset(reset)
+
+async def flow_control() -> None:
+    """Pauses the calling producer while the current run's channel is over its limits."""
+    channel = _current_channel.get()
+    if channel is not None and not channel._writable.is_set():
+        await guard(channel.wait_writable())
+
+def done_event(result: Dict[str, Any]) -> StreamEvent:
+    now = int(time.time()*1000)
+    return StreamEvent(sessionId=result.get('sessionId') or 'default', conversationId=result.get('conversationId') or 'default', event={ 'id': f"done_{now}", 'role': 'assistant', 'type': 'done', 'data': result }, timestamp=now)
+
+async def stream_events(run: Callable[[Callable[[StreamEvent], None]], Awaitable[Dict[str, Any]]], channel: EventChannel, on_cancel: Optional[Callable[[], None]] = None) -> AsyncIterator[StreamEvent]:
+    """Runs ``run(on_stream)`` in a task feeding ``channel`` and yields its events, then a ``done`` event.
+
+    The ``done`` event carries the run's result as ``data``; an exception of the run is raised to the
+    reader after the events emitted before it. Leaving the iteration early (e.g. on client disconnect)
+    calls ``on_cancel`` (typically cancelling the run's token) and cancels the task.
+    """
+    async def produce() -> None:
+        try:
+            with use_channel(channel):
+                result = await run(channel.put)
+        except BaseException as e:
+            channel.close(e)
+            return
+        channel.put(done_event(result or {}))
+        channel.close()
+
+    task = asyncio.ensure_future(produce())
+    try:
+        async for event in channel:
+            yield event
+    finally:
+        if not task.done():
+            channel.close()
+            if on_cancel is not None:
+                on_cancel()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,241 @@
+import asyncio
+import copy
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from core.llm import BaseChatModel
+
+class LatencyHistogram:
+    """Rolling window of observed latencies (seconds) used to derive the hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self._samples: 'deque[float]' = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+        return ordered[idx]
+
+_stats_lock = threading.Lock()
+_histograms: Dict[str, LatencyHistogram] = {}
+_decisions: Dict[str, 'deque[bool]'] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+def _histogram(key: str) -> LatencyHistogram:
+    with _stats_lock:
+        return _histograms.setdefault(key, LatencyHistogram())
+
+def _count(key: str, outcome: str) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(key, { 'requests': 0, 'hedged': 0, 'primary_wins': 0, 'hedge_wins': 0, 'fallback_on_error': 0, 'errors': 0 })
+        entry[outcome] += 1
+
+def get_hedge_stats() -> Dict[str, Dict[str, Any]]:
+    with _stats_lock:
+        out: Dict[str, Dict[str, Any]] = {}
+        for key, entry in _stats.items():
+            hist = _histograms.get(key)
+            out[key] = { **entry, 'samples': len(hist) if hist else 0, 'p50': hist.percentile(0.5) if hist else None, 'p95': hist.percentile(0.95) if hist else None }
+        return out
+
+def reset_hedge_stats() -> None:
+    with _stats_lock:
+        _histograms.clear()
+        _decisions.clear()
+        _stats.clear()
+
+class HedgedLLM(BaseChatModel):
+    """Wraps a model so a slow request is hedged with a duplicate or fallback-model request.
+
+    If the primary has not answered (``invoke``) or produced its first chunk (``stream``) within the
+    ``percentile`` latency of recent calls for that model and purpose (see :meth:`for_purpose`), a second
+    request is started and the first to answer wins; the loser is cancelled. At most ``max_hedge_rate``
+    of recent requests are hedged. Until ``min_samples`` latencies are known, ``default_delay`` is used.
+    """
+
+    def __init__(self, primary: BaseChatModel, fallback: Optional[BaseChatModel] = None, percentile: float = 0.95, max_hedge_rate: float = 0.1, min_delay: float = 0.5, max_delay: float = 30.0, default_delay: float = 10.0, min_samples: int = 20):
+        self.primary = primary
+        self.fallback = fallback
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.model_name = getattr(primary, 'model_name', None) or type(primary).__name__
+        self.purpose: Optional[str] = None
+
+    def for_purpose(self, purpose: str) -> 'HedgedLLM':
+        """A view keeping separate latency statistics for ``purpose``; short and long calls do not share a hedge delay."""
+        view = copy.copy(self)
+        view.purpose = purpose
+        return view
+
+    def _key(self, kind: str) -> str:
+        return f"{self.model_name}:{self.purpose}:{kind}" if self.purpose else f"{self.model_name}:{kind}"
+
+    def hedge_delay(self, kind: str) -> float:
+        hist = _histogram(self._key(kind))
+        if len(hist) < self.min_samples:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, hist.percentile(self.percentile) or self.default_delay))
+
+    def _admit_hedge(self, kind: str) -> bool:
+        with _stats_lock:
+            window = _decisions.setdefault(self._key(kind), deque(maxlen=200))
+            allowed = (sum(window) + 1) / (len(window) + 1) <= self.max_hedge_rate
+            window.append(allowed)
+            return allowed
+
+    def _record_unhedged(self, kind: str) -> None:
+        with _stats_lock:
+            _decisions.setdefault(self._key(kind), deque(maxlen=200)).append(False)
+
+    async def invoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        key = self._key('invoke')
+        _count(key, 'requests')
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.primary.invoke(messages))
+        try:
+            done, _ = await asyncio.wait({ primary }, timeout=self.hedge_delay('invoke'))
+        except BaseException:
+            primary.cancel()
+            raise
+        if done or not self._admit_hedge('invoke'):
+            if done:
+                self._record_unhedged('invoke')
+            try:
+                result = await primary
+            except Exception:
+                if self.fallback is None:
+                    _count(key, 'errors')
+                    raise
+                _count(key, 'fallback_on_error')
+                return await self.fallback.invoke(messages)
+            _histogram(key).record(time.monotonic() - started)
+            _count(key, 'primary_wins')
+            return result
+        _count(key, 'hedged')
+        hedge_started = time.monotonic()
+        hedge = asyncio.ensure_future((self.fallback or self.primary).invoke(messages))
+        pending = { primary, hedge }
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    winner_is_hedge = task is hedge
+                    _histogram(key).record(time.monotonic() - (hedge_started if winner_is_hedge else started))
+                    _count(key, 'hedge_wins' if winner_is_hedge else 'primary_wins')
+                    return task.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+        _count(key, 'errors')
+        raise error
+
+    async def stream(self, messages: List[Dict[str, Any]]):
+        key = self._key('stream')
+        _count(key, 'requests')
+        started = time.monotonic()
+        primary_iter = self.primary.stream(messages).__aiter__()
+        primary_first = asyncio.ensure_future(primary_iter.__anext__())
+        hedge_iter = None
+        hedge_first = None
+        winner_iter = None
+        first_chunk = None
+        try:
+            done, _ = await asyncio.wait({ primary_first }, timeout=self.hedge_delay('stream'))
+            if done or not self._admit_hedge('stream'):
+                if done:
+                    self._record_unhedged('stream')
+                try:
+                    first_chunk = await primary_first
+                except StopAsyncIteration:
+                    _count(key, 'primary_wins')
+                    return
+                except Exception:
+                    if self.fallback is None:
+                        _count(key, 'errors')
+                        raise
+                    _count(key, 'fallback_on_error')
+                    async for chunk in self.fallback.stream(messages):
+                        yield chunk
+                    return
+                _histogram(key).record(time.monotonic() - started)
+                _count(key, 'primary_wins')
+                winner_iter = primary_iter
+            else:
+                _count(key, 'hedged')
+                hedge_started = time.monotonic()
+                hedge_iter = (self.fallback or self.primary).stream(messages).__aiter__()
+                hedge_first = asyncio.ensure_future(hedge_iter.__anext__())
+                pending = { primary_first, hedge_first }
+                error: Optional[BaseException] = None
+                while pending and winner_iter is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        exc = task.exception()
+                        if exc is not None and not isinstance(exc, StopAsyncIteration):
+                            error = exc
+                            continue
+                        winner_is_hedge = task is hedge_first
+                        _histogram(key).record(time.monotonic() - (hedge_started if winner_is_hedge else started))
+                        _count(key, 'hedge_wins' if winner_is_hedge else 'primary_wins')
+                        winner_iter = hedge_iter if winner_is_hedge else primary_iter
+                        first_chunk = None if exc is not None else task.result()
+                        break
+                if winner_iter is None:
+                    _count(key, 'errors')
+                    raise error
+                if first_chunk is None:
+                    return
+            for task, it in ((primary_first, primary_iter), (hedge_first, hedge_iter)):
+                if it is not None and it is not winner_iter:
+                    await self._discard(task, it)
+            yield first_chunk
+            async for chunk in winner_iter:
+                yield chunk
+        finally:
+            for task, it in ((primary_first, primary_iter), (hedge_first, hedge_iter)):
+                if it is not None:
+                    await self._discard(task, it)
+
+    async def _discard(self, first: 'asyncio.Future[Any]', it: Any) -> None:
+        if not first.done():
+            first.cancel()
+            try:
+                await first
+            except BaseException:
+                pass
+        if hasattr(it, 'aclose'):
+            try:
+                await it.aclose()
+            except Exception:
+                pass
+
+def with_hedging(llm: BaseChatModel, config: Any, fallback_factory=None) -> BaseChatModel:
+    """Wraps ``llm`` in :class:`HedgedLLM` when ``config.hedging`` is enabled."""
+    if not getattr(config, 'hedging', False):
+        return llm
+    fallback = None
+    if config.hedgeFallbackModel and fallback_factory is not None:
+        try:
+            fallback = fallback_factory(config.hedgeFallbackModel)
+        except Exception:
+            fallback = None
+    return HedgedLLM(llm, fallback, percentile=config.hedgePercentile, max_hedge_rate=config.hedgeMaxRate)
@@ -0,0 +1,293 @@
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+_MISSING = object()
+_CLOSERS = {'{': '}', '[': ']'}
+_DELIMS = ',}]:'
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null', 'true': 'true', 'false': 'false', 'null': 'null'}
+
+class JsonRepairError(ValueError):
+    pass
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+def _count(site: str, outcome: str) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(site, { 'clean': 0, 'extracted': 0, 'repaired': 0, 'schema_failed': 0, 'failed': 0 })
+        entry[outcome] += 1
+
+def get_json_parse_stats() -> Dict[str, Dict[str, int]]:
+    with _stats_lock:
+        return { k: dict(v) for k, v in _stats.items() }
+
+def reset_json_parse_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+def _next_significant(text: str, i: int) -> str:
+    n = len(text)
+    while i < n and text[i] in ' \t\r\n':
+        i += 1
+    return text[i] if i < n else ''
+
+def _skip_comments(text: str, i: int) -> int:
+    """Index of the first character at or after ``i`` that is neither whitespace nor inside a ``//``/``/* */`` comment."""
+    n = len(text)
+    while i < n:
+        if text[i] in ' \t\r\n':
+            i += 1
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = n if end < 0 else end + 1
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        else:
+            break
+    return i
+
+def _scan(text: str, start: int) -> Tuple[str, bool, int]:
+    """Repairs the JSON value starting at ``text[start]`` in one pass.
+
+    Returns ``(repaired_text, changed, end_index)``. Fixes trailing commas, single-quoted strings,
+    raw control characters and stray quotes inside strings, Python literals, unquoted keys,
+    ``//``/``/* */`` comments and truncated values (missing string/container closers).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    changed = False
+    n = len(text)
+    i = start
+    quote = ''
+    expect_key = False
+    while i < n:
+        ch = text[i]
+        if quote:
+            if ch == '\\':
+                nxt = text[i+1] if i + 1 < n else ''
+                if nxt == "'" and quote == "'":
+                    out.append("'")
+                    changed = True
+                elif nxt in '"\\/bfnrtu':
+                    out.append(ch + nxt)
+                elif nxt == '':
+                    changed = True
+                else:
+                    out.append('\\\\' + nxt)
+                    changed = True
+                i += 2
+                continue
+            if ch == quote:
+                j = _skip_comments(text, i + 1)
+                follow = text[j] if j < n else ''
+                if follow == '' or follow in _DELIMS:
+                    out.append('"')
+                    if quote != '"':
+                        changed = True
+                    quote = ''
+                    i += 1
+                    continue
+                out.append('\\"' if ch == '"' else ch)
+                changed = True
+                i += 1
+                continue
+            if ch == '"':
+                out.append('\\"')
+            elif ch == '\n':
+                out.append('\\n')
+                changed = True
+            elif ch == '\r':
+                out.append('\\r')
+                changed = True
+            elif ch == '\t':
+                out.append('\\t')
+                changed = True
+            elif ord(ch) < 0x20:
+                out.append(f"\\u{ord(ch):04x}")
+                changed = True
+            else:
+                out.append(ch)
+            i += 1
+            continue
+        if ch in '"\'':
+            quote = ch
+            out.append('"')
+            if ch == "'":
+                changed = True
+            i += 1
+            continue
+        if ch in '{[':
+            stack.append(ch)
+            out.append(ch)
+            expect_key = ch == '{'
+            i += 1
+            continue
+        if ch in '}]':
+            if not stack:
+                break
+            opener = stack.pop()
+            if _CLOSERS[opener] != ch:
+                changed = True
+            out.append(_CLOSERS[opener])
+            expect_key = False
+            i += 1
+            if not stack:
+                break
+            continue
+        if ch == ',':
+            nxt = _next_significant(text, i + 1)
+            if nxt in ('}', ']'):
+                changed = True
+                i += 1
+                continue
+            out.append(ch)
+            expect_key = bool(stack) and stack[-1] == '{'
+            i += 1
+            continue
+        if ch == ':':
+            out.append(ch)
+            expect_key = False
+            i += 1
+            continue
+        if ch == '/' and i + 1 < n and text[i+1] in '/*':
+            end = text.find('\n', i) if text[i+1] == '/' else text.find('*/', i + 2)
+            i = n if end < 0 else (end if text[i+1] == '/' else end + 2)
+            changed = True
+            continue
+        if ch.isdigit() or ch == '-':
+            j = i + 1
+            while j < n and (text[j].isdigit() or text[j] in '.eE+-'):
+                j += 1
+            out.append(text[i:j])
+            expect_key = False
+            i = j
+            continue
+        if ch.isalpha() or ch in '_$':
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in '_$-'):
+                j += 1
+            word = text[i:j]
+            if expect_key and _next_significant(text, j) == ':':
+                out.append(json.dumps(word))
+                changed = True
+            elif word in _LITERALS:
+                out.append(_LITERALS[word])
+                changed = changed or _LITERALS[word] != word
+            else:
+                out.append(json.dumps(word))
+                changed = True
+            i = j
+            continue
+        out.append(ch)
+        i += 1
+    if quote:
+        out.append('"')
+        changed = True
+    if stack:
+        changed = True
+        while out and out[-1] in (' ', '\t', '\r', '\n'):
+            out.pop()
+        if out and out[-1] == ',':
+            out.pop()
+        if out and out[-1] == ':':
+            out.append('null')
+        elif stack[-1] == '{' and out and out[-1] == '"' and expect_key:
+            out.append(':null')
+        for opener in reversed(stack):
+            out.append(_CLOSERS[opener])
+    return ''.join(out), changed, i
+
+def validate_schema(data: Any, schema: Optional[Dict[str, Any]], path: str = '$') -> Optional[str]:
+    """Validates ``data`` against a small JSON-Schema subset (type, enum, required, properties, items, minItems)."""
+    if not schema:
+        return None
+    expected = schema.get('type')
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        checks = {
+            'object': lambda v: isinstance(v, dict),
+            'array': lambda v: isinstance(v, list),
+            'string': lambda v: isinstance(v, str),
+            'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+            'integer': lambda v: isinstance(v, int) and not isinstance(v, bool),
+            'boolean': lambda v: isinstance(v, bool),
+            'null': lambda v: v is None,
+        }
+        if not any(checks.get(t, lambda v: True)(data) for t in types):
+            return f"{path}: expected {'/'.join(types)}, got {type(data).__name__}"
+    if 'enum' in schema and data not in schema['enum']:
+        return f"{path}: {json.dumps(data, ensure_ascii=False)} is not one of {', '.join(json.dumps(e, ensure_ascii=False) for e in schema['enum'])}"
+    if isinstance(data, dict):
+        for key in schema.get('required') or []:
+            if key not in data:
+                return f"{path}: missing required field '{key}'"
+        for key, sub in (schema.get('properties') or {}).items():
+            if key in data:
+                err = validate_schema(data[key], sub, f"{path}.{key}")
+                if err:
+                    return err
+    if isinstance(data, list):
+        if len(data) < schema.get('minItems', 0):
+            return f"{path}: expected at least {schema['minItems']} item(s), got {len(data)}"
+        items = schema.get('items')
+        if items:
+            for idx, v in enumerate(data):
+                err = validate_schema(v, items, f"{path}[{idx}]")
+                if err:
+                    return err
+    return None
+
+def parse_llm_json(text: str, expect: Optional[str] = None, schema: Optional[Dict[str, Any]] = None, site: str = 'default', default: Any = _MISSING) -> Any:
+    """Extracts and parses the first JSON value in LLM output, repairing common defects.
+
+    ``expect`` restricts the value to ``'object'`` or ``'array'``. When parsing or schema validation fails,
+    ``default`` is returned if given, otherwise :class:`JsonRepairError` is raised. Outcomes are counted
+    per ``site`` (see :func:`get_json_parse_stats`); ``repaired`` counts parses that would have failed
+    with plain ``json.loads``.
+    """
+    text = text or ''
+    openers = '{' if expect == 'object' else ('[' if expect == 'array' else '{[')
+    stripped = text.strip()
+    if stripped and stripped[0] in openers:
+        try:
+            data = json.loads(stripped)
+            error = validate_schema(data, schema)
+            if not error:
+                _count(site, 'clean')
+                return data
+        except Exception:
+            pass
+    schema_error: Optional[str] = None
+    # Candidates never overlap: a failed one resumes the search where its scan stopped. The fenced
+    # part is searched first; the text before the fence is searched on its own afterwards.
+    fence = text.find('```')
+    for region in ([text[fence:], text[:fence]] if fence > 0 else [text]):
+        pos = 0
+        while pos < len(region):
+            starts = [p for p in (region.find(c, pos) for c in openers) if p >= 0]
+            if not starts:
+                break
+            start = min(starts)
+            repaired, changed, end = _scan(region, start)
+            pos = max(end, start + 1)
+            try:
+                data = json.loads(repaired)
+            except Exception:
+                continue
+            error = validate_schema(data, schema)
+            if error:
+                schema_error = schema_error or error
+                continue
+            _count(site, 'repaired' if changed else 'extracted')
+            return data
+    if schema_error:
+        _count(site, 'schema_failed')
+        if default is not _MISSING:
+            return default
+        raise JsonRepairError(schema_error)
+    _count(site, 'failed')
+    if default is not _MISSING:
+        return default
+    raise JsonRepairError(f"No parsable JSON {expect or 'value'} found")
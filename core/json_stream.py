@@ -0,0 +1,133 @@
+import json
+from typing import Any, List, Optional, Sequence, Union
+
+PathKey = Union[str, int]
+
+class JsonItemStream:
+    """Incrementally scans streamed JSON text and yields each element of the array at ``path`` once its closing brace/bracket arrives.
+
+    ``path`` is a sequence of object keys from the root value, e.g. ``('files',)`` for ``{"files": [...]}``
+    or ``()`` for a top-level array. Text outside the JSON value (Markdown fences, chatter) is skipped; a root value
+    that never contained the target array is discarded and scanning restarts at the next ``{``/``[``.
+    Only the text of a pending item or key is kept (as the received chunks), so each chunk is scanned once
+    and each item joined once.
+    """
+
+    def __init__(self, path: Sequence[PathKey] = ()):
+        self.path = tuple(path)
+        self._parts: List[str] = []
+        self._parts_start = 0
+        self._end = 0
+        self.started = False
+        self.finished = False
+        self._stack: List[tuple] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._expect_key = False
+        self._pending_key: Optional[str] = None
+        self._item_start = -1
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def _current_path(self) -> tuple:
+        return tuple(entry[1] for entry in self._stack[1:])
+
+    def _text(self, start: int, end: int) -> str:
+        """The received text between absolute offsets ``start`` and ``end``."""
+        last = self._parts[-1]
+        last_start = self._end - len(last)
+        if start >= last_start:
+            return last[start - last_start:end - last_start]
+        return ''.join(self._parts)[start - self._parts_start:end - self._parts_start]
+
+    def _trim(self) -> None:
+        keep = self._end
+        if self._item_start >= 0:
+            keep = self._item_start
+        if self._in_string and self._expect_key:
+            keep = min(keep, self._string_start)
+        while self._parts and self._parts_start + len(self._parts[0]) <= keep:
+            self._parts_start += len(self._parts.pop(0))
+
+    def feed(self, text: str) -> List[Any]:
+        items: List[Any] = []
+        if not text or self.finished:
+            return items
+        self._parts.append(text)
+        base = self._end
+        self._end += len(text)
+        buf = text
+        i = 0
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._stack and self._stack[-1][0] == '{' and self._expect_key:
+                        raw_key = self._text(self._string_start, base + i + 1)
+                        try:
+                            self._pending_key = json.loads(raw_key)
+                        except Exception:
+                            self._pending_key = raw_key[1:-1]
+                i += 1
+                continue
+            if not self.started:
+                if ch in '{[':
+                    self.started = True
+                else:
+                    i += 1
+                    continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = base + i
+            elif ch in '{[':
+                key: Optional[PathKey] = ''
+                if self._stack:
+                    parent = self._stack[-1]
+                    if parent[0] == '{':
+                        key = self._pending_key if self._pending_key is not None else ''
+                    else:
+                        key = None
+                        if self._item_start < 0 and len(self._stack) == len(self.path) + 1 and self._current_path() == self.path:
+                            self._item_start = base + i
+                self._stack.append((ch, key))
+                self._expect_key = ch == '{'
+                self._pending_key = None
+            elif ch in '}]':
+                if not self._stack:
+                    i += 1
+                    continue
+                self._stack.pop()
+                if self._item_start >= 0 and len(self._stack) == len(self.path) + 1:
+                    raw = self._text(self._item_start, base + i + 1)
+                    self._item_start = -1
+                    try:
+                        items.append(json.loads(raw))
+                        self._count += 1
+                    except Exception:
+                        pass
+                self._expect_key = False
+                if not self._stack:
+                    if self._count:
+                        self.finished = True
+                        i += 1
+                        break
+                    self.started = False
+            elif ch == ',':
+                if self._stack and self._stack[-1][0] == '{':
+                    self._expect_key = True
+                    self._pending_key = None
+            elif ch == ':':
+                self._expect_key = False
+            i += 1
+        self._trim()
+        return items
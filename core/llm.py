@@ -1,19 +1,30 @@
+import importlib
+import threading
 from typing import Any, Dict, List, Optional, AsyncGenerator
 
-try:
-    from langchain_openai import ChatOpenAI
-except Exception:
-    ChatOpenAI = None
-try:
-    from langchain_community.chat_models.tongyi import ChatTongyi as Tongyi
-except Exception:
-    Tongyi = None
-try:
-    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-except Exception:
-    SystemMessage = None
-    HumanMessage = None
-    AIMessage = None
+# Provider SDKs take seconds to import, so each is imported on first use of that provider only.
+PROVIDER_MODULES = {
+    'openai': ('langchain_openai', 'ChatOpenAI'),
+    'tongyi': ('langchain_community.chat_models.tongyi', 'ChatTongyi'),
+    'messages': ('langchain_core.messages', None),
+}
+
+_provider_lock = threading.Lock()
+_providers: Dict[str, Any] = {}
+
+def load_provider(name: str) -> Any:
+    """Returns the provider class (or module) registered as ``name``, importing it once; ``None`` if not installed."""
+    if name in _providers:
+        return _providers[name]
+    with _provider_lock:
+        if name not in _providers:
+            module_name, attr = PROVIDER_MODULES[name]
+            try:
+                module = importlib.import_module(module_name)
+                _providers[name] = getattr(module, attr) if attr else module
+            except Exception:
+                _providers[name] = None
+        return _providers[name]
 
 class BaseChatModel:
     async def invoke(self, messages: List[Any]) -> Dict[str, Any]:
@@ -21,7 +32,20 @@ class BaseChatModel:
     async def stream(self, messages: List[Any]) -> AsyncGenerator[Dict[str, Any], None]:
         raise NotImplementedError
 
+import copy
 import os
+from core.cancellation import guard, guard_iter
+
+def _usage_of(message: Any) -> Optional[Dict[str, int]]:
+    """Normalises LangChain ``usage_metadata`` (or provider ``token_usage``) to inputTokens/outputTokens/cachedTokens."""
+    meta = getattr(message, 'usage_metadata', None)
+    if meta:
+        details = meta.get('input_token_details') or {}
+        return { 'inputTokens': meta.get('input_tokens') or 0, 'outputTokens': meta.get('output_tokens') or 0, 'cachedTokens': details.get('cache_read') or 0 }
+    token_usage = (getattr(message, 'response_metadata', None) or {}).get('token_usage')
+    if isinstance(token_usage, dict):
+        return { 'inputTokens': token_usage.get('input_tokens') or token_usage.get('prompt_tokens') or 0, 'outputTokens': token_usage.get('output_tokens') or token_usage.get('completion_tokens') or 0, 'cachedTokens': 0 }
+    return None
 
 class LangChainLLM(BaseChatModel):
     def __init__(self, model: str, temperature: float, max_tokens: int, streaming: bool):
@@ -32,18 +56,36 @@ class LangChainLLM(BaseChatModel):
         self._lc = None
         print(f'------------------init langchain llm----------------------- model: {model}, temperature: {temperature}, max_tokens: {max_tokens}, streaming: {streaming}')
 
-        if ChatOpenAI is None and Tongyi is None:
-            raise RuntimeError('langchain-openai or tongyi not installed')
         name = (model or '').lower()
         if 'qwen' in name or 'tongyi' in name:
+            Tongyi = load_provider('tongyi')
             if Tongyi is None:
                 raise RuntimeError('langchain-community Tongyi not installed')
             self._lc = Tongyi(model_name=model, temperature=temperature, dashscope_api_key=os.environ.get('DASHSCOPE_API_KEY'))
             print('------------------use tongyi-----------------------')
         else:
-            self._lc = ChatOpenAI(model=model, temperature=temperature)
+            ChatOpenAI = load_provider('openai')
+            if ChatOpenAI is None:
+                raise RuntimeError('langchain-openai not installed')
+            self._lc = ChatOpenAI(model=model, temperature=temperature, stream_usage=True)
+
+    def with_params(self, temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> 'LangChainLLM':
+        """Returns a view sharing this client with the given call parameters bound."""
+        view = copy.copy(self)
+        bind: Dict[str, Any] = {}
+        if temperature is not None and temperature != self.temperature:
+            view.temperature = temperature
+            bind['temperature'] = temperature
+        if max_tokens is not None:
+            view.max_tokens = max_tokens
+            bind['max_tokens'] = max_tokens
+        if bind:
+            view._lc = self._lc.bind(**bind)
+        return view
 
     def _to_lc_messages(self, messages: List[Dict[str, Any]]):
+        lc = load_provider('messages')
+        SystemMessage, HumanMessage, AIMessage = lc.SystemMessage, lc.HumanMessage, lc.AIMessage
         out = []
         for m in messages:
             role = m.get('role')
@@ -58,10 +100,11 @@ class LangChainLLM(BaseChatModel):
 
     async def invoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
         lc_messages = self._to_lc_messages(messages)
-        resp = await self._lc.ainvoke(lc_messages)
-        return {'content': getattr(resp, 'content', '')}
+        resp = await guard(self._lc.ainvoke(lc_messages))
+        return {'content': getattr(resp, 'content', ''), 'usage': _usage_of(resp)}
 
     async def stream(self, messages: List[Dict[str, Any]]):
         lc_messages = self._to_lc_messages(messages)
-        async for chunk in self._lc.astream(lc_messages):
-            yield {'content': getattr(chunk, 'content', '')}
+        async for chunk in guard_iter(self._lc.astream(lc_messages)):
+            usage = _usage_of(chunk)
+            yield {'content': getattr(chunk, 'content', ''), 'usage': usage} if usage else {'content': getattr(chunk, 'content', '')}
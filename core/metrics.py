@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_enabled = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+def set_metrics_enabled(enabled: bool) -> None:
+    global _enabled
+    _enabled = enabled
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def set(self, value: float, *labels: Any) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: Any, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for labels, entry in self._values.items():
+                cumulative = 0.0
+                for i, bound in enumerate(self.buckets):
+                    cumulative += entry[i]
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {entry[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {entry[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {entry[-1]}")
+        return lines
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], List[str]]] = []
+
+def register_collector(collector: Callable[[], List[str]]) -> None:
+    """Registers a callable producing extra exposition lines at scrape time (e.g. from existing stats dicts)."""
+    _collectors.append(collector)
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception:
+            pass
+    return '\n'.join(lines) + '\n'
+
+def _json_parse_lines() -> List[str]:
+    from core.json_repair import get_json_parse_stats
+    lines = ['# HELP agent_json_parse_total LLM JSON parse outcomes by call site.', '# TYPE agent_json_parse_total counter']
+    for site, outcomes in get_json_parse_stats().items():
+        lines.extend(f"agent_json_parse_total{_labels(('site', 'outcome'), (site, outcome))} {count}" for outcome, count in outcomes.items())
+    return lines
+
+def _hedge_lines() -> List[str]:
+    from core.hedging import get_hedge_stats
+    lines = ['# HELP agent_llm_hedge_total Hedged LLM request outcomes by model and call kind.', '# TYPE agent_llm_hedge_total counter']
+    for key, entry in get_hedge_stats().items():
+        lines.extend(f"agent_llm_hedge_total{_labels(('key', 'outcome'), (key, outcome))} {entry[outcome]}" for outcome in ('requests', 'hedged', 'primary_wins', 'hedge_wins', 'fallback_on_error', 'errors'))
+    return lines
+
+register_collector(_json_parse_lines)
+register_collector(_hedge_lines)
+
+SPAN_SECONDS = Histogram('agent_span_seconds', 'Duration of instrumented hot-path spans.', ('span',))
+LLM_SECONDS = Histogram('agent_llm_request_seconds', 'LLM call latency by model and purpose.', ('model', 'purpose'))
+LLM_TTFT_SECONDS = Histogram('agent_llm_ttft_seconds', 'LLM time to first token by model.', ('model',))
+LLM_TOKENS = Counter('agent_llm_tokens_total', 'LLM tokens by model and direction.', ('model', 'direction'))
+TOOL_SECONDS = Histogram('agent_tool_seconds', 'Tool execution latency by tool name.', ('tool',))
+ITERATIONS_PER_RUN = Histogram('agent_iterations_per_run', 'ReAct iterations executed per run.', (), (1, 2, 3, 5, 8, 10, 15, 20, 30))
+ITERATIONS_SAVED = Counter('agent_iterations_saved_total', 'ReAct iterations and tool round-trips saved by handling wasted actions locally.', ('reason',))
+RUNS = Counter('agent_runs_total', 'Agent runs by kind and outcome.', ('kind', 'outcome'))
+ACTIVE_RUNS = Gauge('agent_active_runs', 'Agent runs currently executing.', ('kind',))
+SSE_QUEUE_DEPTH = Gauge('agent_sse_queue_depth', 'Events waiting in an SSE queue (last observed).', ('endpoint',))
+SSE_QUEUE_WAIT_SECONDS = Histogram('agent_sse_queue_wait_seconds', 'Time events spend in the SSE queue before being written.', ('endpoint',))
+EVENT_LOOP_LAG_SECONDS = Histogram('agent_event_loop_lag_seconds', 'Delay of a periodic event-loop wakeup beyond its schedule.', (), (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+EVENT_LOOP_LAG_LAST = Gauge('agent_event_loop_lag_last_seconds', 'Most recent event-loop lag sample.')
+RAG_PREFETCH = Counter('agent_rag_prefetch_total', 'Component doc sections by speculative prefetch outcome (hit, miss, wasted).', ('outcome',))
+BATCH_ITEMS = Counter('agent_batch_items_total', 'Batch endpoint items by outcome.', ('outcome',))
+BATCH_LLM_WAIT_SECONDS = Histogram('agent_batch_llm_wait_seconds', 'Time batch LLM calls waited for interactive calls to drain.')
+
+async def monitor_event_loop_lag(interval: float = 0.1) -> None:
+    """Samples how late the loop wakes up from ``interval`` sleeps; run as a background task."""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - scheduled)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+def _process_lines() -> List[str]:
+    rss = None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        except Exception:
+            return []
+    return ['# HELP process_resident_memory_bytes Resident memory size in bytes.', '# TYPE process_resident_memory_bytes gauge', f'process_resident_memory_bytes {rss}', '# HELP process_cpu_seconds_total Total user and system CPU time in seconds.', '# TYPE process_cpu_seconds_total counter', f'process_cpu_seconds_total {time.process_time()}']
+
+register_collector(_process_lines)
+
+class TraceRecorder:
+    """Collects spans of one run as Chrome trace events (``chrome://tracing`` / Perfetto)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self._tids: Dict[int, int] = {}
+
+    def _tid(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        return self._tids.setdefault(key, len(self._tids) + 1)
+
+    def add(self, name: str, start: float, duration: float, args: Optional[Dict[str, Any]] = None) -> None:
+        self.events.append({ 'name': name, 'ph': 'X', 'ts': int((start - self.origin) * 1e6), 'dur': int(duration * 1e6), 'pid': os.getpid(), 'tid': self._tid(), 'args': args or {} })
+
+    def dump(self, directory: Optional[str] = None) -> str:
+        directory = directory or os.environ.get('TRACE_DIR') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.traces')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}_{int(time.time()*1000)}.trace.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({ 'traceEvents': self.events, 'displayTimeUnit': 'ms' }, f, ensure_ascii=False, default=str)
+        return path
+
+_trace: contextvars.ContextVar[Optional[TraceRecorder]] = contextvars.ContextVar('trace_recorder', default=None)
+
+def current_trace() -> Optional[TraceRecorder]:
+    return _trace.get()
+
+@contextmanager
+def trace_run(name: str):
+    """Records spans of the enclosed run into a new :class:`TraceRecorder` unless one is already active."""
+    existing = _trace.get()
+    if existing is not None:
+        yield existing
+        return
+    recorder = TraceRecorder(name)
+    reset = _trace.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _trace.reset(reset)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('name', 'args', 'start', 'recorder')
+
+    def __init__(self, name: str, args: Dict[str, Any], recorder: Optional[TraceRecorder]):
+        self.name = name
+        self.args = args
+        self.recorder = recorder
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        SPAN_SECONDS.observe(duration, self.name)
+        if self.recorder is not None:
+            self.recorder.add(self.name, self.start, duration, self.args)
+        return False
+
+def span(name: str, **args: Any):
+    """Times the enclosed block into ``agent_span_seconds`` and the active trace; a no-op when both are off."""
+    recorder = _trace.get()
+    if not _enabled and recorder is None:
+        return _NULL_SPAN
+    return _Span(name, args, recorder)
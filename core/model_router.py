@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.llm import BaseChatModel, LangChainLLM
+from core.hedging import HedgedLLM, with_hedging
+from core.usage import check_token_budget, record_llm_call
+from core.metrics import LLM_SECONDS, LLM_TTFT_SECONDS, LLM_TOKENS, current_trace
+from core.recording import current_tape
+from core.priority import llm_slot
+
+LLM_PURPOSES = ('pre_action', 'plan', 'reason', 'observation', 'final_answer', 'bdd', 'architect', 'keywords', 'codegen', 'scenario_match')
+
+MAX_POOLED_CLIENTS = 16
+
+_pool_lock = threading.Lock()
+_pool: 'OrderedDict[Tuple[str, bool], LangChainLLM]' = OrderedDict()
+
+def _pooled_client(model: str, streaming: bool) -> LangChainLLM:
+    key = (model, streaming)
+    with _pool_lock:
+        client = _pool.get(key)
+        if client is None:
+            client = LangChainLLM(model=model, temperature=0.7, max_tokens=2000, streaming=streaming)
+            _pool[key] = client
+            while len(_pool) > MAX_POOLED_CLIENTS:
+                _pool.popitem(last=False)
+        _pool.move_to_end(key)
+        return client
+
+def pooled_llm(model: str, config: Any, temperature: Optional[float] = None, max_tokens: Optional[int] = None, hedge: bool = True) -> BaseChatModel:
+    """Returns a view of the process-wide client for ``model`` bound to the given call parameters.
+
+    One LangChain client (and so one HTTP connection pool) is kept per model, for at most
+    ``MAX_POOLED_CLIENTS`` recently used models; temperature and ``max_tokens`` are bound per call
+    instead of creating a new client.
+    """
+    client = _pooled_client(model, config.streamOutput)
+    bound = client.with_params(temperature=config.temperature if temperature is None else temperature, max_tokens=max_tokens)
+    if not hedge:
+        return bound
+    return with_hedging(bound, config, lambda fallback_model: pooled_llm(fallback_model, config, temperature, max_tokens, hedge=False))
+
+_usage_lock = threading.Lock()
+_usage: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+def _record_usage(record: Dict[str, Any], error: bool) -> None:
+    with _usage_lock:
+        entry = _usage.setdefault(record['purpose'], {}).setdefault(record['model'], { 'calls': 0, 'errors': 0, 'totalMs': 0, 'totalTtftMs': 0, 'inputTokens': 0, 'outputTokens': 0, 'cachedTokens': 0 })
+        entry['calls'] += 1
+        entry['errors'] += 1 if error else 0
+        entry['totalMs'] += record['latencyMs']
+        entry['totalTtftMs'] += record['ttftMs']
+        entry['inputTokens'] += record['inputTokens']
+        entry['outputTokens'] += record['outputTokens']
+        entry['cachedTokens'] += record['cachedTokens']
+
+def get_model_usage_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    with _usage_lock:
+        return { p: { m: { **v, 'avgMs': int(v['totalMs'] / v['calls']) if v['calls'] else 0, 'avgTtftMs': int(v['totalTtftMs'] / v['calls']) if v['calls'] else 0 } for m, v in models.items() } for p, models in _usage.items() }
+
+def reset_model_usage_stats() -> None:
+    with _usage_lock:
+        _usage.clear()
+
+def _message_text(messages: List[Any]) -> str:
+    return '\n'.join(str(m.get('content') or '') if isinstance(m, dict) else str(m) for m in messages or [])
+
+class PurposeLLM(BaseChatModel):
+    """Model proxy bound to one call purpose.
+
+    Records tokens (provider-reported, else estimated), time to first token and latency of every call,
+    both per purpose/model (:func:`get_model_usage_stats`) and in the current session's usage ledger;
+    refuses to call once that session's token budget is exhausted.
+    Calls go through the active record/replay tape (:mod:`core.recording`), if any, and batch calls
+    yield to interactive ones (:mod:`core.priority`).
+    """
+
+    def __init__(self, llm: BaseChatModel, purpose: str, model: str):
+        self.llm = llm
+        self.purpose = purpose
+        self.model_name = model
+
+    def _finish(self, messages: List[Any], usage: Optional[Dict[str, Any]], output: str, started: float, first_at: Optional[float], error: bool) -> None:
+        now = time.perf_counter()
+        record = record_llm_call(self.purpose, self.model_name, usage, _message_text(messages), output, int(((first_at or now) - started) * 1000), int((now - started) * 1000))
+        _record_usage(record, error)
+        LLM_SECONDS.observe(now - started, self.model_name, self.purpose)
+        if first_at is not None:
+            LLM_TTFT_SECONDS.observe(first_at - started, self.model_name)
+        LLM_TOKENS.inc(self.model_name, 'input', amount=record['inputTokens'])
+        LLM_TOKENS.inc(self.model_name, 'output', amount=record['outputTokens'])
+        trace = current_trace()
+        if trace is not None:
+            trace.add(f"llm.{self.purpose}", started, now - started, { 'model': self.model_name, 'inputTokens': record['inputTokens'], 'outputTokens': record['outputTokens'], 'ttftMs': record['ttftMs'], 'error': error })
+
+    async def invoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        check_token_budget()
+        async with llm_slot():
+            started = time.perf_counter()
+            try:
+                tape = current_tape()
+                resp = await (tape.invoke(self.llm, self.purpose, self.model_name, messages) if tape is not None else self.llm.invoke(messages))
+            except Exception:
+                self._finish(messages, None, '', started, None, True)
+                raise
+            self._finish(messages, resp.get('usage'), resp.get('content') or '', started, None, False)
+            return resp
+
+    async def stream(self, messages: List[Dict[str, Any]]):
+        check_token_budget()
+        async with llm_slot():
+            started = time.perf_counter()
+            first_at: Optional[float] = None
+            parts: List[str] = []
+            usage: Optional[Dict[str, Any]] = None
+            error = False
+            try:
+                tape = current_tape()
+                async for chunk in (tape.stream(self.llm, self.purpose, self.model_name, messages) if tape is not None else self.llm.stream(messages)):
+                    if chunk.get('content'):
+                        first_at = first_at or time.perf_counter()
+                        parts.append(chunk['content'])
+                    if chunk.get('usage'):
+                        usage = chunk['usage']
+                    yield chunk
+            except Exception:
+                error = True
+                raise
+            finally:
+                self._finish(messages, usage, ''.join(parts), started, first_at, error)
+
+class ModelRouter:
+    """Resolves the model for each call purpose from ``AgentConfig.modelRoutes``.
+
+    A route is ``{ 'model': ..., 'temperature': ..., 'maxTokens': ... }``; missing keys fall back to the
+    agent's own model and temperature. Purposes without a route use ``default``.
+    """
+
+    def __init__(self, config: Any, default: BaseChatModel):
+        self.config = config
+        self.default = default
+        self._resolved: Dict[str, BaseChatModel] = {}
+
+    def route(self, purpose: str) -> Dict[str, Any]:
+        return (self.config.modelRoutes or {}).get(purpose) or {}
+
+    def signature(self, purpose: str) -> List[Any]:
+        """Model parameters of ``purpose`` for use in cache keys."""
+        route = self.route(purpose)
+        sig: List[Any] = [route.get('model') or self.config.model, route.get('temperature', self.config.temperature)]
+        if route.get('maxTokens'):
+            sig.append(route['maxTokens'])
+        return sig
+
+    def resolve(self, purpose: str) -> BaseChatModel:
+        cached = self._resolved.get(purpose)
+        if cached is not None:
+            return cached
+        route = self.route(purpose)
+        llm = self.default
+        model = route.get('model') or self.config.model
+        if route:
+            try:
+                llm = pooled_llm(model, self.config, route.get('temperature'), route.get('maxTokens'))
+            except Exception:
+                llm = self.default
+                model = self.config.model
+        if isinstance(llm, HedgedLLM):
+            llm = llm.for_purpose(purpose)
+        resolved = PurposeLLM(llm, purpose, model)
+        self._resolved[purpose] = resolved
+        return resolved
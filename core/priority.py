@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+from core.cancellation import guard
+from core.metrics import BATCH_LLM_WAIT_SECONDS
+
+class PriorityGate:
+    """Gives interactive LLM calls precedence over batch ones within this process.
+
+    Interactive calls are only counted. A batch call waits while ``interactive_limit`` or more
+    interactive calls are in flight, so nightly batches fill idle capacity without adding latency
+    to interactive sessions.
+    """
+
+    def __init__(self, interactive_limit: int = 4):
+        self.interactive_limit = interactive_limit
+        self.interactive = 0
+        self.batch = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        return self._idle
+
+    @contextmanager
+    def interactive_call(self) -> Iterator[None]:
+        self.interactive += 1
+        if self.interactive >= self.interactive_limit:
+            self._event().clear()
+        try:
+            yield
+        finally:
+            self.interactive -= 1
+            if self.interactive < self.interactive_limit:
+                self._event().set()
+
+    async def batch_turn(self) -> None:
+        if self.interactive < self.interactive_limit:
+            return
+        started = time.perf_counter()
+        while self.interactive >= self.interactive_limit:
+            await guard(self._event().wait())
+        BATCH_LLM_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+default_priority_gate = PriorityGate(int(os.environ.get('BATCH_INTERACTIVE_LIMIT', '4')))
+
+_batch_priority: contextvars.ContextVar[bool] = contextvars.ContextVar('batch_priority', default=False)
+
+def is_batch() -> bool:
+    return _batch_priority.get()
+
+@contextmanager
+def batch_priority() -> Iterator[None]:
+    """Marks LLM calls made in this context (and tasks created from it) as batch traffic."""
+    reset = _batch_priority.set(True)
+    try:
+        yield
+    finally:
+        _batch_priority.reset(reset)
+
+@asynccontextmanager
+async def llm_slot() -> AsyncIterator[None]:
+    """Wraps one LLM call: batch calls first wait for their turn, interactive calls are counted."""
+    if _batch_priority.get():
+        await default_priority_gate.batch_turn()
+        yield
+    else:
+        with default_priority_gate.interactive_call():
+            yield
@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def profile_dir() -> str:
+    return os.environ.get('PROFILE_DIR') or os.path.join(REPO_ROOT, '.profiles')
+
+def profiling_authorized(token: Optional[str]) -> bool:
+    """True if ``token`` matches ``PROFILE_ADMIN_TOKEN``; profiling is disabled while that is unset."""
+    expected = os.environ.get('PROFILE_ADMIN_TOKEN') or ''
+    return bool(expected) and bool(token) and hmac.compare_digest(str(token), expected)
+
+_profiled_run: contextvars.ContextVar[Optional['RequestProfiler']] = contextvars.ContextVar('profiled_run', default=None)
+_factory_loops: 'weakref.WeakSet[asyncio.AbstractEventLoop]' = weakref.WeakSet()
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop) -> None:
+    """Makes tasks created inside a profiled run (gather, hedging, ...) count as part of that run."""
+    if loop in _factory_loops:
+        return
+    previous = loop.get_task_factory()
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        profiler = _profiled_run.get()
+        if profiler is not None:
+            profiler.tasks.add(task)
+        return task
+    loop.set_task_factory(factory)
+    _factory_loops.add(loop)
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(REPO_ROOT):
+        filename = os.path.relpath(filename, REPO_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+class RequestProfiler:
+    """Sampling profiler restricted to the asyncio tasks of one request.
+
+    A background thread samples the event-loop thread's stack every ``interval`` seconds and keeps a
+    sample only while a task of the profiled run is executing, so concurrent requests do not show up
+    in the profile and are never blocked by it. Samples are written in folded-stack format (``flamegraph.pl``,
+    speedscope). With ``memory`` set (opt-in), ``tracemalloc`` is started for the duration and the top
+    allocation sites are written next to it. Tracing is process-wide: it slows down every request the
+    process serves meanwhile, and the list can include their allocations too.
+    """
+
+    def __init__(self, name: str, interval: float = 0.005, memory: bool = False, directory: Optional[str] = None):
+        self.name = f"{name}_{int(time.time()*1000)}"
+        self.interval = interval
+        self.memory = memory
+        self.directory = directory or profile_dir()
+        self.tasks: 'weakref.WeakSet[asyncio.Task]' = weakref.WeakSet()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.report: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._owns_tracemalloc = False
+        self._reset = None
+        self._stopping: Optional[asyncio.Future] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        _install_task_factory(loop)
+        task = asyncio.current_task()
+        if task is not None:
+            self.tasks.add(task)
+        self._reset = _profiled_run.set(self)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES') or '10'))
+                self._owns_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, args=(loop, threading.get_ident()), name=f'profiler-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, thread_id: int) -> None:
+        while not self._stop.wait(self.interval):
+            task = asyncio.current_task(loop)
+            if task is None or task not in self.tasks:
+                continue
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            del frame
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    async def stop(self) -> Dict[str, Any]:
+        """Stops sampling and writes the profile files; returns the report (idempotent).
+
+        The snapshot diff and the file writes run in a worker thread, off the event loop.
+        """
+        if self._stopping is None:
+            self._stop.set()
+            if self._reset is not None:
+                try:
+                    _profiled_run.reset(self._reset)
+                except ValueError:
+                    pass
+            self._stopping = asyncio.ensure_future(asyncio.to_thread(self._finish, time.perf_counter() - self._started))
+        return await asyncio.shield(self._stopping)
+
+    def _finish(self, duration: float) -> Dict[str, Any]:
+        if self._thread is not None:
+            self._thread.join()
+        os.makedirs(self.directory, exist_ok=True)
+        folded = os.path.join(self.directory, f"{self.name}.folded")
+        with open(folded, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        report = { 'id': self.name, 'samples': self.samples, 'intervalMs': self.interval * 1000, 'durationMs': int(duration * 1000), 'flamegraph': f"/api/profiles/{self.name}.folded" }
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+            current, peak = tracemalloc.get_traced_memory()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            top = snapshot.compare_to(self._snapshot, 'lineno')[:int(os.environ.get('PROFILE_TOP_ALLOCATIONS') or '30')]
+            allocations = os.path.join(self.directory, f"{self.name}.alloc.txt")
+            with open(allocations, 'w', encoding='utf-8') as f:
+                f.write(f"# traced memory: current={current} peak={peak} bytes (process-wide)\n")
+                for stat in top:
+                    f.write(f"{stat}\n")
+            report.update({ 'allocations': f"/api/profiles/{self.name}.alloc.txt", 'peakBytes': peak })
+        self.report = report
+        return report
+
+_active_lock = threading.Lock()
+_active: Optional[RequestProfiler] = None
+
+@asynccontextmanager
+async def profile_request(name: str, enabled: bool = True, memory: bool = False):
+    """Profiles the enclosed part of the current request, yielding the profiler or None.
+
+    Only one request is profiled at a time; a second profiling request runs unprofiled. ``memory``
+    also traces allocations with ``tracemalloc``, which slows down the whole process while it runs.
+    """
+    global _active
+    if not enabled:
+        yield None
+        return
+    with _active_lock:
+        if _active is not None:
+            profiler = None
+        else:
+            profiler = _active = RequestProfiler(name, interval=float(os.environ.get('PROFILE_INTERVAL_MS') or '5') / 1000, memory=memory)
+    if profiler is None:
+        yield None
+        return
+    try:
+        profiler.start()
+        yield profiler
+    finally:
+        try:
+            await profiler.stop()
+        finally:
+            with _active_lock:
+                _active = None
@@ -1,8 +1,12 @@
 import asyncio
+import dataclasses
+import difflib
 import json
+import secrets
 import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
 from aitypes import AgentConfig, AgentContext, ReActStep, TaskStatus, TaskStep
 from tools.tool_registry import ToolRegistry
@@ -13,7 +17,26 @@ from core.prompt import (
     create_pre_action_prompt,
     create_planner_prompt,
 )
-from core.llm import LangChainLLM, BaseChatModel
+from core.llm import BaseChatModel
+from core.model_router import LLM_PURPOSES, ModelRouter, pooled_llm
+from core.json_repair import parse_llm_json
+from core.cancellation import CancelToken, OperationCancelled, check_cancelled, remaining_budget, scoped_token, use_token
+from core.event_channel import EventChannel, flow_control, stream_events
+from core.recording import record_run
+from core.metrics import ACTIVE_RUNS, ITERATIONS_PER_RUN, ITERATIONS_SAVED, RUNS, TOOL_SECONDS, span, trace_run
+from core.usage import TokenBudgetExceeded, UsageLedger, current_ledger, session_ledger, use_ledger
+from core.artifact_store import ArtifactStore, default_artifact_store, summarize_result
+from core.step_log import StepLog, step_log_path
+
+PLANNER_SCHEMA = { 'type': 'array', 'minItems': 1, 'items': { 'type': 'object', 'required': ['title'] } }
+# Config fields the template's LLM client is built from; clones may override anything else.
+LLM_FIELDS = frozenset(('model', 'temperature', 'streamOutput', 'hedging', 'hedgeFallbackModel', 'hedgePercentile', 'hedgeMaxRate'))
+PROMPT_CACHE_SIZE = 64
+# Steps replayed into each reasoning prompt; the in-memory step window never drops below this.
+HISTORY_STEPS = 6
+# Actions the agent produces itself (blocked final answers, unparsable replies); never sent to the tool registry.
+PSEUDO_ACTIONS = frozenset(('continue_thinking',))
+THOUGHT_SIMILARITY = 0.9
 
 class SimpleLLM(BaseChatModel):
     async def invoke(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -34,27 +57,80 @@ class SessionState:
     isPaused: bool
     waitingReason: Optional[str] = None
 
+def default_llm(config: AgentConfig) -> BaseChatModel:
+    try:
+        return pooled_llm(config.model, config)
+    except Exception:
+        return SimpleLLM()
+
+class AgentTemplate:
+    """Prebuilt, shareable parts of a ReAct agent: config, LLM client, resolved routes, tools and compiled prompts.
+
+    Building a :class:`ReActAgent` creates its pooled client views and routes from scratch; agents
+    made with :meth:`clone` share those and get only fresh run state, so per-request construction is cheap.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, llm: Optional[BaseChatModel] = None, tools: Optional[List[Dict[str, Any]]] = None, artifact_store: Optional[ArtifactStore] = None):
+        self.config = AgentConfig(**(config or {}))
+        self.llm = llm if llm is not None else default_llm(self.config)
+        self.router = ModelRouter(self.config, self.llm)
+        self.tool_registry = ToolRegistry()
+        self.tool_registry.register_tools(tools or [])
+        self.artifact_store = artifact_store or default_artifact_store
+        self.prompt_cache: Dict[Any, str] = {}
+        self.warm()
+
+    def warm(self) -> None:
+        """Resolves every purpose's model and compiles the system prompts ahead of the first request."""
+        for purpose in LLM_PURPOSES:
+            self.router.resolve(purpose)
+        probe = ReActAgent.from_template(self)
+        probe.base_prompt(self.tool_registry.get_tools_description())
+        probe.base_prompt()
+
+    def clone(self, **overrides: Any) -> 'ReActAgent':
+        return ReActAgent.from_template(self, **overrides)
+
 class ReActAgent:
-    def __init__(self, config: Optional[Dict[str, Any]] = None, llm: Optional[BaseChatModel] = None):
+    def __init__(self, config: Optional[Dict[str, Any]] = None, llm: Optional[BaseChatModel] = None, artifact_store: Optional[ArtifactStore] = None):
         self.config = AgentConfig(**(config or {}))
         print(self.config)
-        if llm is not None:
-            self.llm = llm
-        else:
-            try:
-                self.llm = LangChainLLM(model=self.config.model, temperature=self.config.temperature, max_tokens=self.config.maxTokens, streaming=self.config.streamOutput)
-            except Exception:
-                self.llm = SimpleLLM()
+        self.llm = llm if llm is not None else default_llm(self.config)
+        self.router = ModelRouter(self.config, self.llm)
         self.tool_registry = ToolRegistry()
+        self.artifact_store = artifact_store or default_artifact_store
+        self.prompt_cache: Dict[Any, str] = {}
+        self._init_run_state()
+
+    def _init_run_state(self) -> None:
         self.stream_manager = StreamManager()
         self.plan_list: List[TaskStep] = []
         self.last_emitted_plan_snapshot: str = ''
         self.current_session_id: Optional[str] = None
         self.session_states: Dict[str, SessionState] = {}
 
+    @classmethod
+    def from_template(cls, template: 'AgentTemplate', **overrides: Any) -> 'ReActAgent':
+        """Builds an agent from a prebuilt :class:`AgentTemplate`, sharing its LLM client, router, tools and prompts."""
+        agent = cls.__new__(cls)
+        if LLM_FIELDS & overrides.keys():
+            raise ValueError(f"{', '.join(sorted(LLM_FIELDS & overrides.keys()))} cannot be overridden per clone; build a separate template")
+        agent.config = dataclasses.replace(template.config, **overrides) if overrides else template.config
+        agent.llm = template.llm
+        agent.router = ModelRouter(agent.config, template.llm) if 'modelRoutes' in overrides else template.router
+        agent.tool_registry = template.tool_registry.copy()
+        agent.artifact_store = template.artifact_store
+        agent.prompt_cache = template.prompt_cache
+        agent._init_run_state()
+        return agent
+
     def gen_id(self, prefix: str) -> str:
         return f"{prefix}_{int(time.time()*1000)}_{str(time.time()).split('.')[1][:6]}"
 
+    def gen_conversation_id(self) -> str:
+        """Conversation ids authorise reading a session's usage (``/api/usage``), so they carry a random part."""
+        return f"conv_{int(time.time()*1000)}_{secrets.token_hex(8)}"
+
     def mark_next_pending_doing(self, note: Optional[str] = None) -> bool:
         for p in self.plan_list:
             if p.status == 'pending':
@@ -85,6 +161,45 @@ class ReActAgent:
         self.last_emitted_plan_snapshot = current_snapshot
 
     async def run_with_session(self, input: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        token = scoped_token((options or {}).get('cancelToken'), self.config.timeBudget)
+        trace = None
+        outcome = 'error'
+        ACTIVE_RUNS.inc('react')
+        try:
+            with use_token(token), record_run('react', (options or {}).get('sessionId'), input, options or {}, self.config, self.tool_registry.get_all_tools()) as recorder:
+                if (options or {}).get('trace'):
+                    with trace_run('react') as trace:
+                        result = await self._run_session(input, options)
+                    result['tracePath'] = trace.dump()
+                else:
+                    result = await self._run_session(input, options)
+            if recorder is not None:
+                result['recordingPath'] = recorder.path
+            outcome = 'paused' if result.get('isPaused') else 'completed'
+            return result
+        except OperationCancelled as e:
+            outcome = e.reason
+            raise
+        finally:
+            ACTIVE_RUNS.dec('react')
+            RUNS.inc('react', outcome)
+
+    async def stream_run(self, input: str, options: Optional[Dict[str, Any]] = None, channel: Optional[EventChannel] = None) -> AsyncIterator[StreamEvent]:
+        """Runs :meth:`run_with_session` and yields its events as they are produced, ending with a ``done`` event.
+
+        Events pass through a bounded :class:`EventChannel` (``channel`` or a default one): streamed deltas are
+        coalesced while the reader lags and the run pauses at its next flow-control point once the channel is
+        full. Closing the iterator early cancels the run with reason ``client_disconnected``.
+        """
+        options = dict(options or {})
+        token = options.get('cancelToken') or CancelToken()
+        options['cancelToken'] = token
+        async def run(on_stream):
+            return await self.run_with_session(input, { **options, 'onStream': on_stream })
+        async for event in stream_events(run, channel if channel is not None else EventChannel(), lambda: token.cancel('client_disconnected')):
+            yield event
+
+    async def _run_session(self, input: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         session_id = options.get('sessionId') if options else (self.current_session_id or self.gen_id('sess'))
         self.current_session_id = session_id
         existing = self.session_states.get(session_id)
@@ -95,22 +210,64 @@ class ReActAgent:
             context.steps.append(ReActStep(type='observation', content=f"User provided additional input: {input}"))
             self.emit('normal', { 'content': f"💬 用户输入：{input}" }, session_id, conversation_id, self.gen_id('user_input'), options.get('onStream') if options else None)
             existing.isPaused = False
+            context.stalls = 0
+            fresh = False
         else:
-            conversation_id = self.gen_id('conv')
-            context = AgentContext(input=input, steps=[], tools=self.tool_registry.get_all_tools(), config=self.config)
+            conversation_id = self.gen_conversation_id()
+            context = AgentContext(input=input, steps=StepLog(max(HISTORY_STEPS, self.config.stepWindow), step_log_path(session_id, conversation_id) if session_id else None), tools=self.tool_registry.get_all_tools(), config=self.config)
             start_iteration = 0
+            fresh = True
             self.plan_list = []
             self.last_emitted_plan_snapshot = ''
-            await self.generate_pre_action_tip(input, conversation_id, session_id, options.get('onStream') if options else None)
-            if self.config.autoPlanOnStart:
-                await self.generate_plan(context, options.get('onStream') if options else None, conversation_id, session_id)
-        result = await self.run_internal(context, session_id, conversation_id, options.get('onStream') if options else None, start_iteration)
-        return { 'sessionId': session_id, 'conversationId': conversation_id, 'finalAnswer': result['finalAnswer'], 'isPaused': result['isPaused'] }
+        on_stream = options.get('onStream') if options else None
+        with self.usage_ledger(session_id, on_stream) as ledger, use_ledger(ledger, conversation_id):
+            iterations_before = context.steps.count('thought')
+            try:
+                if fresh:
+                    await self.generate_pre_action_tip(input, conversation_id, session_id, on_stream)
+                    if self.config.autoPlanOnStart:
+                        await self.generate_plan(context, on_stream, conversation_id, session_id)
+                result = await self.run_internal(context, session_id, conversation_id, on_stream, start_iteration)
+            except TokenBudgetExceeded:
+                result = self.stop_for_budget(ledger, session_id, conversation_id, on_stream)
+            ITERATIONS_PER_RUN.observe(context.steps.count('thought') - iterations_before)
+        if not result['isPaused']:
+            context.steps.discard()
+            self.session_states.pop(session_id, None)
+        return { 'sessionId': session_id, 'conversationId': conversation_id, 'finalAnswer': result['finalAnswer'], 'isPaused': result['isPaused'], 'usage': ledger.summary(), 'iterationWaste': dict(context.waste) }
+
+    @contextmanager
+    def usage_ledger(self, session_id: str, on_stream=None) -> Iterator[UsageLedger]:
+        """Yields the ledger LLM usage is charged to: the enclosing run's, or this session's (emitting ``usage_event``s while open)."""
+        ledger = current_ledger()
+        if ledger is not None:
+            yield ledger
+            return
+        ledger = session_ledger(session_id, self.config.tokenBudget)
+        def on_record(record: Dict[str, Any], conversation_id: str) -> None:
+            self.emit('usage_event', { **record, 'session': dict(ledger.total), 'tokenBudget': ledger.token_budget }, session_id, conversation_id, self.gen_id('usage'), on_stream)
+        with ledger.listen(on_record):
+            yield ledger
+
+    def stop_for_budget(self, ledger: UsageLedger, session_id: str, conversation_id: str, on_stream=None) -> Dict[str, Any]:
+        message = f"⛔ 已达到本会话的 token 预算（{ledger.tokens}/{ledger.token_budget}），停止执行。"
+        self.emit('normal', { 'content': message }, session_id, conversation_id, self.gen_id('token_budget'), on_stream)
+        return { 'finalAnswer': message, 'isPaused': False }
 
     async def run_internal(self, context: AgentContext, session_id: str, conversation_id: str, on_stream=None, start_iteration: int = 0) -> Dict[str, Any]:
         for iteration in range(start_iteration, self.config.maxIterations):
+            check_cancelled()
+            await flow_control()
+            ledger = current_ledger()
+            if ledger is not None and ledger.exceeded():
+                return self.stop_for_budget(ledger, session_id, conversation_id, on_stream)
+            remaining = remaining_budget()
+            if remaining is not None and remaining < self.config.deadlineReserve:
+                self.emit('normal', { 'content': f"⏱️ 剩余时间不足（约{remaining:.0f}秒），停止后续迭代并直接生成最终答案" }, session_id, conversation_id, f"deadline_{iteration}", on_stream)
+                break
             try:
-                react_result = await self.reason_and_act(context, on_stream, conversation_id, session_id, iteration + 1)
+                with span('iteration', iteration=iteration):
+                    react_result = await self.reason_and_act(context, on_stream, conversation_id, session_id, iteration + 1)
                 context.steps.append(ReActStep(type='thought', content=react_result.get('thought','')))
                 if react_result['type'] == 'final_answer':
                     changed = self.mark_current_step_done('✅ 已完成')
@@ -131,16 +288,34 @@ class ReActAgent:
                         self.session_states[session_id] = SessionState(context=context, currentIteration=iteration+1, sessionId=session_id, conversationId=conversation_id, isPaused=True, waitingReason=(react_result.get('toolInput') or {}).get('reason') or '需要更多信息')
                         self.emit('waiting_input', { 'message': (react_result.get('toolInput') or {}).get('message') or '请输入更多信息以继续...', 'reason': (react_result.get('toolInput') or {}).get('reason') }, session_id, conversation_id, self.gen_id('waiting'), on_stream)
                         return { 'finalAnswer': '', 'isPaused': True }
+                    local = self.handle_locally(context, react_result)
+                    if local is not None:
+                        kind, observation_step, message = local
+                        context.steps.append(ReActStep(type='action', content=f"Using tool: {react_result.get('toolName')}", toolName=react_result.get('toolName'), toolInput=react_result.get('toolInput')))
+                        context.steps.append(observation_step)
+                        self.record_waste(context, kind)
+                        if message:
+                            self.emit('normal', { 'content': message }, session_id, conversation_id, f"local_action_{iteration}", on_stream)
+                        context.stalls += 1
+                        if 0 < self.config.maxStalls <= context.stalls:
+                            self.record_waste(context, 'loopBreaks')
+                            self.emit('normal', { 'content': f"🔁 连续{context.stalls}次迭代没有新进展，停止循环并直接生成最终答案" }, session_id, conversation_id, f"loop_break_{iteration}", on_stream)
+                            break
+                        continue
+                    context.stalls = 0
                     action_step = ReActStep(type='action', content=f"Using tool: {react_result.get('toolName')}", toolName=react_result.get('toolName'), toolInput=react_result.get('toolInput'))
                     context.steps.append(action_step)
                     tool_event_id = f"tool_{iteration}_{conversation_id}"
                     tool_started_at = int(time.time()*1000)
                     self.emit('tool_call', { 'id': tool_event_id, 'status': 'start', 'tool_name': react_result.get('toolName'), 'args': react_result.get('toolInput'), 'iteration': iteration, 'startedAt': tool_started_at }, session_id, conversation_id, tool_event_id, on_stream)
-                    tool_result = await self.tool_registry.execute_tool(react_result.get('toolName'), react_result.get('toolInput'))
-                    observation = f"Tool executed successfully. Result: {json.dumps(tool_result.get('result'))}" if tool_result.get('success') else f"Tool execution failed. Error: {tool_result.get('error')}"
-                    context.steps.append(ReActStep(type='observation', content=observation, toolName=react_result.get('toolName'), toolOutput=tool_result))
+                    tool_clock = time.perf_counter()
+                    with span('tool_exec', tool=react_result.get('toolName')):
+                        tool_result = await self.tool_registry.execute_tool(react_result.get('toolName'), react_result.get('toolInput'))
+                    TOOL_SECONDS.observe(time.perf_counter() - tool_clock, react_result.get('toolName'))
+                    compact_result = self.compact_tool_result(tool_result, session_id)
+                    context.steps.append(ReActStep(type='observation', toolName=react_result.get('toolName'), toolOutput=compact_result))
                     tool_finished_at = int(time.time()*1000)
-                    self.emit('tool_call', { 'id': tool_event_id, 'status': 'end', 'tool_name': react_result.get('toolName'), 'args': react_result.get('toolInput'), 'result': tool_result, 'success': tool_result.get('success'), 'startedAt': tool_started_at, 'finishedAt': tool_finished_at, 'durationMs': tool_finished_at - tool_started_at, 'iteration': iteration }, session_id, conversation_id, tool_event_id, on_stream)
+                    self.emit('tool_call', { 'id': tool_event_id, 'status': 'end', 'tool_name': react_result.get('toolName'), 'args': react_result.get('toolInput'), 'result': compact_result, 'success': tool_result.get('success'), 'startedAt': tool_started_at, 'finishedAt': tool_finished_at, 'durationMs': tool_finished_at - tool_started_at, 'iteration': iteration }, session_id, conversation_id, tool_event_id, on_stream)
                     await self.generate_observation(tool_result, react_result.get('toolName'), on_stream, conversation_id, session_id, iteration)
                     if tool_result.get('success'):
                         has_change = self.mark_current_step_done(f"✅ 已使用 {react_result.get('toolName')}")
@@ -182,14 +357,102 @@ class ReActAgent:
         final_answer = await self.generate_final_answer(context, on_stream, conversation_id, session_id)
         return { 'finalAnswer': final_answer, 'isPaused': False }
 
+    def handle_locally(self, context: AgentContext, react_result: Dict[str, Any]) -> Optional[Tuple[str, ReActStep, Optional[str]]]:
+        """Answers an action without a tool round-trip when running it cannot add anything new.
+
+        Pseudo-actions get a corrective hint instead of a "tool not found" error. An action repeating an
+        earlier (tool, input) pair still in the step window reuses that call's observation when
+        ``reuseRepeatedActions`` is on and the tool is registered with ``'idempotent': True``. A thought
+        that nearly repeats a recent one adds a nudge to either hint. Returns ``(waste kind, observation
+        step, user-facing message)``, or ``None`` when the tool should run.
+        """
+        tool_name = react_result.get('toolName')
+        tool_input = react_result.get('toolInput')
+        previous = None
+        if tool_name in PSEUDO_ACTIONS and not self.tool_registry.has_tool(tool_name):
+            kind, hint, message = 'pseudoActions', self.pseudo_action_hint(tool_input), None
+        else:
+            tool = self.tool_registry.get_tool(tool_name) or {}
+            if not self.config.reuseRepeatedActions or not tool.get('idempotent'):
+                return None
+            previous = self.find_observation(context, tool_name, tool_input)
+            if previous is None:
+                return None
+            kind = 'repeatedActions'
+            hint = f"Repeated action: {tool_name} was already called with this input, so it was not run again. Choose a different action or give the Final Answer. Earlier result: {self.truncate_observation(self.observation_text(previous), 300)}"
+            message = f"♻️ 重复调用 {tool_name}（参数相同），已复用上次的结果"
+        if self.is_repeated_thought(context, react_result.get('thought') or ''):
+            self.record_waste(context, 'repeatedThoughts', 0)
+            hint += " You are repeating an earlier thought; try a different approach."
+        return kind, ReActStep(type='observation', content=hint, toolName=tool_name, toolOutput=previous.toolOutput if previous else None), message
+
+    def pseudo_action_hint(self, tool_input: Any) -> str:
+        tool_input = tool_input if isinstance(tool_input, dict) else {}
+        if tool_input.get('reason') == 'incomplete_plan':
+            return f"Final Answer blocked: these plan steps are not done yet: {', '.join(str(t) for t in tool_input.get('pending') or [])}. Complete the current step with a tool first."
+        return "No Action or Final Answer found in the last reply. Reply with Thought, Action and Input for one of the available tools, or with a Final Answer."
+
+    def find_observation(self, context: AgentContext, tool_name: str, tool_input: Any) -> Optional[ReActStep]:
+        """The observation of the latest in-window action with this exact tool and input, if it holds a result."""
+        steps = context.steps
+        for i in range(len(steps) - 2, -1, -1):
+            step = steps[i]
+            if step.type == 'action' and step.toolName == tool_name and step.toolInput == tool_input:
+                following = steps[i + 1]
+                if following.type == 'observation' and following.toolOutput is not None:
+                    return following
+        return None
+
+    def is_repeated_thought(self, context: AgentContext, thought: str) -> bool:
+        """Whether ``thought`` (the latest step) equals or nearly equals one of the recent earlier thoughts."""
+        text = ' '.join(thought.lower().split())
+        if not text:
+            return False
+        for step in context.steps[-HISTORY_STEPS - 1:-1]:
+            if step.type != 'thought':
+                continue
+            other = ' '.join(step.content.lower().split())
+            if other == text or (min(len(text), len(other)) >= 20 and difflib.SequenceMatcher(None, text, other).ratio() >= THOUGHT_SIMILARITY):
+                return True
+        return False
+
+    def record_waste(self, context: AgentContext, kind: str, saved: int = 1) -> None:
+        """Counts a wasted iteration handled locally; ``savedIterations`` adds up the LLM or tool round-trips avoided."""
+        context.waste[kind] = context.waste.get(kind, 0) + 1
+        if saved:
+            context.waste['savedIterations'] = context.waste.get('savedIterations', 0) + saved
+            ITERATIONS_SAVED.inc(kind, amount=saved)
+
+    def compact_tool_result(self, tool_result: Dict[str, Any], session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Moves a large tool result into the artifact store, returning a copy that holds only a reference.
+
+        Results whose JSON form is at most ``artifactThreshold`` bytes (or failed calls) are returned unchanged.
+        Small top-level fields of dict results (e.g. ``planUpdate``) are kept inline next to the reference.
+        """
+        result = tool_result.get('result')
+        threshold = self.config.artifactThreshold
+        if threshold <= 0 or not tool_result.get('success') or result is None:
+            return tool_result
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        if len(data) <= threshold:
+            return tool_result
+        ref = self.artifact_store.put_serialized(data, summarize_result(result), session_id=session_id)
+        compact: Dict[str, Any] = { 'artifact': ref }
+        if isinstance(result, dict):
+            for k, v in result.items():
+                if isinstance(v, (dict, list, str)) and len(json.dumps(v, ensure_ascii=False)) > 200:
+                    continue
+                compact[k] = v
+        return { **tool_result, 'result': compact }
+
     def mark_all_pending_done(self, note: Optional[str] = None) -> None:
         self.plan_list = [TaskStep(id=p.id, title=p.title, status=('done' if p.status == 'pending' else p.status), note=(note or p.note)) for p in self.plan_list]
 
     async def generate_plan(self, context: AgentContext, on_stream=None, conversation_id: Optional[str] = None, session_id: Optional[str] = None) -> None:
         language_prompt = create_language_prompt(self.config.language)
         try:
-            response = await self.llm.invoke([{ 'role': 'system', 'content': create_planner_prompt(context.input) }])
-            self.plan_list = [TaskStep(id=f"plan_{i+1}", title=t['title'], status='pending') for i, t in enumerate(json.loads(response['content']))]
+            response = await self.router.resolve('plan').invoke([{ 'role': 'system', 'content': create_planner_prompt(context.input) }])
+            self.plan_list = [TaskStep(id=f"plan_{i+1}", title=t['title'], status='pending') for i, t in enumerate(parse_llm_json(response['content'], expect='array', schema=PLANNER_SCHEMA, site='react_plan'))]
             return
         except Exception:
             pass
@@ -201,10 +464,11 @@ class ReActAgent:
 
     async def generate_pre_action_tip(self, input: str, conversation_id: str, session_id: str, on_stream=None) -> str:
         pre_prompt = create_pre_action_prompt(input)
-        stream = self.llm.stream([{ 'role': 'system', 'content': pre_prompt }, { 'role': 'user', 'content': input }])
+        stream = self.router.resolve('pre_action').stream([{ 'role': 'system', 'content': pre_prompt }, { 'role': 'user', 'content': input }])
         pre_action_event_id = self.gen_id('pre_action')
         tip = ''
         async for chunk in stream:
+            await flow_control()
             tip += chunk.get('content') or ''
             self.emit('normal', { 'content': chunk.get('content') or '', 'stream': True }, session_id, conversation_id, pre_action_event_id, on_stream)
         return tip
@@ -216,13 +480,16 @@ class ReActAgent:
             if changed:
                 self.emit_plan_update(session_id or 'default', conversation_id or 'default', on_stream)
         current_step = next((p for p in self.plan_list if p.status == 'doing'), None) or next((p for p in self.plan_list if p.status == 'pending'), None)
-        tools_description = self.tool_registry.get_tools_description()
-        system_prompt = self.build_react_prompt(current_step, tools_description)
-        conversation_history = self.build_conversation_history(context)
+        with span('prompt_build'):
+            tools_description = self.tool_registry.get_tools_description()
+            system_prompt = self.build_react_prompt(current_step, tools_description)
+        with span('history_build'):
+            conversation_history = self.build_conversation_history(context)
         messages = [{ 'role': 'system', 'content': system_prompt }] + conversation_history
-        response = await self.llm.invoke(messages)
+        response = await self.router.resolve('reason').invoke(messages)
         content = response.get('content') or ''
-        parsed = self.parse_react_output(content)
+        with span('parse'):
+            parsed = self.parse_react_output(content)
         has_incomplete = any(p.status != 'done' for p in self.plan_list)
         if self.config.strictActionUntilDone and has_incomplete and parsed['type'] == 'final_answer':
             pending_titles = [p.title for p in self.plan_list if p.status != 'done']
@@ -256,14 +523,12 @@ class ReActAgent:
                     raw_input_str = None
                     if im:
                         raw_input_str = im.group(1).strip()
-                        try:
-                            jm = re.search(r"\{[\s\S]*\}", raw_input_str)
-                            if jm:
-                                tool_input = json.loads(jm.group(0))
-                            else:
+                        tool_input = parse_llm_json(raw_input_str, expect='object', site='react_input', default=None)
+                        if tool_input is None:
+                            try:
                                 tool_input = json.loads(raw_input_str)
-                        except Exception:
-                            tool_input = { 'input': raw_input_str }
+                            except Exception:
+                                tool_input = { 'input': raw_input_str }
                     if tool_name.lower().strip() == 'final answer':
                         answer_text = tool_input if isinstance(tool_input, str) else (tool_input.get('input') if isinstance(tool_input, dict) else (raw_input_str or ''))
                         return { 'type': 'final_answer', 'thought': thought, 'content': str(answer_text).strip() }
@@ -272,9 +537,19 @@ class ReActAgent:
             pass
         return { 'type': 'action', 'thought': content, 'toolName': 'continue_thinking', 'toolInput': { 'thought': content } }
 
+    def base_prompt(self, tools_description: Optional[str] = None) -> str:
+        """System prompt for the configured language and tools; compiled once per combination."""
+        key = (self.config.language, tools_description)
+        prompt = self.prompt_cache.get(key)
+        if prompt is None:
+            prompt = create_system_prompt(create_language_prompt(self.config.language), tools_description)
+            if len(self.prompt_cache) >= PROMPT_CACHE_SIZE:
+                self.prompt_cache.clear()
+            self.prompt_cache[key] = prompt
+        return prompt
+
     def build_react_prompt(self, current_step: Optional[TaskStep] = None, tools_description: Optional[str] = None) -> str:
-        language_instructions = create_language_prompt(self.config.language)
-        base_prompt = create_system_prompt(language_instructions, tools_description)
+        base_prompt = self.base_prompt(tools_description)
         if current_step:
             remaining = '\n'.join([f"- {p.title}" for p in self.plan_list if p.status != 'done']) or '- 无'
             return (
@@ -324,15 +599,15 @@ class ReActAgent:
         return (result_str[:100] + '...') if len(result_str) > 100 else result_str
 
     async def generate_final_answer(self, context: AgentContext, on_stream=None, conversation_id: Optional[str] = None, session_id: Optional[str] = None) -> str:
-        language_instructions = create_language_prompt(self.config.language)
-        system_prompt = create_system_prompt(language_instructions)
+        system_prompt = self.base_prompt()
         history = self.build_conversation_history(context)
         messages = [{ 'role': 'system', 'content': system_prompt }] + history + [{ 'role': 'user', 'content': f"Based on the above reasoning and observations, please provide a final answer to: {context.input}\n\nPlease be concise and direct in your response." }]
         if self.config.streamOutput and on_stream:
-            stream = self.llm.stream(messages)
+            stream = self.router.resolve('final_answer').stream(messages)
             full = ''
             stream_event_id = f"final_answer_{conversation_id or int(time.time()*1000)}"
             async for chunk in stream:
+                await flow_control()
                 c = chunk.get('content') or ''
                 if c:
                     full += c
@@ -340,7 +615,7 @@ class ReActAgent:
             self.emit('normal', { 'content': '', 'stream': True, 'done': True }, session_id or 'default', conversation_id or 'default', stream_event_id, on_stream)
             return full
         else:
-            response = await self.llm.invoke(messages)
+            response = await self.router.resolve('final_answer').invoke(messages)
             content = response.get('content') or ''
             self.emit('normal', { 'content': content }, session_id or 'default', conversation_id or 'default', f"final_full_{int(time.time()*1000)}", on_stream)
             return content
@@ -350,16 +625,29 @@ class ReActAgent:
         plan_summary = '\n'.join([f"{i+1}. {p.title} [{p.status}]" for i, p in enumerate(self.plan_list)])
         if plan_summary:
             messages.append({ 'role': 'assistant', 'content': f"Plan Status:\n{plan_summary}" })
-        recent_steps = context.steps[-6:]
+        recent_steps = context.steps[-HISTORY_STEPS:]
         for step in recent_steps:
             if step.type == 'thought':
                 messages.append({ 'role': 'assistant', 'content': f"Thought: {step.content}" })
             elif step.type == 'action':
                 messages.append({ 'role': 'assistant', 'content': f"Action: {step.toolName or 'unknown'}\nInput: {json.dumps(step.toolInput, ensure_ascii=False)}" })
             elif step.type == 'observation':
-                messages.append({ 'role': 'user', 'content': f"Observation: {self.truncate_observation(step.content)}" })
+                messages.append({ 'role': 'user', 'content': f"Observation: {self.truncate_observation(self.observation_text(step))}" })
         return messages
 
+    def observation_text(self, step: ReActStep) -> str:
+        """An observation step's text: its own content, or else derived from the (compacted) tool result it holds."""
+        if step.content or step.toolOutput is None:
+            return step.content
+        output = step.toolOutput
+        if not output.get('success'):
+            return f"Tool execution failed. Error: {output.get('error')}"
+        result = output.get('result')
+        artifact = result.get('artifact') if isinstance(result, dict) else None
+        if isinstance(artifact, dict) and 'artifactId' in artifact:
+            return f"Tool executed successfully. Result (artifact {artifact['artifactId']}, {artifact['size']} bytes): {artifact['summary']}"
+        return f"Tool executed successfully. Result: {json.dumps(result)}"
+
     def truncate_observation(self, content: str, max_length: int = 500) -> str:
         return content if len(content) <= max_length else (content[:max_length] + '... (truncated)')
 
@@ -376,9 +664,10 @@ class ReActAgent:
             event = { 'id': event_id, 'role': 'assistant', 'type': 'waiting_input_event', 'data': payload }
         else:
             event = { 'id': event_id, 'role': 'assistant', 'type': type, 'data': payload }
-        stream_event = StreamEvent(sessionId=session_id, conversationId=conversation_id, event=event, timestamp=int(time.time()*1000))
-        self.stream_manager.emit_stream_event(stream_event)
-        on_stream(stream_event)
+        with span('emit'):
+            stream_event = StreamEvent(sessionId=session_id, conversationId=conversation_id, event=event, timestamp=int(time.time()*1000))
+            self.stream_manager.emit_stream_event(stream_event)
+            on_stream(stream_event)
 
     def get_stream_manager(self) -> StreamManager:
         return self.stream_manager
@@ -393,3 +682,4 @@ class ReActAgent:
         data = self.config.__dict__.copy()
         data.update(new_config or {})
         self.config = AgentConfig(**data)
+        self.router = ModelRouter(self.config, self.llm)
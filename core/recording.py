@@ -0,0 +1,311 @@
+import asyncio
+import contextvars
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Collection, Dict, Iterator, List, Optional, Tuple
+
+from core.cancellation import guard
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAPE_VERSION = 1
+WRITE_BUFFER = 1 << 16
+
+def record_dir() -> str:
+    return os.environ.get('RECORD_DIR') or os.path.join(REPO_ROOT, '.recordings')
+
+def recording_enabled() -> bool:
+    return (os.environ.get('RECORD_SESSIONS') or '').lower() in ('1', 'true')
+
+def _digest(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+class SessionRecorder:
+    """Appends every LLM call, tool call and RAG request of a session to ``<session>.tape.jsonl``.
+
+    One JSON object per line: a ``session`` header per run, ``blob`` lines holding each distinct message
+    text once, ``llm`` lines (message blob refs, output, latency; per-chunk delays for streams) and
+    ``call`` lines for tools and RAG requests. A paused session that is resumed appends a new run.
+    Lines are buffered (``WRITE_BUFFER`` bytes) rather than flushed one by one on the event loop; the
+    rest is written on :meth:`close`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self._blobs = set()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('{"t":"blob"'):
+                        self._blobs.add(json.loads(line)['h'])
+        self._file = open(path, 'a', encoding='utf-8', buffering=WRITE_BUFFER)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(_dumps(record) + '\n')
+
+    def _at(self) -> float:
+        return _ms(time.perf_counter() - self.started)
+
+    def _refs(self, messages: List[Any]) -> List[List[str]]:
+        refs = []
+        for m in messages or []:
+            role, content = (m.get('role') or 'user', str(m.get('content') or '')) if isinstance(m, dict) else ('user', str(m))
+            h = _digest(content)
+            if h not in self._blobs:
+                self._blobs.add(h)
+                self._write({ 't': 'blob', 'h': h, 's': content })
+            refs.append([role, h])
+        return refs
+
+    def start_run(self, kind: str, session_id: str, input: str, options: Dict[str, Any], config: Any, tools: Optional[List[Dict[str, Any]]] = None) -> None:
+        self._write({ 't': 'session', 'v': TAPE_VERSION, 'kind': kind, 'sessionId': session_id, 'conversationId': options.get('conversationId'), 'input': input, 'config': dataclasses.asdict(config) if dataclasses.is_dataclass(config) else config, **({ 'tools': tools } if tools else {}), 'at': int(time.time()*1000) })
+
+    async def invoke(self, llm: Any, purpose: str, model: str, messages: List[Any]) -> Dict[str, Any]:
+        record = { 't': 'llm', 'op': 'invoke', 'p': purpose, 'm': model, 'in': self._refs(messages), 'at': self._at() }
+        started = time.perf_counter()
+        try:
+            resp = await llm.invoke(messages)
+        except Exception as e:
+            self._write({ **record, 'd': _ms(time.perf_counter() - started), 'e': str(e) })
+            raise
+        self._write({ **record, 'd': _ms(time.perf_counter() - started), 'out': resp.get('content') or '', 'u': resp.get('usage') })
+        return resp
+
+    async def stream(self, llm: Any, purpose: str, model: str, messages: List[Any]) -> AsyncIterator[Dict[str, Any]]:
+        record = { 't': 'llm', 'op': 'stream', 'p': purpose, 'm': model, 'in': self._refs(messages), 'at': self._at() }
+        started = last = time.perf_counter()
+        chunks: List[List[Any]] = []
+        usage = None
+        error = None
+        try:
+            async for chunk in llm.stream(messages):
+                now = time.perf_counter()
+                if chunk.get('content'):
+                    chunks.append([_ms(now - last), chunk['content']])
+                    last = now
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                yield chunk
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            self._write({ **record, 'd': _ms(time.perf_counter() - started), 'c': chunks, 'u': usage, **({ 'e': error } if error else {}) })
+
+    async def call(self, kind: str, name: str, input: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        record = { 't': 'call', 'k': kind, 'n': name, 'h': _digest(input), 'in': input, 'at': self._at() }
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            self._write({ **record, 'd': _ms(time.perf_counter() - started), 'e': str(e) })
+            raise
+        self._write({ **record, 'd': _ms(time.perf_counter() - started), 'r': result })
+        return result
+
+    def close(self) -> None:
+        self._file.close()
+
+class ReplayMiss(LookupError):
+    pass
+
+class TapeRun:
+    def __init__(self, header: Dict[str, Any]):
+        self.header = header
+        self.records: List[Dict[str, Any]] = []
+
+    @property
+    def kind(self) -> str:
+        return self.header.get('kind') or 'react'
+
+def load_tape(path: str) -> Tuple[List[TapeRun], Dict[str, str]]:
+    """Reads a tape into its runs and the blob table."""
+    runs: List[TapeRun] = []
+    blobs: Dict[str, str] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            t = record.get('t')
+            if t == 'blob':
+                blobs[record['h']] = record['s']
+            elif t == 'session':
+                runs.append(TapeRun(record))
+            elif runs:
+                runs[-1].records.append(record)
+    return runs, blobs
+
+class TapeReplayer:
+    """Serves the LLM, tool and RAG calls of one recorded run instead of performing them.
+
+    A call is answered by the first unused recording of the same purpose (LLM) or kind and name (tools,
+    RAG) whose input matches exactly, else by the first unused one in recorded order, so prompts that
+    embed fresh ids still replay. Recorded latencies are reproduced divided by ``speed`` (``0`` skips
+    all waiting). Kinds or ``kind:name`` pairs listed in ``live`` run for real, e.g. ``tool`` for the
+    coding agent, whose tools are in-process pipelines whose own LLM and RAG calls then replay.
+    """
+
+    def __init__(self, run: TapeRun, blobs: Dict[str, str], speed: float = 1.0, live: Collection[str] = ()):
+        self.speed = speed
+        self.live = set(live)
+        self.blobs = blobs
+        self.used = 0
+        self.misses = 0
+        self._pending: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for record in run.records:
+            key = ('llm', record.get('p') or '') if record.get('t') == 'llm' else (record.get('k') or '', record.get('n') or '')
+            self._pending.setdefault(key, []).append(record)
+
+    def _take(self, key: Tuple[str, ...], match: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        pending = self._pending.get(key) or []
+        for i, record in enumerate(pending):
+            if match(record):
+                break
+        else:
+            if not pending:
+                self.misses += 1
+                raise ReplayMiss(f"no recorded {'/'.join(key)} call left")
+            i = 0
+        self.used += 1
+        return pending.pop(i)
+
+    async def _wait(self, ms: float) -> None:
+        if self.speed > 0 and ms > 0:
+            await guard(asyncio.sleep(ms / 1000 / self.speed))
+
+    def _llm_record(self, purpose: str, messages: List[Any]) -> Dict[str, Any]:
+        contents = [str(m.get('content') or '') if isinstance(m, dict) else str(m) for m in messages or []]
+        return self._take(('llm', purpose), lambda r: [self.blobs.get(h) for _, h in r.get('in') or []] == contents)
+
+    async def invoke(self, llm: Any, purpose: str, model: str, messages: List[Any]) -> Dict[str, Any]:
+        if 'llm' in self.live:
+            return await llm.invoke(messages)
+        record = self._llm_record(purpose, messages)
+        await self._wait(record.get('d') or 0)
+        if record.get('e'):
+            raise RuntimeError(record['e'])
+        if record.get('op') == 'stream':
+            return { 'content': ''.join(c for _, c in record.get('c') or []), 'usage': record.get('u') }
+        return { 'content': record.get('out') or '', 'usage': record.get('u') }
+
+    async def stream(self, llm: Any, purpose: str, model: str, messages: List[Any]) -> AsyncIterator[Dict[str, Any]]:
+        if 'llm' in self.live:
+            async for chunk in llm.stream(messages):
+                yield chunk
+            return
+        record = self._llm_record(purpose, messages)
+        chunks = record.get('c') if record.get('op') == 'stream' else [[record.get('d') or 0, record.get('out') or '']]
+        for delay, content in chunks or []:
+            await self._wait(delay)
+            yield { 'content': content }
+        if record.get('e'):
+            raise RuntimeError(record['e'])
+        if record.get('u'):
+            yield { 'content': '', 'usage': record['u'] }
+
+    async def call(self, kind: str, name: str, input: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if kind in self.live or f"{kind}:{name}" in self.live:
+            return await fn()
+        h = _digest(input)
+        record = self._take((kind, name), lambda r: r.get('h') == h)
+        await self._wait(record.get('d') or 0)
+        if record.get('e'):
+            raise RuntimeError(record['e'])
+        return record.get('r')
+
+_current_tape: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar('tape', default=None)
+
+def current_tape() -> Optional[Any]:
+    """The active :class:`SessionRecorder` or :class:`TapeReplayer`, if any."""
+    return _current_tape.get()
+
+@contextmanager
+def use_tape(tape: Optional[Any]) -> Iterator[Optional[Any]]:
+    reset = _current_tape.set(tape)
+    try:
+        yield tape
+    finally:
+        _current_tape.reset(reset)
+
+async def taped_call(kind: str, name: str, input: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Runs ``fn()`` through the active tape: recorded while recording, answered from the tape while replaying."""
+    tape = _current_tape.get()
+    if tape is None:
+        return await fn()
+    return await tape.call(kind, name, input, fn)
+
+@contextmanager
+def record_run(kind: str, session_id: Optional[str], input: str, options: Dict[str, Any], config: Any, tools: Optional[Dict[str, Any]] = None) -> Iterator[Optional[SessionRecorder]]:
+    """Records the run to ``<RECORD_DIR>/<session>.tape.jsonl`` when ``options['record']`` or ``RECORD_SESSIONS`` is set.
+
+    ``tools`` (name -> tool definition) go into the run header without their ``execute``, so a replay
+    sees the same tool list and ``idempotent`` flags.
+
+    Characters other than letters, digits, ``_``, ``.`` and ``-`` in the session id are replaced in
+    the file name, so a client-supplied id cannot point outside ``RECORD_DIR``.
+
+    Nothing is recorded inside a run that is already being recorded or replayed (e.g. a coding agent's
+    nested ReAct loop).
+    """
+    if _current_tape.get() is not None or not (options.get('record') or recording_enabled()):
+        yield None
+        return
+    name = session_id or f"sess_{int(time.time()*1000)}"
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', name)[:128]
+    recorder = SessionRecorder(os.path.join(record_dir(), f"{safe}.tape.jsonl"))
+    try:
+        recorder.start_run(kind, name, input, options, config, [{ k: v for k, v in tool.items() if k != 'execute' } for tool in (tools or {}).values()])
+        with use_tape(recorder):
+            yield recorder
+    finally:
+        recorder.close()
+
+async def replay_session(path: str, speed: float = 1.0, live: Optional[Collection[str]] = None, on_stream: Optional[Callable[[Any], None]] = None, llm: Any = None) -> List[Dict[str, Any]]:
+    """Re-runs every run of a recorded session against its tape and returns the run results.
+
+    Each run gets a fresh agent built from the recorded config (stage cache off, so every stage
+    executes) and a new session id, so checkpoints of the original session are not resumed. ReAct
+    runs get the recorded tool definitions, whose calls are then answered from the tape. ``live``
+    defaults to ``('tool',)`` for coding runs and to nothing for ReAct runs. Each result carries
+    ``replay: { used, misses, wallMs }``.
+    """
+    from core.react_agent import ReActAgent
+    from coder_agent.core.coding_agent import CodingAgent
+    runs, blobs = load_tape(path)
+    results: List[Dict[str, Any]] = []
+    session_id = f"replay_{int(time.time()*1000)}"
+    react: Optional[ReActAgent] = None
+    conversation_id: Optional[str] = None
+    for run in runs:
+        header = run.header
+        config = { **(header.get('config') or {}), 'stageCache': False }
+        replayer = TapeReplayer(run, blobs, speed, ('tool',) if live is None and run.kind == 'coding' else (live or ()))
+        options = { 'sessionId': session_id, 'conversationId': conversation_id if header.get('conversationId') else None, 'onStream': on_stream }
+        started = time.perf_counter()
+        with use_tape(replayer):
+            if run.kind == 'coding':
+                result = await CodingAgent(config, llm=llm).run(header.get('input') or '', options)
+            else:
+                react = react or ReActAgent(config, llm=llm)
+                for tool in header.get('tools') or []:
+                    if not react.tool_registry.has_tool(tool.get('name')):
+                        react.tool_registry.register_tool(tool)
+                result = await react.run_with_session(header.get('input') or '', options)
+        conversation_id = result.get('conversationId') or conversation_id
+        result['replay'] = { 'used': replayer.used, 'misses': replayer.misses, 'wallMs': int((time.perf_counter() - started) * 1000) }
+        results.append(result)
+    return results
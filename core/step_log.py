@@ -0,0 +1,116 @@
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from aitypes import ReActStep
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def step_log_dir() -> str:
+    return os.environ.get('STEP_LOG_DIR') or os.path.join(REPO_ROOT, '.steplogs')
+
+def step_log_path(session_id: str, conversation_id: Optional[str] = None) -> str:
+    """One file per agent context: a session id reused for a new conversation gets its own log."""
+    name = f"{session_id}_{conversation_id}" if conversation_id else session_id
+    return os.path.join(step_log_dir(), f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)[:160]}.jsonl")
+
+_swept = False
+
+def remove_stale_step_logs(max_age: Optional[float] = None) -> None:
+    """Deletes logs untouched for ``max_age`` seconds (``STEP_LOG_TTL``, default a day), e.g. left behind by a
+    process that exited with sessions still paused."""
+    cutoff = time.time() - (max_age if max_age is not None else float(os.environ.get('STEP_LOG_TTL') or '86400'))
+    try:
+        with os.scandir(step_log_dir()) as it:
+            for e in it:
+                if e.name.endswith('.jsonl') and e.stat().st_mtime < cutoff:
+                    os.remove(e.path)
+    except OSError:
+        pass
+
+def _step_to_dict(step: ReActStep) -> Dict[str, Any]:
+    record: Dict[str, Any] = { 'type': step.type }
+    for key in ('content', 'toolName', 'toolInput', 'toolOutput'):
+        value = getattr(step, key)
+        if value not in (None, ''):
+            record[key] = value
+    return record
+
+class StepLog:
+    """A session's ReAct steps, keeping only the most recent ones in memory.
+
+    Once ``2 * window`` steps are held, all but the last ``window`` are appended to ``path`` (one JSON
+    object per line) and dropped, so steps are written out in batches. Indexing, slicing and iteration
+    see the in-memory steps; :meth:`history` reads the spilled ones back. Without a ``path`` older
+    steps are simply discarded. Per-type counts cover every step. :meth:`discard` deletes the file
+    once the session is over; the first spill of a process also sweeps stale logs.
+    """
+
+    def __init__(self, window: int = 24, path: Optional[str] = None):
+        self.window = max(1, window)
+        self.path = path
+        self.spilled = 0
+        self._steps: List[ReActStep] = []
+        self._counts: Dict[str, int] = {}
+
+    def append(self, step: ReActStep) -> None:
+        if step.toolName is not None:
+            step.toolName = sys.intern(step.toolName)
+        self._steps.append(step)
+        self._counts[step.type] = self._counts.get(step.type, 0) + 1
+        if len(self._steps) >= 2 * self.window:
+            self._spill(len(self._steps) - self.window)
+
+    def _spill(self, count: int) -> None:
+        global _swept
+        old = self._steps[:count]
+        del self._steps[:count]
+        self.spilled += count
+        if not self.path:
+            return
+        if not _swept:
+            _swept = True
+            remove_stale_step_logs()
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for step in old:
+                    f.write(json.dumps(_step_to_dict(step), ensure_ascii=False, default=str) + '\n')
+        except OSError:
+            pass
+
+    def discard(self) -> None:
+        """Deletes the spilled steps from disk; :meth:`history` then only covers the window."""
+        if self.spilled and self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self.path = None
+
+    def count(self, type: str) -> int:
+        return self._counts.get(type, 0)
+
+    @property
+    def total(self) -> int:
+        return self.spilled + len(self._steps)
+
+    def history(self) -> Iterator[ReActStep]:
+        """Every step of the session, oldest first: the spilled ones (as far as they could be written) and the window."""
+        if self.spilled and self.path and os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    yield ReActStep(**json.loads(line))
+        yield from self._steps
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def __iter__(self) -> Iterator[ReActStep]:
+        return iter(self._steps)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        return self._steps[index]
@@ -0,0 +1,148 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_CJK = re.compile('[\u3400-\u9fff\uf900-\ufaff]')
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for providers that report no usage: one token per CJK character, four characters otherwise."""
+    text = text or ''
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _load_prices() -> Dict[str, Dict[str, float]]:
+    try:
+        return json.loads(os.environ.get('LLM_PRICES') or '{}')
+    except Exception:
+        return {}
+
+MODEL_PRICES = _load_prices()
+
+def call_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Cost from ``LLM_PRICES`` (per million tokens: ``input``, ``output``, optional ``cached``), or None if unpriced."""
+    price = MODEL_PRICES.get(model)
+    if not price:
+        return None
+    uncached = max(0, input_tokens - cached_tokens)
+    return (uncached * price.get('input', 0) + cached_tokens * price.get('cached', price.get('input', 0)) + output_tokens * price.get('output', 0)) / 1_000_000
+
+def _empty() -> Dict[str, Any]:
+    return { 'calls': 0, 'inputTokens': 0, 'outputTokens': 0, 'cachedTokens': 0, 'latencyMs': 0, 'cost': 0.0 }
+
+def _add(bucket: Dict[str, Any], record: Dict[str, Any]) -> None:
+    bucket['calls'] += 1
+    bucket['inputTokens'] += record['inputTokens']
+    bucket['outputTokens'] += record['outputTokens']
+    bucket['cachedTokens'] += record['cachedTokens']
+    bucket['latencyMs'] += record['latencyMs']
+    bucket['cost'] += record.get('cost') or 0.0
+
+class UsageLedger:
+    """LLM usage of one session, aggregated in total and per conversation and call purpose.
+
+    ``token_budget`` caps input plus output tokens for the session; agents check :meth:`exceeded`
+    between iterations and stop gracefully once it is reached, and every LLM call made after that
+    raises :class:`TokenBudgetExceeded` (see :func:`check_token_budget`). Runs observe new records
+    through :meth:`listen` for their own duration.
+    """
+
+    def __init__(self, session_id: str, token_budget: Optional[int] = None):
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self.total = _empty()
+        self.by_conversation: Dict[str, Dict[str, Any]] = {}
+        self.by_purpose: Dict[str, Dict[str, Any]] = {}
+        self._listeners: List[Callable[[Dict[str, Any], str], Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> int:
+        return self.total['inputTokens'] + self.total['outputTokens']
+
+    def exceeded(self) -> bool:
+        return bool(self.token_budget) and self.tokens >= self.token_budget
+
+    def record(self, record: Dict[str, Any], conversation_id: str) -> None:
+        with self._lock:
+            _add(self.total, record)
+            _add(self.by_conversation.setdefault(conversation_id, _empty()), record)
+            _add(self.by_purpose.setdefault(record['purpose'], _empty()), record)
+        for listener in list(self._listeners):
+            try:
+                listener(record, conversation_id)
+            except Exception:
+                pass
+
+    @contextmanager
+    def listen(self, callback: Callable[[Dict[str, Any], str], Any]):
+        self._listeners.append(callback)
+        try:
+            yield self
+        finally:
+            self._listeners.remove(callback)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return { 'sessionId': self.session_id, 'tokenBudget': self.token_budget, 'total': dict(self.total), 'byConversation': { k: dict(v) for k, v in self.by_conversation.items() }, 'byPurpose': { k: dict(v) for k, v in self.by_purpose.items() } }
+
+_ledgers_lock = threading.Lock()
+_ledgers: 'OrderedDict[str, UsageLedger]' = OrderedDict()
+MAX_LEDGERS = 1000
+
+def session_ledger(session_id: str, token_budget: Optional[int] = None) -> UsageLedger:
+    with _ledgers_lock:
+        ledger = _ledgers.get(session_id)
+        if ledger is None:
+            ledger = UsageLedger(session_id, token_budget)
+            _ledgers[session_id] = ledger
+            while len(_ledgers) > MAX_LEDGERS:
+                _ledgers.popitem(last=False)
+        else:
+            _ledgers.move_to_end(session_id)
+            if token_budget:
+                ledger.token_budget = token_budget
+        return ledger
+
+def get_session_usage(session_id: str) -> Optional[Dict[str, Any]]:
+    with _ledgers_lock:
+        ledger = _ledgers.get(session_id)
+    return ledger.summary() if ledger else None
+
+_current: contextvars.ContextVar[Optional[Tuple[UsageLedger, str]]] = contextvars.ContextVar('usage_ledger', default=None)
+
+def current_ledger() -> Optional[UsageLedger]:
+    scope = _current.get()
+    return scope[0] if scope else None
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised instead of an LLM call once the current session's token budget is used up."""
+
+def check_token_budget() -> None:
+    ledger = current_ledger()
+    if ledger is not None and ledger.exceeded():
+        raise TokenBudgetExceeded(f"token budget exhausted ({ledger.tokens}/{ledger.token_budget})")
+
+@contextmanager
+def use_ledger(ledger: UsageLedger, conversation_id: str):
+    reset = _current.set((ledger, conversation_id))
+    try:
+        yield ledger
+    finally:
+        _current.reset(reset)
+
+def record_llm_call(purpose: str, model: str, usage: Optional[Dict[str, Any]], prompt_text: str, output_text: str, ttft_ms: int, latency_ms: int) -> Dict[str, Any]:
+    """Builds the usage record of one call and adds it to the current session ledger, if any."""
+    estimated = not usage
+    input_tokens = int(usage.get('inputTokens') or 0) if usage else estimate_tokens(prompt_text)
+    output_tokens = int(usage.get('outputTokens') or 0) if usage else estimate_tokens(output_text)
+    cached_tokens = int((usage or {}).get('cachedTokens') or 0)
+    record = { 'purpose': purpose, 'model': model, 'inputTokens': input_tokens, 'outputTokens': output_tokens, 'cachedTokens': cached_tokens, 'ttftMs': ttft_ms, 'latencyMs': latency_ms, 'estimated': estimated, 'cost': call_cost(model, input_tokens, output_tokens, cached_tokens) }
+    scope = _current.get()
+    if scope:
+        scope[0].record(record, scope[1])
+    return record
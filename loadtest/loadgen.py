@@ -0,0 +1,301 @@
+"""SSE load generator for ``/api/agent/stream`` and ``/api/coding-agent/stream``.
+
+    python -m loadtest.loadgen --spawn --concurrency 5,10,25,50 --endpoint mixed
+
+Runs one load level per ``--concurrency`` value and reports sessions/sec, time to first event,
+inter-event latency percentiles and, scraped from the server's ``/metrics``, its RSS and event-loop
+lag. ``--spawn`` starts the mock LLM, the mock RAG service and the server (``--workers`` session-sharded
+worker processes, see :mod:`core.cluster`) locally, wired to each other; otherwise ``--base-url`` must
+point to a running server. Behind the cluster router ``/metrics`` covers every worker: RSS and counters
+are summed over workers, the last event-loop lag is the worst worker's.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = { 'agent': '/api/agent/stream', 'coding': '/api/coding-agent/stream' }
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * scale
+    return { 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': ordered[-1] * scale }
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+_WORKER_LABEL = re.compile(r'worker="\d+",?')
+
+def parse_metrics(text: str) -> Dict[Tuple[str, str], float]:
+    samples: Dict[Tuple[str, str], float] = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line.strip())
+        if not match:
+            continue
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        name, labels = match.group(1), _WORKER_LABEL.sub('', match.group(2) or '').replace(',}', '}')
+        key = (name, '' if labels == '{}' else labels)
+        if key not in samples:
+            samples[key] = value
+        elif name == 'agent_event_loop_lag_last_seconds':
+            samples[key] = max(samples[key], value)
+        else:
+            samples[key] += value
+    return samples
+
+def histogram_percentiles(before: Dict[Tuple[str, str], float], after: Dict[Tuple[str, str], float], name: str) -> Dict[str, float]:
+    """Upper-bound percentiles (ms) of the observations a histogram received between two scrapes."""
+    buckets: List[Tuple[float, float]] = []
+    for (metric, labels), value in after.items():
+        if metric != f'{name}_bucket':
+            continue
+        bound = re.search(r'le="([^"]+)"', labels).group(1)
+        buckets.append((float('inf') if bound == '+Inf' else float(bound), value - before.get((metric, labels), 0.0)))
+    buckets.sort()
+    total = buckets[-1][1] if buckets else 0.0
+    if not total:
+        return {}
+    def pick(p: float) -> float:
+        for bound, cumulative in buckets:
+            if cumulative >= p * total:
+                return bound * 1000
+        return float('inf')
+    return { 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'samples': total }
+
+async def run_session(client: httpx.AsyncClient, base_url: str, endpoint: str, index: int, args: argparse.Namespace) -> Dict[str, Any]:
+    params = { 'prompt': f'{args.prompt} #{index}', 'model': args.model, **dict(p.split('=', 1) for p in args.param) }
+    started = time.perf_counter()
+    first: Optional[float] = None
+    last = started
+    gaps: List[float] = []
+    events = 0
+    done: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    try:
+        async with client.stream('GET', base_url + ENDPOINTS[endpoint], params=params, timeout=httpx.Timeout(args.timeout, connect=10.0)) as resp:
+            if resp.status_code != 200:
+                error = f'HTTP {resp.status_code}'
+            else:
+                event = None
+                async for line in resp.aiter_lines():
+                    if line.startswith('event:'):
+                        event = line[6:].strip()
+                    elif line.startswith('data:'):
+                        now = time.perf_counter()
+                        if first is None:
+                            first = now - started
+                        else:
+                            gaps.append(now - last)
+                        last = now
+                        events += 1
+                        if event == 'done':
+                            done = json.loads(line[5:].strip() or '{}')
+                            break
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return { 'endpoint': endpoint, 'ok': bool(done and done.get('ok')), 'error': error or (None if done else 'stream ended without done'), 'ttfe': first, 'gaps': gaps, 'events': events, 'duration': time.perf_counter() - started }
+
+async def scrape(client: httpx.AsyncClient, base_url: str) -> Optional[Dict[Tuple[str, str], float]]:
+    try:
+        resp = await client.get(base_url + '/metrics', timeout=5.0)
+        return parse_metrics(resp.text) if resp.status_code == 200 else None
+    except Exception:
+        return None
+
+async def run_level(base_url: str, concurrency: int, args: argparse.Namespace) -> Dict[str, Any]:
+    sessions = args.sessions or concurrency * args.sessions_per_slot
+    rng = random.Random(args.seed + concurrency)
+    plan = [('coding' if args.endpoint == 'coding' or (args.endpoint == 'mixed' and rng.random() < args.coding_ratio) else 'agent') for _ in range(sessions)]
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    timeline: List[Dict[str, Any]] = []
+    async with httpx.AsyncClient(limits=limits) as client, httpx.AsyncClient() as metrics_client:
+        before = await scrape(metrics_client, base_url) or {}
+        stop = asyncio.Event()
+        level_started = time.perf_counter()
+
+        async def scraper() -> None:
+            while not stop.is_set():
+                samples = await scrape(metrics_client, base_url)
+                if samples:
+                    timeline.append({ 't': round(time.perf_counter() - level_started, 3), 'rssBytes': samples.get(('process_resident_memory_bytes', '')), 'loopLagMs': (samples.get(('agent_event_loop_lag_last_seconds', '')) or 0.0) * 1000, 'activeRuns': sum(v for (m, _), v in samples.items() if m == 'agent_active_runs') })
+                try:
+                    await asyncio.wait_for(stop.wait(), args.scrape_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        scraper_task = asyncio.create_task(scraper())
+        queue: 'asyncio.Queue[Tuple[int, str]]' = asyncio.Queue()
+        for item in enumerate(plan):
+            queue.put_nowait(item)
+        results: List[Dict[str, Any]] = []
+
+        async def worker(slot: int) -> None:
+            await asyncio.sleep(args.ramp * slot / max(1, concurrency))
+            while not queue.empty():
+                index, endpoint = queue.get_nowait()
+                results.append(await run_session(client, base_url, endpoint, index, args))
+
+        await asyncio.gather(*(worker(slot) for slot in range(concurrency)))
+        wall = time.perf_counter() - level_started
+        stop.set()
+        await scraper_task
+        after = await scrape(metrics_client, base_url) or {}
+    ok = [r for r in results if r['ok']]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r['ok']:
+            errors[r['error'] or 'not ok'] = errors.get(r['error'] or 'not ok', 0) + 1
+    rss = [s['rssBytes'] for s in timeline if s.get('rssBytes')]
+    per_endpoint = {}
+    for endpoint in sorted(set(plan)):
+        subset = [r for r in ok if r['endpoint'] == endpoint]
+        per_endpoint[endpoint] = { 'sessions': len(subset), 'ttfeMs': percentiles([r['ttfe'] for r in subset if r['ttfe'] is not None]), 'sessionMs': percentiles([r['duration'] for r in subset]) }
+    return {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'ok': len(ok),
+        'failed': len(results) - len(ok),
+        'errors': errors,
+        'wallSeconds': wall,
+        'sessionsPerSec': len(ok) / wall if wall else 0.0,
+        'eventsPerSec': sum(r['events'] for r in results) / wall if wall else 0.0,
+        'ttfeMs': percentiles([r['ttfe'] for r in ok if r['ttfe'] is not None]),
+        'interEventMs': percentiles([g for r in ok for g in r['gaps']]),
+        'sessionMs': percentiles([r['duration'] for r in ok]),
+        'byEndpoint': per_endpoint,
+        'server': {
+            'rssMaxMb': max(rss) / 2**20 if rss else None,
+            'rssLastMb': rss[-1] / 2**20 if rss else None,
+            'loopLagMs': histogram_percentiles(before, after, 'agent_event_loop_lag_seconds'),
+            'loopLagMaxSampleMs': max((s['loopLagMs'] for s in timeline), default=None),
+            'sseQueueWaitMs': histogram_percentiles(before, after, 'agent_sse_queue_wait_seconds'),
+            'timeline': timeline,
+        },
+    }
+
+def mark_saturation(levels: List[Dict[str, Any]]) -> Optional[int]:
+    """First concurrency whose throughput gain is under 10% of the previous level's, or whose p99 TTFE doubled."""
+    for prev, cur in zip(levels, levels[1:]):
+        gain = (cur['sessionsPerSec'] - prev['sessionsPerSec']) / prev['sessionsPerSec'] if prev['sessionsPerSec'] else 0.0
+        ttfe_prev, ttfe_cur = prev['ttfeMs'].get('p99'), cur['ttfeMs'].get('p99')
+        if gain < 0.1 or (ttfe_prev and ttfe_cur and ttfe_cur > 2 * ttfe_prev) or cur['failed']:
+            return cur['concurrency']
+    return None
+
+def wait_healthy(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'{url}: process exited with {proc.returncode}')
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f'{url}: not healthy after {timeout}s')
+
+def spawn_stack(args: argparse.Namespace) -> List[subprocess.Popen]:
+    """Starts mock LLM, mock RAG and the agent server wired together; returns the processes."""
+    python = sys.executable
+    procs: List[subprocess.Popen] = []
+    llm = subprocess.Popen([python, '-m', 'loadtest.mock_llm', '--port', str(args.llm_port), '--ttft', args.llm_ttft, '--tps', str(args.llm_tps), '--react-steps', str(args.react_steps)], cwd=REPO_ROOT)
+    procs.append(llm)
+    rag = subprocess.Popen([python, '-m', 'loadtest.mock_rag', '--port', str(args.rag_port), '--latency', args.rag_latency], cwd=REPO_ROOT)
+    procs.append(rag)
+    env = { **os.environ, 'OPENAI_BASE_URL': f'http://127.0.0.1:{args.llm_port}/v1', 'OPENAI_API_KEY': 'mock', 'RAG_BASE_URL': f'http://127.0.0.1:{args.rag_port}', 'MODEL': args.model }
+    if args.workers > 1:
+        server = subprocess.Popen([python, 'server.py'], cwd=REPO_ROOT, env={ **env, 'WORKERS': str(args.workers), 'PORT': str(args.port), 'ROUTER_LOG_LEVEL': 'warning' }, stdout=subprocess.DEVNULL)
+    else:
+        server = subprocess.Popen([python, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(args.port), '--log-level', 'warning'], cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+    procs.append(server)
+    try:
+        wait_healthy(f'http://127.0.0.1:{args.llm_port}/health', llm)
+        wait_healthy(f'http://127.0.0.1:{args.rag_port}/health', rag)
+        wait_healthy(f'http://127.0.0.1:{args.port}/health', server)
+    except BaseException:
+        stop_stack(procs)
+        raise
+    return procs
+
+def stop_stack(procs: List[subprocess.Popen]) -> None:
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def print_summary(levels: List[Dict[str, Any]], saturation: Optional[int]) -> None:
+    print(f"\n{'conc':>5} {'ok':>5} {'fail':>5} {'sess/s':>8} {'ttfe p50':>9} {'ttfe p99':>9} {'gap p99':>8} {'rss MB':>7} {'lag p99':>8}")
+    for level in levels:
+        server = level['server']
+        print(f"{level['concurrency']:>5} {level['ok']:>5} {level['failed']:>5} {level['sessionsPerSec']:>8.2f} {level['ttfeMs'].get('p50', 0):>9.0f} {level['ttfeMs'].get('p99', 0):>9.0f} {level['interEventMs'].get('p99', 0):>8.0f} {server['rssMaxMb'] or 0:>7.0f} {server['loopLagMs'].get('p99', 0):>8.0f}")
+    if saturation:
+        print(f'\nsaturation around concurrency {saturation}')
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default=None, help='running server (default: the spawned one, or http://127.0.0.1:3333)')
+    parser.add_argument('--endpoint', choices=('agent', 'coding', 'mixed'), default='agent')
+    parser.add_argument('--coding-ratio', type=float, default=0.2, help='share of coding sessions with --endpoint mixed')
+    parser.add_argument('--concurrency', default='10', help='comma-separated concurrency levels, run in order')
+    parser.add_argument('--sessions', type=int, default=0, help='sessions per level (default: concurrency x --sessions-per-slot)')
+    parser.add_argument('--sessions-per-slot', type=int, default=3)
+    parser.add_argument('--ramp', type=float, default=1.0, help='seconds over which a level opens its connections')
+    parser.add_argument('--prompt', default='生成一个用户列表页面，支持搜索和分页')
+    parser.add_argument('--model', default='mock-gpt')
+    parser.add_argument('--param', action='append', default=[], help='extra query parameter k=v (repeatable)')
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--scrape-interval', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spawn', action='store_true', help='start mock LLM, mock RAG and the server locally')
+    parser.add_argument('--port', type=int, default=3333)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--llm-port', type=int, default=8601)
+    parser.add_argument('--llm-ttft', default='lognormal:0.3:0.4')
+    parser.add_argument('--llm-tps', type=float, default=60.0)
+    parser.add_argument('--react-steps', type=int, default=0)
+    parser.add_argument('--rag-port', type=int, default=8602)
+    parser.add_argument('--rag-latency', default='uniform:0.08:0.04')
+    parser.add_argument('--output', help='result JSON path (default: loadtest/results/<time>.json)')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    procs = spawn_stack(args) if args.spawn else []
+    base_url = (args.base_url or f'http://127.0.0.1:{args.port}').rstrip('/')
+    levels: List[Dict[str, Any]] = []
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(',') if c.strip()]:
+            level = asyncio.run(run_level(base_url, concurrency, args))
+            levels.append(level)
+            print(f"concurrency {concurrency}: {level['ok']}/{level['sessions']} ok, {level['sessionsPerSec']:.2f} sessions/s, ttfe p99 {level['ttfeMs'].get('p99', 0):.0f} ms")
+    finally:
+        stop_stack(procs)
+    saturation = mark_saturation(levels)
+    print_summary(levels, saturation)
+    report = { 'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'baseUrl': base_url, 'args': vars(args), 'saturationConcurrency': saturation, 'levels': levels }
+    output = args.output or os.path.join(REPO_ROOT, 'loadtest', 'results', f"load_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'wrote {output}')
+    return 0 if levels and all(level['ok'] for level in levels) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""OpenAI-compatible chat completions mock for load tests.
+
+    python -m loadtest.mock_llm --port 8601 --ttft lognormal:0.3:0.4 --tps 60
+
+Point the agent server at it with ``OPENAI_BASE_URL=http://127.0.0.1:8601/v1``, any ``OPENAI_API_KEY``
+and a model name that is not routed to DashScope (e.g. ``MODEL=mock-gpt``). Answers are the scripted
+ReAct / coding transcripts of :mod:`benchmarks.fake_llm`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse, StreamingResponse
+
+from benchmarks.fake_llm import LatencyModel, classify, coding_llm, react_llm
+from core.usage import estimate_tokens
+
+CODING_KINDS = ('coding_plan', 'bdd', 'architect', 'keywords', 'codegen', 'scenario_match')
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return ''.join(str(part.get('text') or '') if isinstance(part, dict) else str(part) for part in content)
+    return str(content or '')
+
+def create_app(ttft: LatencyModel, tps: float = 60.0, chunk_chars: int = 8, react_steps: int = 0) -> FastAPI:
+    """Builds the mock; ``ttft`` is the delay before the first token, ``tps`` the output tokens per second."""
+    app = FastAPI()
+    react = react_llm([('search', { 'query': f'q{i}' }) for i in range(react_steps)])
+    coding = coding_llm()
+    stats = { 'requests': 0, 'streams': 0, 'inFlight': 0 }
+
+    def script(messages: List[Dict[str, Any]]) -> str:
+        kind = classify(messages)
+        if kind in CODING_KINDS or 'create_coding_plan' in (messages[0]['content'] if messages else ''):
+            return coding.respond(messages)
+        return react.respond(messages)
+
+    def token_delay(text: str) -> float:
+        return estimate_tokens(text) / tps if tps > 0 else 0.0
+
+    @app.get('/health')
+    def health():
+        return { 'ok': True, **stats }
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = [{ 'role': m.get('role'), 'content': _text(m.get('content')) } for m in body.get('messages') or []]
+        model = body.get('model') or 'mock'
+        text = script(messages)
+        usage = { 'prompt_tokens': estimate_tokens('\n'.join(m['content'] for m in messages)), 'completion_tokens': estimate_tokens(text) }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        created = int(time.time())
+        stats['requests'] += 1
+        if not body.get('stream'):
+            stats['inFlight'] += 1
+            try:
+                await asyncio.sleep(ttft.sample() + token_delay(text))
+            finally:
+                stats['inFlight'] -= 1
+            return JSONResponse({ 'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model, 'choices': [{ 'index': 0, 'message': { 'role': 'assistant', 'content': text }, 'finish_reason': 'stop' }], 'usage': usage })
+        include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+        stats['streams'] += 1
+
+        def chunk(delta: Dict[str, Any], finish_reason: Any = None) -> str:
+            return 'data: ' + json.dumps({ 'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [{ 'index': 0, 'delta': delta, 'finish_reason': finish_reason }] }, ensure_ascii=False) + '\n\n'
+
+        async def events():
+            stats['inFlight'] += 1
+            try:
+                await asyncio.sleep(ttft.sample())
+                yield chunk({ 'role': 'assistant', 'content': '' })
+                for i in range(0, len(text), chunk_chars):
+                    piece = text[i:i + chunk_chars]
+                    if i:
+                        await asyncio.sleep(token_delay(piece))
+                    yield chunk({ 'content': piece })
+                yield chunk({}, 'stop')
+                if include_usage:
+                    yield 'data: ' + json.dumps({ 'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage }) + '\n\n'
+                yield 'data: [DONE]\n\n'
+            finally:
+                stats['inFlight'] -= 1
+
+        return StreamingResponse(events(), media_type='text/event-stream')
+
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8601)
+    parser.add_argument('--ttft', default='lognormal:0.3:0.4', help='time to first token (seconds): number or kind:mean[:spread]')
+    parser.add_argument('--tps', type=float, default=60.0, help='output tokens per second per stream (0 = instant)')
+    parser.add_argument('--chunk-chars', type=int, default=8)
+    parser.add_argument('--react-steps', type=int, default=0, help='tool actions in the ReAct transcript before the final answer')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    import uvicorn
+    uvicorn.run(create_app(LatencyModel.parse(args.ttft, seed=args.seed), args.tps, args.chunk_chars, args.react_steps), host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
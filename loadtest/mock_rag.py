@@ -0,0 +1,71 @@
+"""Mock of the component documentation (RAG) service used by the code generator.
+
+    python -m loadtest.mock_rag --port 8602 --latency uniform:0.08:0.04
+
+Serve it to the agent server with ``RAG_BASE_URL=http://127.0.0.1:8602``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from fastapi import FastAPI, Request
+
+from benchmarks.fake_llm import LatencyModel
+
+DEFAULT_COMPONENTS = ['Button', 'Table', 'Form', 'Input', 'Select', 'Modal', 'DatePicker', 'Tabs']
+
+def _doc(component: str, section: str, doc_bytes: int) -> str:
+    if section == 'Usage Example':
+        body = f"import {{ {component} }} from '@internal/ui';\n\nexport const Example = () => <{component} />;\n"
+    else:
+        body = f"## {component}\n\n| Prop | Type | Description |\n| --- | --- | --- |\n| size | 'small' \\| 'large' | Size of the {component} |\n"
+    return (body * (doc_bytes // len(body) + 1))[:doc_bytes]
+
+def create_app(latency: LatencyModel, components: List[str], doc_bytes: int = 1500) -> FastAPI:
+    app = FastAPI()
+    stats = { 'list': 0, 'query': 0 }
+
+    @app.get('/health')
+    def health():
+        return { 'ok': True, **stats }
+
+    @app.get('/getComponentList')
+    async def get_component_list():
+        stats['list'] += 1
+        await asyncio.sleep(latency.sample())
+        return { 'answer': json.dumps(components, ensure_ascii=False) }
+
+    @app.post('/query')
+    async def query(request: Request):
+        body = await request.json()
+        filters = body.get('metadataFilters') or {}
+        component = str(filters.get('component_name') or 'Button')
+        section = str(filters.get('section') or 'API / Props')
+        stats['query'] += 1
+        await asyncio.sleep(latency.sample())
+        content = _doc(component, section, doc_bytes)
+        return { 'answer': content, 'sources': [{ 'content': content[:200], 'metadata': { 'component_name': component, 'section': section } }] }
+
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8602)
+    parser.add_argument('--latency', default='uniform:0.08:0.04', help='response delay (seconds): number or kind:mean[:spread]')
+    parser.add_argument('--components', default=','.join(DEFAULT_COMPONENTS))
+    parser.add_argument('--doc-bytes', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    import uvicorn
+    uvicorn.run(create_app(LatencyModel.parse(args.latency, seed=args.seed), [c.strip() for c in args.components.split(',') if c.strip()], args.doc_bytes), host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
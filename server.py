@@ -1,13 +1,28 @@
 import os
 import asyncio
+import functools
 import json
-from typing import Any, Dict, Optional
-from fastapi import FastAPI, Request
+import time
+from typing import Any, Dict, List, Optional, Union
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import StreamingResponse
+from starlette.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from core.react_agent import ReActAgent
+from aitypes import AgentConfig
+from core.react_agent import AgentTemplate, ReActAgent
+from core.stream_manager import StreamEvent
+from core.artifact_store import default_artifact_store
+from core.batch import run_batch
+from core.cancellation import CancelToken
+from core.hedging import get_hedge_stats
+from core.json_repair import get_json_parse_stats
+from core.event_channel import EventChannel
+from core.metrics import monitor_event_loop_lag, render_prometheus
+from core.model_router import get_model_usage_stats
+from core.profiling import profile_dir, profile_request, profiling_authorized
+from core.usage import get_session_usage
+from coder_agent.generator.rag_prefetch import get_rag_prefetch_stats
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 app = FastAPI()
@@ -19,47 +34,198 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-agent = ReActAgent({
-    'model': os.environ.get('MODEL', 'qwen-plus'),
-    'temperature': float(os.environ.get('TEMPERATURE', '0.7')),
-    'streamOutput': True,
-})
+SSE_MAX_EVENTS = int(os.environ.get('SSE_MAX_EVENTS', '256'))
+SSE_MAX_BYTES = int(os.environ.get('SSE_MAX_BYTES', str(256 * 1024)))
+
+def event_payload(e: StreamEvent) -> Dict[str, Any]:
+    return {
+        'sessionId': e.sessionId,
+        'conversationId': e.conversationId,
+        'event': e.event,
+        'timestamp': e.timestamp,
+    }
+
+def sse_message(event: str, data: Any) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data)
+    return f'event: {event}\ndata: {payload}\n\n'
+
+MODEL_ROUTES = json.loads(os.environ.get('MODEL_ROUTES') or '{}')
+
+def allowed_models() -> set:
+    """Models a request may select: ``ALLOWED_MODELS`` (comma-separated), else the configured default, hedge fallback and routed models."""
+    configured = os.environ.get('ALLOWED_MODELS')
+    if configured:
+        return { m.strip() for m in configured.split(',') if m.strip() }
+    models = { os.environ.get('MODEL') or 'qwen-plus', os.environ.get('HEDGE_FALLBACK_MODEL') or '' }
+    models.update((route or {}).get('model') or '' for route in MODEL_ROUTES.values())
+    models.discard('')
+    return models
+
+def request_model(request: Request) -> str:
+    model = request.query_params.get('model') or os.environ.get('MODEL') or 'qwen-plus'
+    if model not in allowed_models():
+        raise HTTPException(status_code=400, detail=f'model not allowed: {model}')
+    return model
+
+@functools.lru_cache(maxsize=32)
+def agent_template(model: str, temperature: float, hedging: bool) -> AgentTemplate:
+    """Shared template for one LLM setup; request agents are cloned from it instead of built from scratch."""
+    return AgentTemplate({
+        'model': model,
+        'temperature': temperature,
+        'streamOutput': True,
+        'hedging': hedging,
+        'hedgeFallbackModel': os.environ.get('HEDGE_FALLBACK_MODEL') or None,
+        'modelRoutes': MODEL_ROUTES,
+    })
+
+def default_template() -> AgentTemplate:
+    return agent_template(os.environ.get('MODEL') or 'qwen-plus', float(os.environ.get('TEMPERATURE') or '0.7'), (os.environ.get('LLM_HEDGING') or '') == 'true')
+
+@functools.lru_cache(maxsize=1)
+def default_agent() -> ReActAgent:
+    """Long-lived agent of ``/run``, which keeps paused sessions between calls; built on first use."""
+    return default_template().clone()
+
+@app.on_event('startup')
+async def prewarm_agent_template():
+    if (os.environ.get('PREWARM_AGENT') or 'true') == 'true':
+        await asyncio.get_running_loop().run_in_executor(None, default_template)
+
+@app.on_event('startup')
+async def start_loop_lag_monitor():
+    app.state.loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag(float(os.environ.get('LOOP_LAG_INTERVAL', '0.1'))))
 
 class RunRequest(BaseModel):
     input: str
     sessionId: Optional[str] = None
     conversationId: Optional[str] = None
 
+class BatchItem(BaseModel):
+    prompt: str
+    id: Optional[str] = None
+
+# AgentConfig fields a batch caller may set; limits, routing, budgets and hedging stay server-side.
+BATCH_CONFIG_FIELDS = frozenset(('model', 'temperature', 'maxTokens', 'language', 'autoGenerateFinalAnswer', 'strictActionUntilDone'))
+
+class BatchRequest(BaseModel):
+    prompts: List[Union[str, BatchItem]]
+    config: Dict[str, Any] = {}
+    concurrency: Optional[int] = None
+    timeBudget: Optional[float] = None
+    events: bool = True
+
 @app.get('/health')
 def health():
     return {'ok': True}
 
+@app.get('/api/stats')
+def stats():
+    return {'hedging': get_hedge_stats(), 'jsonParse': get_json_parse_stats(), 'modelUsage': get_model_usage_stats(), 'ragPrefetch': get_rag_prefetch_stats()}
+
+@app.get('/metrics')
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type='text/plain; version=0.0.4')
+
+def profile_token(request: Request) -> Optional[str]:
+    return request.headers.get('X-Profile-Token') or request.query_params.get('profileToken')
+
+@app.get('/api/profiles/{name}')
+def get_profile(name: str, request: Request):
+    if not profiling_authorized(profile_token(request)):
+        raise HTTPException(status_code=403, detail='forbidden')
+    path = os.path.join(profile_dir(), os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail='profile not found')
+    return FileResponse(path, media_type='text/plain')
+
+@app.get('/api/usage/{session_id}')
+def session_usage(session_id: str, request: Request):
+    # Session ids are guessable, so the caller must also name one of the session's (random) conversation ids.
+    conversation_id = request.query_params.get('conversationId') or ''
+    usage = get_session_usage(session_id)
+    if usage is None or conversation_id in ('', 'default') or conversation_id not in usage['byConversation']:
+        raise HTTPException(status_code=404, detail='session not found')
+    return usage
+
+@app.get('/api/artifacts/{artifact_id}')
+def get_artifact(artifact_id: str):
+    meta = default_artifact_store.meta(artifact_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail='artifact not found')
+    return StreamingResponse(default_artifact_store.iter_chunks(artifact_id), media_type='application/json', headers={
+        'Content-Length': str(meta['size']),
+        'Cache-Control': 'private, max-age=3600',
+    })
+
 @app.post('/run')
 async def run(req: RunRequest):
     events: list[Dict[str, Any]] = []
-    def on_stream(e):
-        events.append({
-            'sessionId': e.sessionId,
-            'conversationId': e.conversationId,
-            'event': e.event,
-            'timestamp': e.timestamp,
-        })
-    result = await agent.run_with_session(req.input, {
+    result = await default_agent().run_with_session(req.input, {
         'sessionId': req.sessionId,
         'conversationId': req.conversationId,
-        'onStream': on_stream,
+        'onStream': lambda e: events.append(event_payload(e)),
     })
     return {'result': result, 'events': events}
 
+@app.post('/api/agent/batch')
+async def agent_batch(req: BatchRequest):
+    items = [{ 'id': p.id, 'prompt': p.prompt } if isinstance(p, BatchItem) else { 'prompt': p } for p in req.prompts]
+    if not items:
+        raise HTTPException(status_code=400, detail='prompts is required')
+    if len(items) > int(os.environ.get('BATCH_MAX_ITEMS', '10000')):
+        raise HTTPException(status_code=413, detail='too many prompts')
+    rejected = sorted(set(req.config) - BATCH_CONFIG_FIELDS)
+    if rejected:
+        raise HTTPException(status_code=400, detail=f"config fields not allowed: {', '.join(rejected)}")
+    config = {
+        'model': os.environ.get('MODEL') or 'qwen-plus',
+        'temperature': float(os.environ.get('TEMPERATURE') or '0.7'),
+        'streamOutput': False,
+        'hedgeFallbackModel': os.environ.get('HEDGE_FALLBACK_MODEL') or None,
+        'modelRoutes': MODEL_ROUTES,
+        'tokenBudget': int(os.environ.get('SESSION_TOKEN_BUDGET') or '0') or None,
+        **req.config,
+    }
+    if config['model'] not in allowed_models():
+        raise HTTPException(status_code=400, detail=f"model not allowed: {config['model']}")
+    try:
+        AgentConfig(**config)
+    except TypeError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    concurrency = max(1, min(req.concurrency or int(os.environ.get('BATCH_CONCURRENCY', '4')), int(os.environ.get('BATCH_MAX_CONCURRENCY', '16'))))
+    time_budget = req.timeBudget or float(os.environ.get('AGENT_TIME_BUDGET') or '0') or None
+
+    async def lines():
+        started = time.perf_counter()
+        counts = { 'ok': 0, 'failed': 0 }
+        yield json.dumps({ 'type': 'start', 'items': len(items), 'concurrency': concurrency }) + '\n'
+        async for record in run_batch(items, config, concurrency, time_budget, events=req.events):
+            counts['ok' if record['ok'] else 'failed'] += 1
+            yield json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        yield json.dumps({ 'type': 'done', **counts, 'durationMs': int((time.perf_counter() - started) * 1000) }) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache, no-transform',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.get('/api/agent/stream')
 async def agent_stream(request: Request):
     prompt = (request.query_params.get('prompt') or '')
     language = (request.query_params.get('language') or 'chinese')
-    model = (request.query_params.get('model') or os.environ.get('MODEL') or 'qwen-plus')
+    model = request_model(request)
     temperature = float(request.query_params.get('temperature') or os.environ.get('TEMPERATURE') or '0.7')
     session_id = request.query_params.get('sessionId') or None
     conversation_id = request.query_params.get('conversationId') or None
     pause_after_each = (request.query_params.get('pauseAfterEachStep') == 'true')
+    time_budget = float(request.query_params.get('timeBudget') or os.environ.get('AGENT_TIME_BUDGET') or '0') or None
+    hedging = (request.query_params.get('hedging') or os.environ.get('LLM_HEDGING') or '') == 'true'
+    token_budget = int(request.query_params.get('tokenBudget') or os.environ.get('SESSION_TOKEN_BUDGET') or '0') or None
+    trace = (request.query_params.get('trace') == 'true')
+    record = (request.query_params.get('record') == 'true')
+    profile = profiling_authorized(profile_token(request))
+    profile_memory = (request.query_params.get('profileMemory') == 'true')
 
     if not prompt:
         async def err_gen():
@@ -73,61 +239,51 @@ async def agent_stream(request: Request):
             'X-Accel-Buffering': 'no',
         })
 
-    local_agent = ReActAgent({
-        'model': model,
-        'temperature': temperature,
-        'streamOutput': True,
-        'language': language,
-        'pauseAfterEachStep': pause_after_each,
-    })
+    local_agent = agent_template(model, temperature, hedging).clone(language=language, pauseAfterEachStep=pause_after_each, tokenBudget=token_budget)
 
-    queue: asyncio.Queue = asyncio.Queue()
-
-    def on_stream(e):
-        payload = {
-            'sessionId': e.sessionId,
-            'conversationId': e.conversationId,
-            'event': e.event,
-            'timestamp': e.timestamp,
-        }
-        asyncio.get_event_loop().call_soon_threadsafe(queue.put_nowait, ('stream_event', payload))
-
-    async def run_agent():
-        try:
-            result = await local_agent.run_with_session(prompt, {
-                'sessionId': session_id,
-                'conversationId': conversation_id,
-                'onStream': on_stream,
-            })
-            payload = {
-                'ok': True,
-                'sessionId': result['sessionId'],
-                'conversationId': result['conversationId'],
-                'isPaused': result['isPaused'],
-                'message': '等待用户输入...' if result['isPaused'] else '对话完成'
-            }
-            await queue.put(('done', payload))
-        except Exception as err:
-            await queue.put(('stream_event', {
-                'sessionId': session_id or 'error',
-                'conversationId': 'error',
-                'event': { 'id': f'error_{int(asyncio.get_event_loop().time()*1000)}', 'role': 'assistant', 'type': 'normal_event', 'content': str(err) },
-                'timestamp': int(asyncio.get_event_loop().time()*1000)
-            }))
-            await queue.put(('done', { 'ok': False }))
-
-    task = asyncio.create_task(run_agent())
+    cancel_token = CancelToken(time_budget)
+    channel = EventChannel(SSE_MAX_EVENTS, SSE_MAX_BYTES, label='agent')
 
     async def event_generator():
-        try:
-            while True:
-                event, data = await queue.get()
-                payload = data if isinstance(data, str) else json.dumps(data)
-                yield f'event: {event}\n'
-                yield f'data: {payload}\n\n'
-                if event == 'done': break
-        finally:
-            task.cancel()
+        async with profile_request('agent', profile, profile_memory) as profiler:
+            try:
+                async for e in local_agent.stream_run(prompt, {
+                    'sessionId': session_id,
+                    'conversationId': conversation_id,
+                    'cancelToken': cancel_token,
+                    'trace': trace,
+                    'record': record,
+                }, channel):
+                    if e.event.get('type') != 'done':
+                        yield sse_message('stream_event', event_payload(e))
+                        continue
+                    result = e.event['data']
+                    payload = {
+                        'ok': True,
+                        'sessionId': result['sessionId'],
+                        'conversationId': result['conversationId'],
+                        'isPaused': result['isPaused'],
+                        'usage': result.get('usage'),
+                        'iterationWaste': result.get('iterationWaste'),
+                        'tracePath': result.get('tracePath'),
+                        'recordingPath': result.get('recordingPath'),
+                        'message': '等待用户输入...' if result['isPaused'] else '对话完成'
+                    }
+                    if profiler is not None:
+                        payload['profile'] = await profiler.stop()
+                    yield sse_message('done', payload)
+            except asyncio.CancelledError:
+                if not cancel_token.cancelled or cancel_token.reason == 'client_disconnected':
+                    raise
+                yield sse_message('done', { 'ok': False, 'cancelled': True, 'reason': cancel_token.reason })
+            except Exception as err:
+                yield sse_message('stream_event', {
+                    'sessionId': session_id or 'error',
+                    'conversationId': 'error',
+                    'event': { 'id': f'error_{int(asyncio.get_event_loop().time()*1000)}', 'role': 'assistant', 'type': 'normal_event', 'content': str(err) },
+                    'timestamp': int(asyncio.get_event_loop().time()*1000)
+                })
+                yield sse_message('done', { 'ok': False })
 
     return StreamingResponse(event_generator(), media_type='text/event-stream', headers={
         'Cache-Control': 'no-cache, no-transform',
@@ -138,10 +294,21 @@ async def agent_stream(request: Request):
 @app.get('/api/coding-agent/stream')
 async def coding_agent_stream(request: Request):
     prompt = (request.query_params.get('prompt') or '')
-    model = (request.query_params.get('model') or os.environ.get('MODEL') or 'qwen-plus')
+    model = request_model(request)
     temperature = float(request.query_params.get('temperature') or os.environ.get('TEMPERATURE') or '0')
     session_id = request.query_params.get('sessionId') or None
     conversation_id = request.query_params.get('conversationId') or None
+    codegen_mode = (request.query_params.get('codegenMode') or os.environ.get('CODEGEN_MODE') or 'single')
+    codegen_concurrency = int(request.query_params.get('codegenConcurrency') or os.environ.get('CODEGEN_CONCURRENCY') or '3')
+    scenario_match_refine = (request.query_params.get('scenarioMatchRefine') == 'true')
+    stage_cache = (request.query_params.get('noCache') != 'true')
+    time_budget = float(request.query_params.get('timeBudget') or os.environ.get('CODING_TIME_BUDGET') or '0') or None
+    hedging = (request.query_params.get('hedging') or os.environ.get('LLM_HEDGING') or '') == 'true'
+    token_budget = int(request.query_params.get('tokenBudget') or os.environ.get('SESSION_TOKEN_BUDGET') or '0') or None
+    trace = (request.query_params.get('trace') == 'true')
+    record = (request.query_params.get('record') == 'true')
+    profile = profiling_authorized(profile_token(request))
+    profile_memory = (request.query_params.get('profileMemory') == 'true')
 
     if not prompt:
         async def err_gen():
@@ -165,46 +332,44 @@ async def coding_agent_stream(request: Request):
         'maxIterations': 10,
         'pauseAfterEachStep': False,
         'autoPlanOnStart': False,
-        'strictActionUntilDone': True
+        'strictActionUntilDone': True,
+        'codegenMode': codegen_mode,
+        'codegenConcurrency': codegen_concurrency,
+        'scenarioMatchRefine': scenario_match_refine,
+        'stageCache': stage_cache,
+        'hedging': hedging,
+        'hedgeFallbackModel': os.environ.get('HEDGE_FALLBACK_MODEL') or None,
+        'modelRoutes': MODEL_ROUTES,
+        'tokenBudget': token_budget,
     })
 
-    queue: asyncio.Queue = asyncio.Queue()
-
-    def on_stream(e):
-        payload = {
-            'sessionId': e.sessionId,
-            'conversationId': e.conversationId,
-            'event': e.event,
-            'timestamp': e.timestamp,
-        }
-        asyncio.get_event_loop().call_soon_threadsafe(queue.put_nowait, ('stream_event', payload))
-
-    async def run_agent():
-        try:
-            result = await agent.run(prompt, { 'sessionId': session_id, 'conversationId': conversation_id, 'onStream': on_stream })
-            payload = { 'ok': True, 'result': result['finalAnswer'] }
-            await queue.put(('done', payload))
-        except Exception as err:
-            await queue.put(('stream_event', {
-                'sessionId': session_id or 'error',
-                'conversationId': 'error',
-                'event': { 'id': f'error_{int(asyncio.get_event_loop().time()*1000)}', 'role': 'assistant', 'type': 'normal_event', 'content': str(err) },
-                'timestamp': int(asyncio.get_event_loop().time()*1000)
-            }))
-            await queue.put(('done', { 'ok': False }))
-
-    task = asyncio.create_task(run_agent())
+    cancel_token = CancelToken(time_budget)
+    channel = EventChannel(SSE_MAX_EVENTS, SSE_MAX_BYTES, label='coding')
 
     async def event_generator():
-        try:
-            while True:
-                event, data = await queue.get()
-                payload = data if isinstance(data, str) else json.dumps(data)
-                yield f'event: {event}\n'
-                yield f'data: {payload}\n\n'
-                if event == 'done': break
-        finally:
-            task.cancel()
+        async with profile_request('coding', profile, profile_memory) as profiler:
+            try:
+                async for e in agent.stream_run(prompt, { 'sessionId': session_id, 'conversationId': conversation_id, 'cancelToken': cancel_token, 'trace': trace, 'record': record }, channel):
+                    if e.event.get('type') != 'done':
+                        yield sse_message('stream_event', event_payload(e))
+                        continue
+                    result = e.event['data']
+                    payload = { 'ok': True, 'result': result['finalAnswer'], 'sessionId': result.get('sessionId'), 'resumed': result.get('resumed'), 'usage': result.get('usage'), 'tracePath': result.get('tracePath'), 'recordingPath': result.get('recordingPath') }
+                    if profiler is not None:
+                        payload['profile'] = await profiler.stop()
+                    yield sse_message('done', payload)
+            except asyncio.CancelledError:
+                if not cancel_token.cancelled or cancel_token.reason == 'client_disconnected':
+                    raise
+                yield sse_message('done', { 'ok': False, 'cancelled': True, 'reason': cancel_token.reason })
+            except Exception as err:
+                yield sse_message('stream_event', {
+                    'sessionId': session_id or 'error',
+                    'conversationId': 'error',
+                    'event': { 'id': f'error_{int(asyncio.get_event_loop().time()*1000)}', 'role': 'assistant', 'type': 'normal_event', 'content': str(err) },
+                    'timestamp': int(asyncio.get_event_loop().time()*1000)
+                })
+                yield sse_message('done', { 'ok': False })
 
     return StreamingResponse(event_generator(), media_type='text/event-stream', headers={
         'Cache-Control': 'no-cache, no-transform',
@@ -213,5 +378,10 @@ async def coding_agent_stream(request: Request):
     })
 
 if __name__ == '__main__':
-    import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', '3333')))
+    workers = int(os.environ.get('WORKERS', '1'))
+    if workers > 1:
+        from core.cluster import serve_cluster
+        serve_cluster('server:app', workers, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', '3333')))
+    else:
+        import uvicorn
+        uvicorn.run(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', '3333')))
@@ -0,0 +1,65 @@
+import asyncio
+import gc
+import time
+import weakref
+
+import pytest
+
+from core.cancellation import CancelToken, DeadlineExceeded, OperationCancelled, guard, guard_iter, use_token
+
+def test_child_deadline_is_capped_by_parent():
+    parent = CancelToken(1.0)
+    assert CancelToken(10.0, parent=parent).deadline == parent.deadline
+    assert parent.child(10.0).deadline == parent.deadline
+    assert parent.child(0.1).deadline < parent.deadline
+    assert parent.child().deadline == parent.deadline
+    assert CancelToken().child(5.0).remaining() == pytest.approx(5.0, abs=0.5)
+
+def test_parent_cancel_reaches_children():
+    parent = CancelToken()
+    child = parent.child()
+    grandchild = child.child(60.0)
+    parent.cancel('client_disconnected')
+    assert child.reason == grandchild.reason == 'client_disconnected'
+    assert parent.child().reason == 'client_disconnected'
+    with pytest.raises(OperationCancelled):
+        grandchild.check()
+
+def test_scope_cancels_task_and_raises_operation_cancelled():
+    async def main():
+        token = CancelToken()
+        asyncio.get_running_loop().call_later(0.01, token.cancel, 'stopped')
+        with pytest.raises(OperationCancelled) as info:
+            with token.scope():
+                await asyncio.sleep(10)
+        assert info.value.reason == 'stopped'
+        assert not asyncio.current_task().cancelling()
+    asyncio.run(main())
+
+def test_deadline_cancels_guarded_await_and_iteration():
+    async def ticks():
+        while True:
+            await asyncio.sleep(0.01)
+            yield 1
+    async def main():
+        started = time.monotonic()
+        with use_token(CancelToken(0.05)):
+            with pytest.raises(DeadlineExceeded):
+                await guard(asyncio.sleep(10))
+        with use_token(CancelToken(0.05)):
+            with pytest.raises(DeadlineExceeded):
+                async for _ in guard_iter(ticks()):
+                    pass
+        assert time.monotonic() - started < 1
+    asyncio.run(main())
+
+def test_finished_run_releases_deadline_timer():
+    async def main():
+        token = CancelToken(60.0)
+        assert await token.run(asyncio.sleep(0, 'ok')) == 'ok'
+        assert token._timer is None and not token.cancelled
+        ref = weakref.ref(token)
+        del token
+        gc.collect()
+        assert ref() is None
+    asyncio.run(main())
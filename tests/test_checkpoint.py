@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from benchmarks.fake_llm import coding_llm, react_step
+from coder_agent.core.checkpoint import CheckpointStore, CheckpointWriter, bdd_hash
+from coder_agent.core.coding_agent import CodingAgent
+from coder_agent.core.stage_cache import StageCache
+
+@pytest.fixture(autouse=True)
+def offline_rag(monkeypatch, tmp_path):
+    monkeypatch.setenv('RAG_BASE_URL', 'http://127.0.0.1:9')
+    monkeypatch.setenv('STEP_LOG_DIR', str(tmp_path / 'steplogs'))
+
+def test_start_resumes_only_unfinished_checkpoint_of_same_input(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    checkpoint = store.start('s1', 'make login')
+    assert checkpoint['resumed'] is False and checkpoint['stages'] == {}
+    checkpoint['stages']['create_coding_plan'] = { 'plan': { 'steps': [] } }
+    store.save('s1', checkpoint)
+    resumed = store.start('s1', 'make login')
+    assert resumed['resumed'] is True and 'create_coding_plan' in resumed['stages']
+    assert store.start('s1', 'make a todo list')['stages'] == {}
+    checkpoint['completed'] = True
+    store.save('s1', checkpoint)
+    assert store.start('s1', 'make login')['resumed'] is False
+
+def test_session_id_cannot_leave_directory(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'cp'))
+    store.save('../../etc/x', { 'stages': {} })
+    assert os.listdir(tmp_path / 'cp') == ['.._.._etc_x.json']
+    assert store.delete('../../etc/x') and not store.delete('../../etc/x')
+
+def test_stale_checkpoints_are_removed(tmp_path):
+    CheckpointStore(str(tmp_path)).save('old', { 'stages': {} })
+    CheckpointStore(str(tmp_path)).save('new', { 'stages': {} })
+    os.utime(tmp_path / 'old.json', (time.time() - 7200, time.time() - 7200))
+    CheckpointStore(str(tmp_path), ttl=3600)
+    assert os.listdir(tmp_path) == ['new.json']
+
+def test_writer_saves_latest_state_off_loop(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    checkpoint = { 'stages': {} }
+    async def main():
+        writer = CheckpointWriter(store, 's1', checkpoint)
+        for i in range(5):
+            checkpoint['stages'][f'stage_{i}'] = i
+            writer.save()
+        await writer.flush()
+    asyncio.run(main())
+    assert len(store.load('s1')['stages']) == 5
+
+def test_bdd_hash_ignores_formatting():
+    features = [{ 'feature_id': 'f1', 'feature_title': '登录', 'scenarios': [] }]
+    assert bdd_hash(json.dumps(features, ensure_ascii=False)) == bdd_hash(json.dumps(features, indent=2))
+    assert bdd_hash('not json') != bdd_hash('not json either')
+
+def run_agent(llm, store, session_id='s1'):
+    agent = CodingAgent({ 'streamOutput': True }, cache=StageCache(max_entries=0), checkpoints=store, llm=llm)
+    return asyncio.run(agent.run('做个登录页', { 'sessionId': session_id }))
+
+def test_resume_after_architecture_skips_finished_stages(tmp_path):
+    llm = coding_llm()
+    # The ReAct model formats the bdd input differently from the features the resume rebuilds it from.
+    features = json.loads(llm.responses['bdd'])
+    llm.react_steps[2] = react_step('generate_code_project', { 'bdd': json.dumps(features, indent=2) })
+    project = llm.responses['codegen']
+    interrupted = { 'on': True }
+    def codegen(messages):
+        if interrupted['on']:
+            raise RuntimeError('connection reset')
+        return project
+    llm.responses['codegen'] = codegen
+    store = CheckpointStore(str(tmp_path / 'checkpoints'))
+
+    first = run_agent(llm, store)
+    assert first['finalAnswer']['files'] == []
+    checkpoint = store.load('s1')
+    assert set(checkpoint['stages']) == { 'create_coding_plan', 'decompose_bdd' }
+    assert checkpoint['generation']['architecture']
+
+    interrupted['on'] = False
+    llm.calls.clear()
+    second = run_agent(llm, store)
+    assert second['resumed'] is True
+    assert len(second['finalAnswer']['files']) == 6
+    assert llm.calls == { 'codegen': 1 }
+    assert store.load('s1') is None
@@ -0,0 +1,74 @@
+import asyncio
+
+from core.event_channel import EventChannel, flow_control, stream_events, use_channel
+from core.stream_manager import StreamEvent
+
+def event(type='normal_event', id='e1', content='', **extra):
+    return StreamEvent(sessionId='s', conversationId='c', event={ 'id': id, 'role': 'assistant', 'type': type, 'content': content, **extra }, timestamp=0)
+
+def delta(content, id='d1'):
+    return event(id=id, content=content, stream=True)
+
+def test_deltas_coalesce_and_control_events_are_kept():
+    channel = EventChannel()
+    channel.put(delta('a'))
+    channel.put(delta('b'))
+    channel.put(event('tool_call_event', id='t1'))
+    channel.put(delta('c'))
+    channel.put(delta('d', id='d2'))
+    assert len(channel) == 4 and channel.coalesced == 1
+    async def drain():
+        channel.close()
+        return [(e.event['type'], e.event['content']) async for e in channel]
+    assert asyncio.run(drain()) == [('normal_event', 'ab'), ('tool_call_event', ''), ('normal_event', 'c'), ('normal_event', 'd')]
+
+def test_pauses_over_max_events_and_resumes_at_half():
+    channel = EventChannel(max_events=4)
+    for i in range(5):
+        channel.put(event(id=f'e{i}'))
+    assert channel.over_limit() and not channel._writable.is_set()
+    async def main():
+        await channel.get()
+        assert not channel._writable.is_set()
+        await channel.get()
+        await channel.get()
+        assert channel._writable.is_set()
+    asyncio.run(main())
+
+def test_max_bytes_counts_utf8_bytes():
+    channel = EventChannel(max_bytes=30)
+    channel.put(delta('登录页面已生成'))
+    assert channel._bytes == 21 and channel._writable.is_set()
+    channel.put(delta('完成了'))
+    assert channel._bytes == 30 and channel._writable.is_set()
+    channel.put(delta('!'))
+    assert not channel._writable.is_set()
+
+def test_producer_waits_in_flow_control_until_reader_drains():
+    async def main():
+        channel = EventChannel(max_events=2)
+        produced = []
+        async def producer():
+            with use_channel(channel):
+                for i in range(6):
+                    await flow_control()
+                    channel.put(event(id=f'e{i}'))
+                    produced.append(i)
+        task = asyncio.ensure_future(producer())
+        await asyncio.sleep(0.01)
+        assert produced == [0, 1, 2]
+        await channel.get()
+        await channel.get()
+        await asyncio.sleep(0.01)
+        assert produced == [0, 1, 2, 3, 4]
+        task.cancel()
+    asyncio.run(main())
+
+def test_stream_events_ends_with_done():
+    async def run(on_stream):
+        on_stream(delta('hi'))
+        return { 'sessionId': 's', 'answer': 42 }
+    async def main():
+        return [e.event async for e in stream_events(run, EventChannel())]
+    events = asyncio.run(main())
+    assert [e['type'] for e in events] == ['normal_event', 'done'] and events[-1]['data']['answer'] == 42
@@ -0,0 +1,28 @@
+import pytest
+
+from core.json_repair import JsonRepairError, parse_llm_json
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": "b" // c\n}', { 'a': 'b' }),
+    ('{"a": "b" /* c */, "d": 1}', { 'a': 'b', 'd': 1 }),
+    ('{"a": "b", // c\n "d": "e" // f\n}', { 'a': 'b', 'd': 'e' }),
+    ('{"url": "http://x.y/z", "n": 1} // trailing', { 'url': 'http://x.y/z', 'n': 1 }),
+    ('{"a": "say "hi" now"}', { 'a': 'say "hi" now' }),
+    ("{a: 'b', c: True,}", { 'a': 'b', 'c': True }),
+    ('{"a": [1, 2', { 'a': [1, 2] }),
+])
+def test_repairs(text, expected):
+    assert parse_llm_json(text) == expected
+
+def test_prefers_fenced_value_over_braces_in_chatter():
+    text = 'Use {name} as a placeholder.\n```json\n{"name": "x", "items": [1, 2,]}\n```'
+    assert parse_llm_json(text, expect='object') == { 'name': 'x', 'items': [1, 2] }
+
+def test_skips_unparsable_candidates():
+    assert parse_llm_json('see [a b] and then [1, 2]', expect='array') == [1, 2]
+
+def test_schema_and_default():
+    schema = { 'type': 'object', 'required': ['files'] }
+    with pytest.raises(JsonRepairError):
+        parse_llm_json('{"other": 1}', schema=schema)
+    assert parse_llm_json('no json here', default=None) is None
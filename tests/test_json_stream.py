@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from core.json_stream import JsonItemStream
+
+FILES = [{ 'path': f'src/f{i}.ts', 'content': f'export const v{i} = "{{[{i}]}}";\n' * 3 } for i in range(5)]
+TEXT = 'Here is the project:\n```json\n' + json.dumps({ 'summary': 'x', 'files': FILES }, ensure_ascii=False, indent=2) + '\n```\n'
+
+def feed_all(stream, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(stream.feed(chunk))
+    return items
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64, len(TEXT)])
+def test_items_split_across_chunks_are_emitted_once(size):
+    stream = JsonItemStream(('files',))
+    items = feed_all(stream, [TEXT[i:i + size] for i in range(0, len(TEXT), size)])
+    assert items == FILES
+    assert stream.count == len(FILES)
+
+def test_top_level_array_with_cjk_and_escapes():
+    items = [{ 'title': '登录页面', 'note': 'say \\"hi\\" ]}' }, { 'title': '列表' }]
+    text = json.dumps(items, ensure_ascii=False)
+    stream = JsonItemStream()
+    assert feed_all(stream, [text[i:i + 3] for i in range(0, len(text), 3)]) == items
+
+def test_root_without_target_is_skipped():
+    text = '{"other": [1, 2]} then {"files": [{"path": "a"}]}'
+    stream = JsonItemStream(('files',))
+    assert feed_all(stream, [text[i:i + 5] for i in range(0, len(text), 5)]) == [{ 'path': 'a' }]
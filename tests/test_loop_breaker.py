@@ -0,0 +1,64 @@
+import asyncio
+import contextlib
+import io
+import json
+
+import pytest
+
+from benchmarks.fake_llm import ScriptedLLM, final_step, react_step
+from core.react_agent import ReActAgent
+
+@pytest.fixture(autouse=True)
+def step_log_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv('STEP_LOG_DIR', str(tmp_path))
+
+def run(script, tools, **config):
+    llm = ScriptedLLM({ 'plan': json.dumps([{ 'title': 'a' }]), 'pre_action': 'ok', 'final_answer': 'fin' }, script)
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = ReActAgent({ 'maxIterations': 10, 'streamOutput': False, 'strictActionUntilDone': False, **config }, llm=llm)
+    agent.get_tool_registry().register_tools(tools)
+    messages = []
+    result = asyncio.run(agent.run_with_session('task', { 'sessionId': 's1', 'onStream': lambda e: messages.append(e.event.get('content')) }))
+    return result, messages
+
+def counting_tool(name, calls, idempotent=None):
+    def execute(tool_input):
+        calls.append(name)
+        return { 'value': len(calls) }
+    tool = { 'name': name, 'description': name, 'parameters': [], 'execute': execute }
+    if idempotent is not None:
+        tool['idempotent'] = idempotent
+    return tool
+
+def test_repeated_idempotent_action_is_reused():
+    calls = []
+    script = [react_step('lookup', { 'q': 'x' }), react_step('lookup', { 'q': 'x' }, thought='再查一次'), final_step('done')]
+    result, messages = run(script, [counting_tool('lookup', calls, idempotent=True)])
+    assert calls == ['lookup']
+    assert result['iterationWaste']['repeatedActions'] == 1
+    assert result['iterationWaste']['savedIterations'] == 1
+    assert any('♻️' in (m or '') for m in messages)
+
+@pytest.mark.parametrize('idempotent', [None, False])
+def test_repeated_action_runs_again_unless_idempotent(idempotent):
+    calls = []
+    script = [react_step('send', { 'to': 'a' }), react_step('send', { 'to': 'a' }, thought='再发一次'), final_step('done')]
+    result, _ = run(script, [counting_tool('send', calls, idempotent)])
+    assert calls == ['send', 'send']
+    assert 'repeatedActions' not in result['iterationWaste']
+
+def test_missing_action_gets_a_hint_instead_of_a_tool_error():
+    script = ['I am not sure what to do.', final_step('done')]
+    result, _ = run(script, [])
+    assert result['iterationWaste']['pseudoActions'] == 1
+
+def test_loop_break_at_max_stalls_counts_once():
+    calls = []
+    script = [react_step('lookup', { 'q': 'x' }, thought=f'第{i}次查询，换个角度想想问题 {i}') for i in range(8)] + [final_step('done')]
+    result, messages = run(script, [counting_tool('lookup', calls, idempotent=True)], maxStalls=3)
+    waste = result['iterationWaste']
+    assert calls == ['lookup']
+    assert waste['repeatedActions'] == 3 and waste['loopBreaks'] == 1
+    assert waste['savedIterations'] == 4
+    assert sum('🔁' in (m or '') for m in messages) == 1
+    assert result['finalAnswer'] == 'fin'
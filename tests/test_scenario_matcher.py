@@ -0,0 +1,31 @@
+import pytest
+
+from coder_agent.matcher.scenario_matcher import ScenarioMatcher, tokenize
+
+pytest.importorskip('numpy')
+
+FILES = [
+    { 'path': 'src/components/LoginForm.tsx', 'content': 'export function LoginForm() {}\nexport const validatePassword = () => true;' },
+    { 'path': 'src/components/OrderTable.tsx', 'content': 'export default function OrderTable() {}' },
+    { 'path': 'src/pages/SettingsPage.tsx', 'content': 'export const SettingsPage = () => null;' },
+]
+
+def test_tokenize_splits_identifiers_and_cjk():
+    assert tokenize('OrderTable user-settings') == ['order', 'table', 'settings']
+    tokens = tokenize('登录表单')
+    assert {'登', '登录', 'login', 'form'} <= set(tokens)
+
+def test_ascii_scenario_matches_expected_file():
+    scenario = { 'id': 's1', 'title': 'User logs in', 'when': ['User submits the login form with a password'], 'then': ['The dashboard is shown'] }
+    [result] = ScenarioMatcher(top_k=1).match([scenario], FILES)
+    assert result == { 'scenarioId': 's1', 'paths': ['src/components/LoginForm.tsx'] }
+
+def test_cjk_scenario_matches_expected_file():
+    scenario = { 'id': 's2', 'title': '查看订单列表', 'given': ['用户已登录'], 'when': ['打开订单页面'], 'then': ['表格显示所有订单'] }
+    [result] = ScenarioMatcher(top_k=1).match([scenario], FILES)
+    assert result['paths'] == ['src/components/OrderTable.tsx']
+
+def test_no_overlap_yields_no_paths():
+    [result] = ScenarioMatcher(min_score=0.0).match([{ 'id': 's3', 'title': 'zzz qqq' }], FILES)
+    assert result['paths'] == []
+    assert ScenarioMatcher().match([], FILES) == []
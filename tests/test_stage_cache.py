@@ -0,0 +1,49 @@
+import asyncio
+import os
+import time
+
+from coder_agent.core.stage_cache import Fallback, StageCache, is_fallback
+
+def memoize(cache, stage, inputs, value, calls):
+    async def compute():
+        calls.append(stage)
+        return value
+    return asyncio.run(cache.memoize(stage, inputs, compute))
+
+def test_memoize_hit_and_miss():
+    cache = StageCache()
+    calls = []
+    assert memoize(cache, 'plan', { 'input': 'a' }, { 'steps': [1] }, calls) == { 'steps': [1] }
+    assert memoize(cache, 'plan', { 'input': 'a' }, { 'steps': [2] }, calls) == { 'steps': [1] }
+    assert memoize(cache, 'plan', { 'input': 'b' }, { 'steps': [3] }, calls) == { 'steps': [3] }
+    assert calls == ['plan', 'plan'] and (cache.hits, cache.misses) == (1, 2)
+
+def test_fallback_results_are_not_cached():
+    cache = StageCache()
+    calls = []
+    first = memoize(cache, 'bdd', 'req', [Fallback({ 'feature_id': 'x' })], calls)
+    assert is_fallback(first) and first == [{ 'feature_id': 'x' }]
+    assert memoize(cache, 'bdd', 'req', [{ 'feature_id': 'y' }], calls) == [{ 'feature_id': 'y' }]
+    assert memoize(cache, 'bdd', 'req', [{ 'feature_id': 'z' }], calls) == [{ 'feature_id': 'y' }]
+    assert len(calls) == 2
+
+def test_disk_entries_survive_a_new_instance(tmp_path):
+    StageCache(cache_dir=str(tmp_path)).set(StageCache.key('plan', 1), { 'a': 1 })
+    assert StageCache(cache_dir=str(tmp_path)).get(StageCache.key('plan', 1)) == { 'a': 1 }
+
+def test_disk_sweep_by_age(tmp_path):
+    cache = StageCache(cache_dir=str(tmp_path), max_disk_age=3600)
+    cache.set('old', 1)
+    cache.set('new', 2)
+    os.utime(tmp_path / 'old.json', (time.time() - 7200, time.time() - 7200))
+    cache.sweep_disk()
+    assert sorted(os.listdir(tmp_path)) == ['new.json']
+
+def test_disk_sweep_by_size_removes_least_recently_used(tmp_path):
+    cache = StageCache(cache_dir=str(tmp_path))
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.set(key, 'x' * 1000)
+        os.utime(tmp_path / f'{key}.json', (time.time() - 100 + i, time.time() - 100 + i))
+    cache.max_disk_bytes = 2 * os.path.getsize(tmp_path / 'a.json')
+    cache.sweep_disk()
+    assert sorted(os.listdir(tmp_path)) == ['b.json', 'c.json']
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+from aitypes import ReActStep
+from core.step_log import StepLog, step_log_path
+
+@pytest.fixture(autouse=True)
+def step_log_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv('STEP_LOG_DIR', str(tmp_path))
+
+def fill(log, count, prefix='c'):
+    for i in range(count):
+        log.append(ReActStep(type='thought' if i % 2 else 'action', content=f'{prefix}{i}', toolName='echo' if i % 2 == 0 else None))
+
+def test_spills_at_twice_the_window(tmp_path):
+    path = str(tmp_path / 's1.jsonl')
+    log = StepLog(4, path)
+    fill(log, 7)
+    assert log.spilled == 0 and not os.path.exists(path)
+    fill(log, 1, 'x')
+    assert log.spilled == 4 and len(log) == 4
+    with open(path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 4
+
+def test_history_order_counts_and_total_after_spill(tmp_path):
+    log = StepLog(3, str(tmp_path / 's1.jsonl'))
+    fill(log, 20)
+    assert log.total == 20 and log.spilled + len(log) == 20
+    assert [s.content for s in log.history()] == [f'c{i}' for i in range(20)]
+    assert [s.content for s in log[-2:]] == ['c18', 'c19']
+    assert log.count('thought') == log.count('action') == 10
+    assert log[-1].toolName is None and log[-2].toolName is sys.intern('echo')
+
+def test_without_path_spilled_steps_are_dropped():
+    log = StepLog(2)
+    fill(log, 10)
+    assert log.total == 10 and [s.content for s in log.history()] == [s.content for s in log]
+
+def test_discard_removes_file(tmp_path):
+    path = str(tmp_path / 's1.jsonl')
+    log = StepLog(2, path)
+    fill(log, 6)
+    assert os.path.exists(path)
+    log.discard()
+    assert not os.path.exists(path) and log.path is None
+    fill(log, 6)
+    assert not os.path.exists(path)
+
+def test_paths_are_per_conversation_and_sanitized(tmp_path):
+    assert step_log_path('s1', 'conv_a') != step_log_path('s1', 'conv_b')
+    assert os.path.dirname(step_log_path('../../x', 'c/1')) == str(tmp_path)
@@ -1,8 +1,11 @@
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional
+from core.cancellation import check_cancelled, guard
+from core.recording import taped_call
 
 class ToolRegistry:
     def __init__(self):
         self.tools: Dict[str, Dict[str, Any]] = {}
+        self._description: Optional[str] = None
 
     def register_tool(self, tool: Dict[str, Any]) -> None:
         name = tool.get('name')
@@ -11,6 +14,7 @@ class ToolRegistry:
         if name in self.tools:
             raise ValueError(f'Tool "{name}" already exists')
         self.tools[name] = tool
+        self._description = None
 
     def register_tools(self, tools: List[Dict[str, Any]]) -> None:
         for t in tools:
@@ -32,6 +36,9 @@ class ToolRegistry:
         return name in self.tools
 
     async def execute_tool(self, name: str, input: Any) -> Dict[str, Any]:
+        return await taped_call('tool', name, input, lambda: self._execute_tool(name, input))
+
+    async def _execute_tool(self, name: str, input: Any) -> Dict[str, Any]:
         tool = self.get_tool(name)
         if not tool:
             return {'success': False, 'result': None, 'error': f'Tool "{name}" not found'}
@@ -41,11 +48,12 @@ class ToolRegistry:
             if p['name'] not in input:
                 return {'success': False, 'result': None, 'error': f'Required parameter "{p["name"]}" is missing'}
         execute: Callable[[Any], Any] = tool.get('execute')
+        check_cancelled()
         try:
             import asyncio
             if callable(execute):
                 if asyncio.iscoroutinefunction(execute):
-                    result = await execute(input)
+                    result = await guard(execute(input))
                 else:
                     result = execute(input)
             else:
@@ -54,7 +62,19 @@ class ToolRegistry:
         except Exception as e:
             return {'success': False, 'result': None, 'error': str(e)}
 
+    def copy(self) -> 'ToolRegistry':
+        """A registry with the same tools (and cached description) that can be extended independently."""
+        registry = ToolRegistry()
+        registry.tools = dict(self.tools)
+        registry._description = self._description
+        return registry
+
     def get_tools_description(self) -> str:
+        if self._description is None:
+            self._description = self._describe()
+        return self._description
+
+    def _describe(self) -> str:
         descriptions = []
         for tool in self.tools.values():
             params = tool.get('parameters', [])
@@ -66,7 +86,9 @@ class ToolRegistry:
         return '\n\n'.join(descriptions)
 
     def unregister_tool(self, name: str) -> bool:
+        self._description = None
         return self.tools.pop(name, None) is not None
 
     def clear(self) -> None:
         self.tools.clear()
+        self._description = None